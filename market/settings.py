@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.PrecompressedStaticMiddleware',
     'shop.middleware.StoreSubdomainMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -124,11 +125,41 @@ STATIC_URL = 'static/'
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+STATIC_MAX_AGE = 60   # сек, для файлов без хеша в имени
+
+# collectstatic: имена с хешем + манифест для {% static %}, рядом .gz/.br
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "shop.staticfiles.CompressedManifestStaticFilesStorage"},
+}
 
 BASE_DOMAIN = "store.localhost"
 SUBDOMAIN_IGNORED = ["www"]
 SUBDOMAIN_BYPASS_PREFIXES = ["api", "admin"]
 
+# Кеш резолва магазина по поддомену (shop.store_cache)
+STORE_CACHE_TTL = 300           # найденный магазин, сек
+STORE_CACHE_NEGATIVE_TTL = 30   # "магазина нет", сек
+STORE_CACHE_MAXSIZE = 1024      # записей в локальном LRU
+STORE_CACHE_ALIAS = None        # алиас из CACHES для общего уровня (None — только локальный)
+
+# Версия каталога магазина и кеш страниц витрины для анонимов (shop.catalog, shop.page_cache)
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_VERSION_TTL = 5         # сек; с общим кешем (Redis/Memcached) можно больше
+PAGE_CACHE_ALIAS = "default"     # счётчики для page_cache_stats видны только в общем кеше
+PAGE_CACHE_TIMEOUT = 600        # сек
+
+# Просмотры товаров копятся в памяти и пишутся пачкой (shop.view_counter)
+VIEW_COUNTER_ENABLED = True
+VIEW_COUNTER_FLUSH_INTERVAL = 10   # сек
+VIEW_COUNTER_FLUSH_HITS = 500      # или по стольким хитам — что раньше
+
+# Уменьшенные копии фото товаров (shop.renditions)
+IMAGE_RENDITION_FORMATS = ("webp", "jpeg")   # можно добавить "avif", если Pillow собран с ним
+IMAGE_RENDITION_WORKERS = 2
+IMAGE_RENDITION_ASYNC = True                 # False — считать сразу после коммита (тесты, отладка)
+
 CSRF_TRUSTED_ORIGINS = [
     'https://chest-flat-three-waiting.trycloudflare.com',
     'https://*.trycloudflare.com', # Чтобы работало с любой новой ссылкой туннеля
@@ -3,6 +3,7 @@ from .models import *
 from django.forms import BaseInlineFormSet
 from django.core.exceptions import ValidationError
 from django import forms
+from . import variants
 
 # =================================================================
 # СТОРЫ (МАГАЗИНЫ)
@@ -13,6 +14,7 @@ class StoreAdmin(admin.ModelAdmin):
     list_filter = ("is_active",)
     search_fields = ("name", "subdomain", "phone", "email")
     readonly_fields = ("subdomain", "created_at")
+    filter_horizontal = ("managers",)
     ordering = ("-created_at",)
 
 # =================================================================
@@ -102,6 +104,13 @@ class ProductAdmin(admin.ModelAdmin):
     # УДАЛИЛИ ProductColorInline, так как цвета теперь создаются отдельно
     inlines = (ProductVariantInline, ProductImageInline, ProductReviewInline)
 
+    def save_formset(self, request, form, formset, change):
+        # варианты — пачкой: цены/фасеты/индексы товара пересчитываются один раз
+        if formset.model is ProductVariant:
+            variants.save_formset(formset, form.instance)
+        else:
+            super().save_formset(request, form, formset, change)
+
     def save_related(self, request, form, formsets, change):
         super().save_related(request, form, formsets, change)
         product = form.instance
@@ -4,10 +4,13 @@ from . import admin_views
 urlpatterns = [
 
     path('', admin_views.dashboard, name='dashboard'),
+    path('api/sales/', admin_views.sales_api, name='sales_api'),
     path('settings/', admin_views.settings, name='settings'),
 
     path('products/', admin_views.product_list, name='product_list'),
     path('products/add/', admin_views.product_add, name='product_add'),
+    path('products/import/', admin_views.product_import, name='product_import'),
+    path('products/export/', admin_views.product_export, name='product_export'),
     path('products/<int:pk>/edit/', admin_views.product_edit, name='product_edit'),
     path('products/<int:pk>/delete/', admin_views.product_delete_api, name='product_delete_api'),
 
@@ -19,6 +22,7 @@ urlpatterns = [
 
 
     path('orders/', admin_views.order_list, name='order_list'),
+    path('orders/export/', admin_views.order_export, name='order_export'),
     path('orders/<int:pk>/', admin_views.order_detail, name='order_detail'),
     path('orders/<int:pk>/tracking/', admin_views.order_tracking, name='order_tracking'),
     path('help/', admin_views.help_center, name='help_center'),
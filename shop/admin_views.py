@@ -1,17 +1,67 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from functools import wraps
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
 from .models import *
 from .forms import *
 from django.core.paginator import Paginator
-from django.utils.dateparse import parse_datetime
-from django.http import JsonResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.db.models import Count, Min, Max, Q, OuterRef, Subquery
 from django.utils.text import slugify
-
+from . import blobs
+from . import exports
+from . import imports
+from . import keyset
+from . import orders
+from . import sales
+from . import trigram
+from . import variants
+
+def store_staff_required(view):
+    """
+    Вход сотрудника (is_staff) и право вести request.store (Store.managers
+    или суперпользователь); без магазина в поддомене — 404, чужой — 403.
+    """
+    @wraps(view)
+    @staff_member_required(login_url="signin")
+    def wrapper(request, *args, **kwargs):
+        if request.store is None:
+            raise Http404("Магазин не найден")
+        if not request.store.is_managed_by(request.user):
+            raise PermissionDenied
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@store_staff_required
 def dashboard(request):
-    return render(request, "dashboard/index.html", {"store": request.store})
+    # цифры и графики — из дневных итогов (shop.sales), а не по истории заказов
+    return render(request, "dashboard/index.html", {
+        "store": request.store,
+        "report": sales.report(request.store.id, 30),
+        "periods": sales.PERIODS,
+    })
+
+
+@store_staff_required
+def sales_api(request):
+    """
+    Графики продаж за 7/30/365 дней (?days=) — только таблицы итогов.
+    """
+    try:
+        days = int(request.GET.get("days", 30))
+    except ValueError:
+        days = 0
+    if days not in sales.PERIODS:
+        return JsonResponse({"error": "days"}, status=400)
+    return JsonResponse(sales.report(request.store.id, days))
 
 def product_list(request):
     store = request.store
@@ -40,7 +90,8 @@ def product_list(request):
         if search.isdigit():
             qs = qs.filter(id=int(search))
         else:
-            qs = qs.filter(name__icontains=search)
+            # название или SKU по подстроке — через триграммный индекс
+            qs = qs.filter(pk__in=trigram.lookup(store.id, search))
 
     first_sku_subq = ProductVariant.objects.filter(
         product_id=OuterRef("pk"),
@@ -106,7 +157,7 @@ def product_add(request):
         # Ваши логи подтвердили, что это True
         if pform.is_valid() and variants_fs.is_valid():
             try:
-                with transaction.atomic():
+                with blobs.cleanup_on_error(), transaction.atomic():
                     # 1. Подготовка товара
                     product = pform.save(commit=False)
                     product.store = request.store
@@ -154,20 +205,13 @@ def product_add(request):
                     product.is_active = True
                     product.save() # СОХРАНЯЕМ ТОВАР
 
-                    # 4. Сохранение вариантов (размеры, цвета)
-                    variants_fs.instance = product
-                    variants = variants_fs.save(commit=False)
-                    for v in variants:
-                        v.product = product
-                        v.is_active = True
-                        v.save(update_parent=False)
-
-                    # Удаление помеченных
-                    for obj in variants_fs.deleted_objects:
-                        obj.delete()
+                    # 4. Сохранение вариантов (размеры, цвета) — пачкой,
+                    #    цены товара пересчитываются один раз
+                    for form in variants_fs.forms:
+                        form.instance.is_active = True
+                    variants.save_formset(variants_fs, product)
 
-                    # 5. Цены и картинки
-                    product.update_prices()
+                    # 5. Картинки
 
                     files = request.FILES.getlist("images")
                     for i, f in enumerate(files):
@@ -240,7 +284,7 @@ def product_edit(request, pk):
                     product.brand = br
 
             product.save()
-            variants_fs.save()
+            variants.save_formset(variants_fs, product)
 
             # удалить старые фото (только этого товара!)
             delete_ids = request.POST.getlist("delete_images")
@@ -390,12 +434,9 @@ def category_show(request, pk):
         )
     )
 
-    # поиск по названию ИЛИ по sku вариантов
+    # поиск по названию ИЛИ по sku вариантов (триграммный индекс, без join и distinct)
     if search:
-        qs = qs.filter(
-            Q(name__icontains=search) |
-            Q(variants__sku__icontains=search)
-        ).distinct()
+        qs = qs.filter(pk__in=trigram.lookup(request.store.id, search))
 
     # показать sku первого активного варианта (чтобы в шаблоне было быстро)
     first_sku_subq = ProductVariant.objects.filter(
@@ -445,22 +486,180 @@ def category_delete(request, pk):
     messages.success(request, "Категория удалена.")
     return redirect("category_list")
 
+@store_staff_required
+def product_import(request):
+    """
+    Загрузка CSV/JSONL каталога: файл читается потоково (большие загрузки
+    Django держит во временном файле), запись — пачками (shop.imports).
+    """
+    report = None
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if upload is None:
+            messages.error(request, "Выберите файл")
+        else:
+            fmt = request.POST.get("format")
+            if fmt not in imports.FORMATS:
+                fmt = imports.detect_format(upload.name)
+            importer = imports.Importer(request.store, dry_run=bool(request.POST.get("dry_run")))
+            report = importer.run(imports.records(upload.file, fmt))
+            if report.error_count:
+                messages.warning(request, f"Импорт завершён с ошибками: {report.error_count}")
+            else:
+                messages.success(request, f"Импортировано товаров: {report.products}")
+
+    return render(request, "dashboard/product_import.html", {
+        "store": request.store,
+        "report": report,
+        "columns": imports.CSV_COLUMNS,
+        "formats": imports.FORMATS,
+    })
+
+
+def _export_response(request, kind, **filters):
+    """
+    Выгрузка потоком: ?format=csv|jsonl, ?gzip=1 — сжатие на лету.
+    Строки читаются из БД курсором по мере отправки, ответ целиком
+    в памяти не собирается.
+    """
+    fmt = request.GET.get("format")
+    if fmt not in exports.FORMATS:
+        fmt = "csv"
+    compress = request.GET.get("gzip") == "1"
+    content = exports.export(kind, request.store.id, fmt, compress, **filters)
+    if isinstance(request, ASGIRequest):
+        # синхронный итератор ASGI-обработчик прочитал бы целиком до отправки
+        content = exports.astream(content)
+    response = StreamingHttpResponse(content, content_type=exports.content_type(fmt, compress))
+    name = exports.filename(kind, request.store, fmt, compress)
+    response["Content-Disposition"] = f'attachment; filename="{name}"'
+    # nginx не копит ответ в буфере — первый байт уходит сразу
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@store_staff_required
+def product_export(request):
+    return _export_response(request, "catalog")
+
 # ===== ORDERS =====
+# новые сверху; индексы order_seek_status / order_seek_created
+ORDER_KEYS = [("created_at", True), ("id", True)]
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _order_filters(request):
+    status = request.GET.get("status") or ""
+    if status not in dict(Order.STATUS):
+        status = ""
+    try:
+        date_from = parse_date(request.GET.get("date_from") or "")
+        date_to = parse_date(request.GET.get("date_to") or "")
+    except ValueError:
+        date_from = date_to = None
+    return status, date_from, date_to
+
+
+@store_staff_required
 def order_list(request):
-    return render(request, "dashboard/order_list.html", {"store": request.store})
+    store = request.store
+
+    status, date_from, date_to = _order_filters(request)
+    search = (request.GET.get("q") or "").strip()
+    try:
+        per_page = int(request.GET.get("per_page", "20"))
+    except ValueError:
+        per_page = 20
+    if per_page not in (10, 20, 30):
+        per_page = 20
+
+    qs = Order.objects.filter(store=store)
+    if status:
+        qs = qs.filter(status=status)
+    if date_from:
+        qs = qs.filter(created_at__gte=_day_start(date_from))
+    if date_to:
+        qs = qs.filter(created_at__lt=_day_start(date_to + timedelta(days=1)))
+    if search:
+        cond = Q(full_name__icontains=search) | Q(phone__contains=search)
+        if search.isdigit():
+            cond |= Q(pk=int(search))
+        qs = qs.filter(cond)
+
+    # кол-во строк — подзапросом только для заказов страницы (GROUP BY по всем ломал бы seek)
+    items_count = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .order_by().values("order").annotate(n=Count("id")).values("n")
+    )
+    qs = qs.annotate(items_count=Subquery(items_count))
+
+    # вкладки — из счётчиков (OrderStatusCount), а не COUNT(*) GROUP BY status
+    counts = orders.status_counts(store.id)
+    all_count = sum(counts.values())
+    total = None
+    if not (search or date_from or date_to):
+        total = counts[status] if status else all_count
+
+    scope = "|".join([status, search, str(date_from or ""), str(date_to or ""), str(per_page)])
+    page_obj = keyset.paginate(
+        qs, ORDER_KEYS, per_page, cursor=request.GET.get("cursor"), scope=scope, total=total,
+    )
+
+    return render(request, "dashboard/order_list.html", {
+        "store": store,
+        "orders": page_obj.object_list,
+        "page_obj": page_obj,
+        "per_page": per_page,
+        "q": search,
+        "status": status,
+        "date_from": date_from,
+        "date_to": date_to,
+        "tabs": [("", "Все", all_count)] + [(key, label, counts[key]) for key, label in Order.STATUS],
+        "total": total,
+    })
 
 
+@store_staff_required
+def order_export(request):
+    # те же фильтры, что у списка (кроме поиска)
+    status, date_from, date_to = _order_filters(request)
+    return _export_response(request, "orders", status=status, date_from=date_from, date_to=date_to)
+
+
+@store_staff_required
 def order_detail(request, pk):
+    order = get_object_or_404(Order.objects.filter(store=request.store).select_related("user"), pk=pk)
+
+    if request.method == "POST":
+        status = request.POST.get("status")
+        if status not in dict(Order.STATUS):
+            messages.error(request, "Неизвестный статус")
+        elif status != order.status:
+            # через save — сигнал поправит счётчики вкладок
+            order.status = status
+            order.save(update_fields=["status"])
+            messages.success(request, "Статус заказа обновлён")
+        return redirect("order_detail", pk=order.pk)
+
     return render(request, "dashboard/order_detail.html", {
         "store": request.store,
-        "pk": pk
+        "pk": pk,
+        "order": order,
+        "items": order.items.all(),
+        "statuses": Order.STATUS,
     })
 
 
+@store_staff_required
 def order_tracking(request, pk):
+    order = get_object_or_404(Order, store=request.store, pk=pk)
     return render(request, "dashboard/order_tracking.html", {
         "store": request.store,
-        "pk": pk
+        "pk": pk,
+        "order": order,
     })
 
 def help_center(request):
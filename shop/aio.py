@@ -0,0 +1,11 @@
+async def load_user(request):
+    """
+    Пользователь для async-view.
+
+    request.user из AuthenticationMiddleware ленивый и в event loop сходить
+    в БД не может — загружаем его через request.auser() и подставляем
+    готовый объект, чтобы декораторы и шаблоны читали его без запросов.
+    """
+    user = await request.auser()
+    request.user = user
+    return user
@@ -0,0 +1,343 @@
+import copy
+import threading
+from collections import defaultdict
+
+from .models import Product, ProductVariant
+from . import catalog
+
+
+CATEGORY = "category"
+BRAND = "brand"
+GENDER = "gender"
+COLOR = "color"
+SIZE = "size"
+
+
+def popcount(bits):
+    return bits.bit_count()
+
+
+def _or(bitsets):
+    out = 0
+    for b in bitsets:
+        out |= b
+    return out
+
+
+def _to_ints(values):
+    out = set()
+    for v in values:
+        try:
+            out.add(int(v))
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+class StoreIndex:
+    """
+    Битмап-индекс товаров одного магазина.
+
+    Товар получает плотную позицию (pos), битсет — обычный int,
+    где бит pos выставлен, если товар подходит. В индекс попадают
+    только активные товары с хотя бы одним активным вариантом.
+
+    Цвет и размер хранятся парами (color_id, size) по активным вариантам,
+    чтобы сохранить семантику витрины "цвет+размер в одном варианте".
+
+    Опубликованный индекс (get_index) не меняется: запросы читают его
+    из потоков без блокировки, изменения идут в копию (clone), которая
+    затем подменяет старую под _lock.
+    """
+
+    def __init__(self, store_id, version):
+        self.store_id = store_id
+        self.version = version
+
+        self.ids = []          # pos -> product_id
+        self.pos = {}          # product_id -> pos
+        self.free = []         # освобождённые позиции
+
+        self.all = 0
+        self.category = defaultdict(int)
+        self.brand = defaultdict(int)
+        self.gender = defaultdict(int)
+        self.pairs = defaultdict(int)   # (color_id, size) -> bits
+
+        # что сейчас выставлено для товара — нужно для снятия при обновлении
+        self._rows = {}
+
+    # ---- сборка ----
+    @classmethod
+    def build(cls, store_id, version):
+        index = cls(store_id, version)
+
+        pairs = defaultdict(set)
+        for product_id, color_id, size in (
+            ProductVariant.objects
+            .filter(product__store_id=store_id, product__is_active=True, is_active=True)
+            .values_list("product_id", "color_id", "size")
+        ):
+            pairs[product_id].add((color_id, size or ""))
+
+        for product_id, category_id, brand_id, gender_id in (
+            Product.objects
+            .filter(store_id=store_id, is_active=True)
+            .values_list("id", "category_id", "brand_id", "gender_id")
+        ):
+            if product_id in pairs:
+                index._add(product_id, category_id, brand_id, gender_id, pairs[product_id])
+
+        return index
+
+    def clone(self, version):
+        """
+        Копия для изменения: свои словари/списки, битсеты (int) общие.
+        """
+        index = copy.copy(self)
+        index.version = version
+        index.ids = list(self.ids)
+        index.pos = dict(self.pos)
+        index.free = list(self.free)
+        index.category = defaultdict(int, self.category)
+        index.brand = defaultdict(int, self.brand)
+        index.gender = defaultdict(int, self.gender)
+        index.pairs = defaultdict(int, self.pairs)
+        index._rows = dict(self._rows)
+        return index
+
+    def _slot(self, product_id):
+        if product_id in self.pos:
+            return self.pos[product_id]
+        if self.free:
+            p = self.free.pop()
+            self.ids[p] = product_id
+        else:
+            p = len(self.ids)
+            self.ids.append(product_id)
+        self.pos[product_id] = p
+        return p
+
+    def _add(self, product_id, category_id, brand_id, gender_id, pairs):
+        bit = 1 << self._slot(product_id)
+        self.all |= bit
+        if category_id:
+            self.category[category_id] |= bit
+        if brand_id:
+            self.brand[brand_id] |= bit
+        if gender_id:
+            self.gender[gender_id] |= bit
+        for pair in pairs:
+            self.pairs[pair] |= bit
+        self._rows[product_id] = (category_id, brand_id, gender_id, frozenset(pairs))
+
+    def remove(self, product_id):
+        row = self._rows.pop(product_id, None)
+        if row is None:
+            return
+        p = self.pos.pop(product_id)
+        mask = ~(1 << p)
+        category_id, brand_id, gender_id, pairs = row
+
+        self.all &= mask
+        for bucket, key in ((self.category, category_id), (self.brand, brand_id), (self.gender, gender_id)):
+            if key:
+                bucket[key] &= mask
+                if not bucket[key]:
+                    del bucket[key]
+        for pair in pairs:
+            self.pairs[pair] &= mask
+            if not self.pairs[pair]:
+                del self.pairs[pair]
+
+        self.ids[p] = None
+        self.free.append(p)
+
+    def reindex(self, product_id, loaded=None):
+        """
+        Инкрементально обновить один товар: loaded — уже прочитанное
+        load_product(), иначе 2 коротких запроса здесь же.
+        """
+        self.remove(product_id)
+        row, pairs = loaded if loaded is not None else load_product(self.store_id, product_id)
+        if row and pairs:
+            self._add(product_id, *row, pairs)
+
+    # ---- запросы ----
+    def _pairs_bits(self, colors, sizes):
+        if not colors and not sizes:
+            return self.all
+        return _or(
+            bits for (color_id, size), bits in self.pairs.items()
+            if (not colors or color_id in colors) and (not sizes or size in sizes)
+        )
+
+    def bits_for(self, product_ids):
+        """
+        Битсет из списка id (например, результатов поиска).
+        """
+        bits = 0
+        for product_id in product_ids:
+            p = self.pos.get(product_id)
+            if p is not None:
+                bits |= 1 << p
+        return bits
+
+    def _base(self, filters, skip=None, within=None):
+        bits = self.all if within is None else self.all & within
+        for facet, bucket in ((CATEGORY, self.category), (BRAND, self.brand), (GENDER, self.gender)):
+            if facet != skip and filters.get(facet):
+                bits &= _or(bucket.get(v, 0) for v in filters[facet])
+        return bits
+
+    def match(self, filters, within=None):
+        """
+        Битсет товаров, подходящих под комбинацию фильтров.
+        filters: {facet: set(values)}, значения уже нормализованы (normalize).
+        within — дополнительное ограничение (битсет), например результаты поиска.
+        """
+        return self._base(filters, within=within) & self._pairs_bits(filters.get(COLOR), filters.get(SIZE))
+
+    def count(self, filters, within=None):
+        return popcount(self.match(filters, within))
+
+    def product_ids(self, bits):
+        out = []
+        while bits:
+            low = bits & -bits
+            out.append(self.ids[low.bit_length() - 1])
+            bits ^= low
+        return out
+
+    def facet_counts(self, filters, within=None):
+        """
+        Кол-во товаров для каждого значения фасета с учётом остальных
+        выбранных фильтров (выбор внутри самого фасета — OR, поэтому
+        он для своих счётчиков не учитывается).
+        """
+        colors = filters.get(COLOR)
+        sizes = filters.get(SIZE)
+        pairs_all = self._pairs_bits(colors, sizes)
+
+        counts = {}
+        for facet, bucket in ((CATEGORY, self.category), (BRAND, self.brand), (GENDER, self.gender)):
+            mask = self._base(filters, skip=facet, within=within) & pairs_all
+            counts[facet] = {k: popcount(mask & b) for k, b in bucket.items()}
+
+        base = self._base(filters, within=within)
+        by_color = defaultdict(int)
+        by_size = defaultdict(int)
+        for (color_id, size), bits in self.pairs.items():
+            if color_id and (not sizes or size in sizes):
+                by_color[color_id] |= bits
+            if size and (not colors or color_id in colors):
+                by_size[size] |= bits
+        counts[COLOR] = {k: popcount(base & b) for k, b in by_color.items()}
+        counts[SIZE] = {k: popcount(base & b) for k, b in by_size.items()}
+        return counts
+
+
+def load_product(store_id, product_id):
+    """
+    (category_id, brand_id, gender_id) и пары (color_id, size) активных
+    вариантов товара; (None, set()) — товара в индексе быть не должно.
+    """
+    row = (
+        Product.objects
+        .filter(pk=product_id, store_id=store_id, is_active=True)
+        .values_list("category_id", "brand_id", "gender_id")
+        .first()
+    )
+    if not row:
+        return None, set()
+    pairs = {
+        (color_id, size or "")
+        for color_id, size in ProductVariant.objects
+        .filter(product_id=product_id, is_active=True)
+        .values_list("color_id", "size")
+    }
+    return row, pairs
+
+
+def normalize(category=(), brand=(), gender=(), color=(), size=()):
+    """
+    Привести значения из GET к типам индекса.
+    """
+    return {
+        CATEGORY: _to_ints(category),
+        BRAND: _to_ints(brand),
+        GENDER: _to_ints(gender),
+        COLOR: _to_ints(color),
+        SIZE: {s for s in size if s},
+    }
+
+
+# ---- реестр индексов процесса ----
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(store_id):
+    """
+    Индекс магазина актуальной версии каталога.
+    Если версия сменилась (изменения из другого процесса) — пересборка.
+    """
+    version = catalog.get_version(store_id)
+    index = _indexes.get(store_id)
+    if index is not None and index.version == version:
+        return index
+
+    with _lock:
+        index = _indexes.get(store_id)
+        if index is None or index.version != version:
+            index = StoreIndex.build(store_id, version)
+            _indexes[store_id] = index
+    return index
+
+
+def product_changed(store_id, product_id, version):
+    """
+    Применить изменение одного товара (вызывается после коммита с новой
+    версией каталога). Если индекс отстал больше чем на одну версию —
+    выбрасываем его, следующий запрос пересоберёт. Товар читается до
+    _lock: под ним — только копия индекса и подмена.
+    """
+    if not product_id:
+        advance(store_id, version)
+        return
+    if store_id not in _indexes:
+        return
+    loaded = load_product(store_id, product_id)
+    with _lock:
+        index = _indexes.get(store_id)
+        if index is None:
+            return
+        if index.version != version - 1:
+            _indexes.pop(store_id, None)
+            return
+        index = index.clone(version)
+        index.reindex(product_id, loaded)
+        _indexes[store_id] = index
+
+
+def advance(store_id, version):
+    """
+    Версия каталога сдвинулась, а фильтры товаров не менялись (скидки,
+    фото): индекс тот же, меняется только версия — O(1), без копий и запросов.
+    """
+    with _lock:
+        index = _indexes.get(store_id)
+        if index is None:
+            return
+        if index.version != version - 1:
+            _indexes.pop(store_id, None)
+            return
+        # структуры можно делить со старым объектом — их никто не меняет
+        index = copy.copy(index)
+        index.version = version
+        _indexes[store_id] = index
+
+
+def drop(store_id):
+    with _lock:
+        _indexes.pop(store_id, None)
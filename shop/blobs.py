@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Blob, ProductImage, UserProfile
+from .storage import content_storage, is_blob
+
+
+# поля, файлы которых лежат в content_storage и учитываются в Blob
+FIELDS = (
+    (ProductImage, "image"),
+    (UserProfile, "avatar"),
+)
+
+
+# ссылки, взятые storage в autocommit и ещё не перешедшие к записи (см. pin)
+_local = threading.local()
+
+# имена файлов, записанных storage внутри cleanup_on_error()
+_written = ContextVar("blobs_written", default=None)
+
+
+def _pins():
+    pins = getattr(_local, "pins", None)
+    if pins is None:
+        pins = _local.pins = Counter()
+    return pins
+
+
+def _add(name, n):
+    if Blob.objects.filter(name=name).update(refcount=F("refcount") + n):
+        return
+    try:
+        with transaction.atomic():
+            Blob.objects.create(name=name, refcount=n)
+    except IntegrityError:
+        Blob.objects.filter(name=name).update(refcount=F("refcount") + n)
+
+
+def pin(name):
+    """
+    Ссылка на файл, который storage нашёл или записал под name, — берётся
+    до проверки "файл уже есть": collect() другой транзакции не удалит его,
+    пока запись не возьмёт свою (acquire). В транзакции отпускается после
+    коммита (при откате пропадает вместе с ней), в autocommit её забирает
+    первый acquire() того же имени в этом потоке.
+    """
+    _add(name, 1)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: release(name))
+    else:
+        _pins()[name] += 1
+
+
+def written(name):
+    # storage записал новый файл — запомнить для cleanup_on_error
+    names = _written.get()
+    if names is not None:
+        names.append(name)
+
+
+@contextmanager
+def cleanup_on_error():
+    """
+    Файлы, записанные storage внутри блока: если блок упал (транзакция
+    откатилась вместе с их строками Blob), удалить те, на которые так и
+    не появилось ссылок. Снаружи transaction.atomic():
+        with blobs.cleanup_on_error(), transaction.atomic(): ...
+    """
+    names = []
+    token = _written.set(names)
+    try:
+        yield
+    except BaseException:
+        for name in names:
+            collect(name)
+        raise
+    finally:
+        _written.reset(token)
+
+
+def acquire(name, n=1):
+    """
+    +n ссылок на blob (новая запись/новый файл у записи).
+    """
+    if not is_blob(name):
+        return
+    pins = _pins()
+    held = min(pins[name], n)
+    if held:
+        # ссылку storage уже взял (pin в autocommit) — она переходит записи
+        pins[name] -= held
+        if not pins[name]:
+            del pins[name]
+    if n - held:
+        _add(name, n - held)
+
+
+def release(name):
+    """
+    -1 ссылка. Файл удаляется после коммита, если ссылок не осталось.
+    """
+    if not is_blob(name):
+        return
+    Blob.objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1)
+    transaction.on_commit(lambda: collect(name))
+
+
+def collect(name):
+    """
+    Удалить файл без ссылок. Строка удаляется условно (refcount=0), файл —
+    в той же транзакции: pin()/acquire() другой транзакции ждёт её коммита
+    и затем видит, что файла нет. Строки нет вовсе (её откатили) — файл
+    тоже ничей: строка создаётся, чтобы так же занять блокировку.
+    """
+    with transaction.atomic():
+        blob, _ = Blob.objects.select_for_update().get_or_create(name=name, defaults={"refcount": 0})
+        if blob.refcount:
+            return
+        deleted, _ = Blob.objects.filter(pk=blob.pk, refcount=0).delete()
+        if deleted:
+            content_storage.delete(name)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def recount():
+    """
+    Пересчитать refcount по всем полям из FIELDS (после переноса/ремонта).
+    Возвращает имена blob'ов без ссылок (строки уже удалены).
+    """
+    counts = {}
+    for model, field in FIELDS:
+        rows = (
+            model.objects.filter(**{f"{field}__startswith": "blobs/"})
+            .order_by()
+            .values(field)
+            .annotate(n=Count("pk"))
+        )
+        for row in rows:
+            counts[row[field]] = counts.get(row[field], 0) + row["n"]
+
+    existing = dict(Blob.objects.values_list("name", "refcount"))
+    Blob.objects.bulk_create(
+        [Blob(name=name, refcount=n) for name, n in counts.items() if name not in existing],
+        batch_size=500,
+    )
+    for name, n in counts.items():
+        if name in existing and existing[name] != n:
+            Blob.objects.filter(name=name).update(refcount=n)
+
+    orphans = [name for name in existing if name not in counts]
+    Blob.objects.filter(name__in=orphans).delete()
+
+    # файлы blobs/, о которых таблица не знает, тоже сироты
+    root = content_storage.path("blobs")
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != "tmp"]
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(dirpath, filename), content_storage.location).replace(os.sep, "/")
+            if name not in counts and name not in orphans:
+                orphans.append(name)
+    return orphans
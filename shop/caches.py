@@ -0,0 +1,11 @@
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_local(cache):
+    """
+    Кеш не общий для процессов: LocMemCache (бэкенд по умолчанию, если
+    CACHES не задан) живёт внутри воркера — запись и сброс из одного
+    процесса не видны другим и manage.py-командам; DummyCache не хранит ничего.
+    """
+    return isinstance(cache, (LocMemCache, DummyCache))
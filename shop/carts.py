@@ -0,0 +1,309 @@
+from collections import Counter
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import (
+    Case, When, F, Value, Sum, Count, Window, OuterRef, Subquery, ExpressionWrapper,
+    DecimalField, IntegerField,
+)
+from django.db.models.functions import Floor
+from django.utils import timezone
+
+from .models import Cart, CartItem, Favorite, ProductVariant
+from .pricing import _window_q
+from . import catalog
+
+
+# id в одном VALUES (...)
+CHUNK = 500
+
+# что делать со строкой, которая уже есть в корзине
+ADD = "add"     # quantity = quantity + ?
+SET = "set"     # quantity = ?
+KEEP = "keep"   # не трогать
+
+ON_CONFLICT = {
+    ADD: "DO UPDATE SET quantity = shop_cartitem.quantity + excluded.quantity",
+    SET: "DO UPDATE SET quantity = excluded.quantity",
+    KEEP: "DO NOTHING",
+}
+
+CART_SQL = """
+INSERT INTO shop_cart (store_id, user_id, created_at, version) VALUES (%s, %s, %s, 0)
+ON CONFLICT (store_id, user_id) DO UPDATE SET store_id = excluded.store_id
+RETURNING id
+"""
+
+# строки корзины из пачки (variant_id, quantity) — только варианты этого магазина;
+# чужие/неактивные отсеивает сам SELECT, конфликт по uniq_variant_per_cart
+UPSERT_SQL = """
+WITH q (variant_id, quantity) AS (VALUES {values})
+INSERT INTO shop_cartitem (cart_id, variant_id, quantity)
+SELECT %s, v.id, q.quantity
+FROM q
+JOIN shop_productvariant v ON v.id = q.variant_id
+JOIN shop_product p ON p.id = v.product_id
+WHERE p.store_id = %s AND p.is_active AND v.is_active
+ON CONFLICT (cart_id, variant_id) {on_conflict}
+RETURNING variant_id
+"""
+
+
+def get_cart_id(user_id, store_id):
+    """
+    id корзины пользователя в магазине — один upsert, без get_or_create.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cur:
+        cur.execute(CART_SQL, [store_id, user_id, now])
+        return cur.fetchone()[0]
+
+
+def _normalize(items):
+    """
+    [(variant_id, quantity), ...] -> {variant_id: quantity}; повторы одного
+    варианта складываются (ON CONFLICT не может задеть строку дважды).
+    """
+    out = Counter()
+    for variant_id, quantity in items:
+        out[int(variant_id)] += int(quantity)
+    return out
+
+
+def upsert(cart_id, store_id, items, mode=ADD):
+    """
+    Записать пачку строк одним INSERT ... ON CONFLICT на каждые CHUNK вариантов.
+    Возвращает множество variant_id, которые в корзину не попали
+    (не из этого магазина / неактивны / нет такого).
+    """
+    if not items:
+        return set()
+    accepted = set()
+    pairs = list(items.items())
+    with connection.cursor() as cur:
+        for i in range(0, len(pairs), CHUNK):
+            part = pairs[i:i + CHUNK]
+            values = ", ".join(["(CAST(%s AS INTEGER), CAST(%s AS INTEGER))"] * len(part))
+            params = [x for pair in part for x in pair] + [cart_id, store_id]
+            cur.execute(UPSERT_SQL.format(values=values, on_conflict=ON_CONFLICT[mode]), params)
+            accepted.update(row[0] for row in cur.fetchall())
+    # при DO NOTHING уже лежавшие строки не возвращаются, но и не отвергнуты
+    if mode == KEEP:
+        accepted.update(
+            CartItem.objects.filter(cart_id=cart_id, variant_id__in=list(items)).values_list("variant_id", flat=True)
+        )
+    return set(items) - accepted
+
+
+def remove(cart_id, variant_ids):
+    return CartItem.objects.filter(cart_id=cart_id, variant_id__in=list(variant_ids)).delete()[0] if variant_ids else 0
+
+
+def lines(cart_id):
+    return CartItem.objects.filter(cart_id=cart_id).count()
+
+
+def _wishlist_variants(user_id, store_id):
+    """
+    {product_id: variant_id} для избранного: самый дешёвый активный вариант
+    (он же выбран по умолчанию на странице товара).
+    """
+    cheapest = (
+        ProductVariant.objects
+        .filter(product=OuterRef("product_id"), is_active=True)
+        .order_by("price", "id")
+        .values("id")[:1]
+    )
+    return dict(
+        Favorite.objects
+        .filter(user_id=user_id, store_id=store_id, product__is_active=True)
+        .annotate(variant_id=Subquery(cheapest))
+        .exclude(variant_id=None)
+        .values_list("product_id", "variant_id")
+    )
+
+
+def _summary_key(cart_id, version):
+    return f"cart:summary:{cart_id}:{version}"
+
+
+def invalidate(cart_id):
+    """
+    Новая версия корзины — в той же транзакции, что и изменение строк.
+    Версия живёт в БД, а не в кеше: сброс видят все процессы, даже
+    с локальным (LocMemCache) кешем; старые записи просто истекают.
+    """
+    Cart.objects.filter(pk=cart_id).update(version=F("version") + 1)
+
+
+@transaction.atomic
+def apply(user_id, store_id, add=(), set_quantities=(), remove_ids=(), move_wishlist=False):
+    """
+    Пачка изменений корзины одной транзакцией:
+      add            — [(variant_id, quantity)], прибавить;
+      set_quantities — [(variant_id, quantity)], выставить (0 и меньше — убрать);
+      remove_ids     — [variant_id], убрать;
+      move_wishlist  — перенести избранное (по 1 шт. самого дешёвого варианта),
+                       перенесённое из избранного удаляется.
+    Возвращает (кол-во строк в корзине, отвергнутые variant_id).
+    """
+    cart_id = get_cart_id(user_id, store_id)
+    rejected = set()
+
+    set_items = _normalize(set_quantities)
+    drop = {vid for vid, qty in set_items.items() if qty <= 0} | {int(v) for v in remove_ids}
+    set_items = Counter({vid: qty for vid, qty in set_items.items() if qty > 0})
+
+    add_items = _normalize(add)
+    if any(qty <= 0 for qty in add_items.values()):
+        raise ValueError("quantity must be positive")
+
+    rejected |= upsert(cart_id, store_id, add_items, ADD)
+    rejected |= upsert(cart_id, store_id, set_items, SET)
+    remove(cart_id, drop)
+
+    if move_wishlist:
+        moved = _wishlist_variants(user_id, store_id)
+        upsert(cart_id, store_id, Counter({vid: 1 for vid in moved.values()}), KEEP)
+        # через ORM — сигналы Favorite поправят кеш избранного
+        Favorite.objects.filter(user_id=user_id, store_id=store_id, product_id__in=list(moved)).delete()
+
+    # сырой SQL сигналов CartItem не шлёт — итоги сбрасываем сами
+    invalidate(cart_id)
+    return lines(cart_id), rejected
+
+
+def add(user_id, store_id, variant_id, quantity=1):
+    """
+    Одна строка: корзина (upsert) + строка (upsert с quantity + ?) + кол-во строк
+    в одной транзакции. Возвращает кол-во строк или None, если вариант не из магазина.
+    """
+    total, rejected = apply(user_id, store_id, add=[(variant_id, quantity)])
+    return None if rejected else total
+
+
+# ---- итоги корзины ----
+class Line(NamedTuple):
+    variant_id: int
+    quantity: int
+    price: Decimal          # за штуку, со скидкой
+    old_price: Decimal | None
+    percent: int
+    total: Decimal
+
+
+class Summary(NamedTuple):
+    lines: dict             # variant_id -> Line
+    subtotal: Decimal       # к оплате
+    discount: Decimal       # сколько сэкономлено скидками
+    items: int              # штук всего
+    count: int              # строк (бейдж в шапке)
+
+
+EMPTY = Summary({}, Decimal(0), Decimal(0), 0, 0)
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _percent(now):
+    # как pricing.percent_for: скидка товара важнее скидки категории
+    product = "variant__product__"
+    category = "variant__product__category__"
+    return Case(
+        When(_window_q(now, product, f"{product}discount_is_active"), then=F(f"{product}discount_percent")),
+        When(_window_q(now, category, f"{category}discount_active"), then=F(f"{category}discount_percent")),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def priced(cart_id, now):
+    """
+    Строки корзины с ценами и итогами одним SELECT: вариант + товар + категория
+    (LEFT JOIN), цена со скидкой — Floor, как в pricing._price; итоги —
+    оконными SUM() OVER () по тем же строкам. Колонки выбирает вызывающий
+    (values_list), join'ы — по выбранным полям.
+    """
+    final = Floor(ExpressionWrapper(
+        F("variant__price") * (Value(100) - F("percent")) / Value(100), output_field=MONEY,
+    ))
+    line_total = ExpressionWrapper(F("unit_price") * F("quantity"), output_field=MONEY)
+    saved = ExpressionWrapper((F("variant__price") - F("unit_price")) * F("quantity"), output_field=MONEY)
+    return (
+        CartItem.objects
+        .filter(cart_id=cart_id)
+        .annotate(percent=_percent(now))
+        .annotate(unit_price=final)
+        .annotate(
+            line_total=line_total,
+            line_saved=Case(When(percent__gt=0, then=saved), default=Value(Decimal(0)), output_field=MONEY),
+        )
+        .annotate(
+            subtotal=Window(Sum("line_total")),
+            discount=Window(Sum("line_saved")),
+            items=Window(Sum("quantity")),
+            count=Window(Count("id")),
+        )
+        .order_by("id")
+    )
+
+
+def _query(cart_id, now):
+    return priced(cart_id, now).values_list(
+        "variant_id", "quantity", "unit_price", "variant__price", "variant__old_price", "percent",
+        "line_total", "subtotal", "discount", "items", "count",
+    )
+
+
+CENTS = Decimal("0.01")
+
+
+def _money(value):
+    # арифметика в SQL (на SQLite — REAL) отдаёт хвосты вроде 47.9700000000000
+    return None if value is None else Decimal(value).quantize(CENTS)
+
+
+def _compute(cart_id, now=None):
+    rows = list(_query(cart_id, now or timezone.now()))
+    if not rows:
+        return EMPTY
+    lines = {}
+    for variant_id, quantity, price, base, old, percent, total, *_totals in rows:
+        lines[variant_id] = Line(
+            variant_id, quantity, _money(price), _money(base if percent else old), percent, _money(total),
+        )
+    _vid, _q, _p, _b, _o, _pc, _t, subtotal, discount, items, count = rows[0]
+    return Summary(lines, _money(subtotal), _money(discount or 0), items, count)
+
+
+def summary(cart, store_id):
+    """
+    Итоги корзины из кеша; cart — (id, version) из find_cart. Ключ записи
+    включает версию корзины (изменение строк — новый ключ), запись помнит
+    версию каталога магазина: цены/скидки поменялись (shop.catalog.bump) — пересчёт.
+    """
+    if cart is None:
+        return EMPTY
+    cart_id, cart_version = cart
+    key = _summary_key(cart_id, cart_version)
+    version = catalog.get_version(store_id)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    result = _compute(cart_id)
+    cache.set(key, (version, result), getattr(settings, "CART_SUMMARY_TTL", 600))
+    return result
+
+
+def find_cart(user_id, store_id):
+    """
+    (id, version) корзины пользователя в магазине или None — один запрос по индексу.
+    """
+    return Cart.objects.filter(user_id=user_id, store_id=store_id).values_list("id", "version").first()
+
+
+def summary_for(user_id, store_id):
+    return summary(find_cart(user_id, store_id), store_id)
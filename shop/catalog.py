@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Store
+
+
+def _cache():
+    return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+
+def _key(store_id):
+    return f"catalog:v:{store_id}"
+
+
+def get_state(store_id):
+    """
+    (версия, время последнего изменения) каталога магазина.
+    Сначала из кеша, иначе одним запросом по pk.
+    """
+    cache = _cache()
+    state = cache.get(_key(store_id))
+    if state is None:
+        row = Store.objects.filter(pk=store_id).values_list("catalog_version", "catalog_updated_at").first()
+        state = tuple(row) if row else (0, None)
+        cache.set(_key(store_id), state, getattr(settings, "CATALOG_VERSION_TTL", 5))
+    return state
+
+
+async def aget_state(store_id):
+    """
+    get_state() для async-кода.
+    """
+    cache = _cache()
+    state = await cache.aget(_key(store_id))
+    if state is None:
+        row = await Store.objects.filter(pk=store_id).values_list("catalog_version", "catalog_updated_at").afirst()
+        state = tuple(row) if row else (0, None)
+        await cache.aset(_key(store_id), state, getattr(settings, "CATALOG_VERSION_TTL", 5))
+    return state
+
+
+def get_version(store_id):
+    return get_state(store_id)[0]
+
+
+def bump(store_id, on_commit=None):
+    """
+    Увеличить версию каталога (в той же транзакции, что и само изменение).
+    Кеш сбрасывается уже после коммита; on_commit(new_version) — туда же.
+    Возвращает новую версию.
+    """
+    Store.objects.filter(pk=store_id).update(
+        catalog_version=F("catalog_version") + 1,
+        catalog_updated_at=timezone.now(),
+    )
+    version = Store.objects.filter(pk=store_id).values_list("catalog_version", flat=True).first() or 0
+
+    def _done():
+        _cache().delete(_key(store_id))
+        if on_commit:
+            on_commit(version)
+
+    transaction.on_commit(_done)
+    return version
+
+
+def bump_all():
+    """
+    Для изменений общих справочников (Gender) — сбросить версии всех магазинов.
+    """
+    Store.objects.update(catalog_version=F("catalog_version") + 1, catalog_updated_at=timezone.now())
+    store_ids = list(Store.objects.values_list("id", flat=True))
+    transaction.on_commit(lambda: _cache().delete_many([_key(i) for i in store_ids]))
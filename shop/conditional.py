@@ -0,0 +1,177 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import Product
+from . import catalog
+from . import favorites
+from .aio import load_user
+from .page_cache import normalized_query
+
+
+def _etag(*parts):
+    raw = "|".join(str(p) for p in parts)
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def _user_part(request):
+    # анонимам — одна версия страницы, авторизованным — с учётом избранного
+    if not hasattr(request, "_user_part"):
+        if not request.user.is_authenticated:
+            request._user_part = "anon"
+        else:
+            request._user_part = f"u{request.user.pk}:{favorites.version(request.user.pk, request.store.id)}"
+    return request._user_part
+
+
+async def _auser_part(request):
+    # для async-view версия избранного читается заранее, через async-кеш
+    if request.store is not None and request.user.is_authenticated:
+        version = await favorites.aversion(request.user.pk, request.store.id)
+        request._user_part = f"u{request.user.pk}:{version}"
+
+
+# ---- витрина (список) ----
+def _catalog_state(request):
+    if not hasattr(request, "_catalog_state"):
+        request._catalog_state = catalog.get_state(request.store.id)
+    return request._catalog_state
+
+
+async def listing_prepare(request, *args, **kwargs):
+    if request.store is not None:
+        request._catalog_state = await catalog.aget_state(request.store.id)
+
+
+def listing_etag(request, *args, **kwargs):
+    if request.store is None:
+        return None
+    version, _ = _catalog_state(request)
+    return _etag("shop", request.store.id, version, request.path, normalized_query(request), _user_part(request))
+
+
+def listing_last_modified(request, *args, **kwargs):
+    # авторизованным — только ETag: избранное в Last-Modified не отражено
+    if request.store is None or request.user.is_authenticated:
+        return None
+    return _catalog_state(request)[1]
+
+
+# ---- страница товара ----
+def _discount_boundary(now, active, start, end):
+    """
+    Последняя уже наступившая граница окна скидки — страница
+    "изменилась" в этот момент, даже если строки в БД не менялись.
+    """
+    if not active:
+        return None
+    passed = [t for t in (start, end) if t and t <= now]
+    return max(passed) if passed else None
+
+
+def _product_row(request, slug):
+    return (
+        Product.objects
+        .filter(slug=slug, store=request.store, is_active=True)
+        .values_list(
+            "id", "updated_at", "category__updated_at", "brand__updated_at",
+            "discount_is_active", "discount_start", "discount_end",
+            "category__discount_active", "category__discount_start", "category__discount_end",
+        )
+    )
+
+
+def _state_from_row(request, row):
+    if not row:
+        return None
+    (pk, updated, cat_updated, brand_updated,
+     p_active, p_start, p_end, c_active, c_start, c_end) = row
+    now = timezone.now()
+    stamps = [
+        updated, cat_updated, brand_updated, request.store.updated_at,
+        _discount_boundary(now, p_active, p_start, p_end),
+        _discount_boundary(now, c_active, c_start, c_end),
+    ]
+    return pk, max(t for t in stamps if t)
+
+
+def _product_state(request, slug):
+    if not hasattr(request, "_product_state"):
+        row = _product_row(request, slug).first() if request.store is not None else None
+        request._product_state = _state_from_row(request, row)
+    return request._product_state
+
+
+async def product_prepare(request, slug, *args, **kwargs):
+    row = await _product_row(request, slug).afirst() if request.store is not None else None
+    request._product_state = _state_from_row(request, row)
+
+
+def product_etag(request, slug, *args, **kwargs):
+    state = _product_state(request, slug)
+    if state is None:
+        return None
+    pk, last_modified = state
+    return _etag("product", request.store.id, pk, last_modified.isoformat(), _user_part(request))
+
+
+def product_last_modified(request, slug, *args, **kwargs):
+    state = _product_state(request, slug)
+    if state is None or request.user.is_authenticated:
+        return None
+    return state[1]
+
+
+# ---- JSON ----
+def favorite_count_etag(request, *args, **kwargs):
+    if request.store is None:
+        return None
+    return _etag("favcount", request.store.id, _user_part(request))
+
+
+def conditional_page(etag_func, last_modified_func=None, prepare=None):
+    """
+    Conditional GET для страниц витрины: валидаторы считаются до view,
+    при совпадении If-None-Match / If-Modified-Since — 304 без рендера.
+    Ответ зависит от того, кто вошёл, — отсюда Vary: Cookie и private
+    для авторизованных.
+
+    Для async-view prepare(request, ...) заранее (через async ORM) кладёт
+    в request то, что валидаторам иначе пришлось бы читать из БД;
+    версия избранного так же читается заранее (_auser_part).
+    """
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        def finish(request, response):
+            patch_vary_headers(response, ("Cookie",))
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+            else:
+                patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+            return response
+
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                await load_user(request)
+                await _auser_part(request)
+                if prepare is not None:
+                    await prepare(request, *args, **kwargs)
+                return finish(request, await conditional_view(request, *args, **kwargs))
+
+        else:
+
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                return finish(request, conditional_view(request, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
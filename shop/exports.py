@@ -0,0 +1,308 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import Order, Product, ProductImage
+from .pricing import _price
+from .imports import CSV_COLUMNS, FORMATS
+
+
+# строк на одну выборку iterator() (на PostgreSQL — FETCH серверного курсора)
+CHUNK = 2000
+
+# байт текста на кусок ответа: построчный yield — тысячи мелких write()
+BLOCK = 64 * 1024
+
+KINDS = ("catalog", "orders")
+
+# колонки каталога — как у импорта (файл загружается обратно import_catalog),
+# справа — только для чтения: импорт их пропускает
+CATALOG_COLUMNS = CSV_COLUMNS + ("product_id", "variant_id", "final_price")
+
+ORDER_COLUMNS = (
+    "order_id", "created_at", "status", "full_name", "phone", "address", "total_price",
+    "item_id", "product_name", "variant_id", "sku", "price", "quantity",
+)
+
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson; charset=utf-8"}
+
+
+class _Echo:
+    # приёмник для csv.writer: writerow() возвращает готовую строку
+    def write(self, value):
+        return value
+
+
+def _str(value):
+    return "" if value is None else str(value)
+
+
+def _flag(value):
+    return "1" if value else "0"
+
+
+# ---- каталог ----
+PRODUCT_VALUES = (
+    "id", "name", "slug", "description", "category__name", "brand__name", "gender__name",
+    "country", "material", "discount_percent", "discount_is_active", "effective_discount", "is_active",
+)
+VARIANT_VALUES = (
+    "variants__id", "variants__color__name", "variants__color__hex", "variants__size",
+    "variants__price", "variants__old_price", "variants__sku", "variants__is_active",
+)
+
+
+def _images(store_id):
+    """
+    (product_id, [имена файлов]) по возрастанию product_id — второй курсор,
+    идёт вровень с товарами (merge join в Python, без IN по id пачки).
+    """
+    rows = (
+        ProductImage.objects.filter(product__store_id=store_id)
+        .order_by("product_id", "-is_main", "sort", "id")
+        .values_list("product_id", "image")
+        .iterator(chunk_size=CHUNK)
+    )
+    for product_id, group in groupby(rows, key=itemgetter(0)):
+        yield product_id, [name for _pk, name in group]
+
+
+def catalog(store_id):
+    """
+    Товары магазина по одному: dict в формате записи JSONL импорта
+    + id и итоговые цены. Товар с вариантами — одна выборка
+    (LEFT JOIN, строка на вариант, подряд по product_id), фото — вторая;
+    в памяти только текущий товар.
+    """
+    rows = (
+        Product.objects.filter(store_id=store_id)
+        .order_by("id", "variants__id")
+        .values(*PRODUCT_VALUES, *VARIANT_VALUES)
+        .iterator(chunk_size=CHUNK)
+    )
+    images = _images(store_id)
+    pending = next(images, None)
+    factors = {}
+
+    for product_id, group in groupby(rows, key=itemgetter("id")):
+        group = list(group)
+        while pending is not None and pending[0] < product_id:
+            pending = next(images, None)
+        head = group[0]
+        # скидка без окна: импорт включает её при discount_percent > 0
+        percent = head["effective_discount"]
+        yield {
+            "id": product_id,
+            "name": head["name"],
+            "slug": head["slug"],
+            "description": head["description"],
+            "category": head["category__name"] or "",
+            "brand": head["brand__name"] or "",
+            "gender": head["gender__name"] or "",
+            "country": head["country"],
+            "material": head["material"],
+            "discount_percent": head["discount_percent"] if head["discount_is_active"] else 0,
+            "is_active": head["is_active"],
+            "images": pending[1] if pending is not None and pending[0] == product_id else [],
+            "variants": [
+                {
+                    "id": row["variants__id"],
+                    "color": row["variants__color__name"] or "",
+                    "color_hex": row["variants__color__hex"] or "",
+                    "size": row["variants__size"],
+                    "price": _str(row["variants__price"]),
+                    "old_price": _str(row["variants__old_price"]),
+                    "final_price": _str(_price(row["variants__price"], None, percent, factors).final),
+                    "sku": row["variants__sku"],
+                    "is_active": row["variants__is_active"],
+                }
+                # товар без вариантов — одна строка с NULL из LEFT JOIN
+                for row in group if row["variants__id"] is not None
+            ],
+        }
+
+
+def catalog_csv(records):
+    writer = csv.writer(_Echo())
+    # BOM — чтобы Excel открыл кириллицу; импорт читает utf-8-sig
+    yield "\ufeff" + writer.writerow(CATALOG_COLUMNS)
+    for product in records:
+        head = [
+            product["name"], product["slug"], product["description"], product["category"],
+            product["brand"], product["gender"], product["country"], product["material"],
+            product["discount_percent"], _flag(product["is_active"]),
+        ]
+        images = ";".join(product["images"])
+        # в CSV одна колонка is_active — флаг товара; флаги вариантов точно — в JSONL
+        for variant in product["variants"] or [None]:
+            if variant is None:
+                tail = ["", "", "", "", "", "", images, product["id"], "", ""]
+            else:
+                tail = [
+                    variant["color"], variant["color_hex"], variant["size"], variant["price"],
+                    variant["old_price"], variant["sku"], images,
+                    product["id"], variant["id"], variant["final_price"],
+                ]
+            yield writer.writerow(head + tail)
+
+
+# ---- заказы ----
+ORDER_VALUES = (
+    "id", "created_at", "status", "full_name", "phone", "address", "total_price",
+    "items__id", "items__product_name", "items__variant_id", "items__variant__sku",
+    "items__price", "items__quantity",
+)
+
+
+def orders(store_id, status=None, date_from=None, date_to=None):
+    """
+    Заказы магазина (старые сначала) со строками: одна выборка с LEFT JOIN,
+    заказ собирается из соседних строк.
+    """
+    qs = Order.objects.filter(store_id=store_id)
+    if status:
+        qs = qs.filter(status=status)
+    if date_from:
+        qs = qs.filter(created_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        qs = qs.filter(created_at__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+    rows = qs.order_by("created_at", "id", "items__id").values(*ORDER_VALUES).iterator(chunk_size=CHUNK)
+
+    for order_id, group in groupby(rows, key=itemgetter("id")):
+        group = list(group)
+        head = group[0]
+        yield {
+            "id": order_id,
+            "created_at": timezone.localtime(head["created_at"]).isoformat(),
+            "status": head["status"],
+            "full_name": head["full_name"],
+            "phone": head["phone"],
+            "address": head["address"],
+            "total_price": _str(head["total_price"]),
+            "items": [
+                {
+                    "id": row["items__id"],
+                    "product_name": row["items__product_name"],
+                    "variant_id": row["items__variant_id"],
+                    "sku": row["items__variant__sku"] or "",
+                    "price": _str(row["items__price"]),
+                    "quantity": row["items__quantity"],
+                }
+                for row in group if row["items__id"] is not None
+            ],
+        }
+
+
+def orders_csv(records):
+    writer = csv.writer(_Echo())
+    yield "\ufeff" + writer.writerow(ORDER_COLUMNS)
+    for order in records:
+        head = [
+            order["id"], order["created_at"], order["status"], order["full_name"],
+            order["phone"], order["address"], order["total_price"],
+        ]
+        for item in order["items"] or [None]:
+            if item is None:
+                yield writer.writerow(head + [""] * 6)
+            else:
+                yield writer.writerow(head + [
+                    item["id"], item["product_name"], _str(item["variant_id"]), item["sku"],
+                    item["price"], item["quantity"],
+                ])
+
+
+def jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+# ---- поток байт ----
+def _blocks(lines, size=BLOCK):
+    """
+    Строки -> куски ~size символов. Первая строка (заголовок CSV) уходит
+    сразу: клиент получает первый байт до первой выборки из БД.
+    """
+    parts, length = [], 0
+    lines = iter(lines)
+    for line in lines:
+        yield line
+        break
+    for line in lines:
+        parts.append(line)
+        length += len(line)
+        if length >= size:
+            yield "".join(parts)
+            parts, length = [], 0
+    if parts:
+        yield "".join(parts)
+
+
+def encode(lines, compress=False):
+    """
+    Текст -> байты; compress — gzip на лету (zlib, один поток на ответ).
+    Первый кусок сбрасывается Z_SYNC_FLUSH, иначе zlib придержал бы его в буфере.
+    """
+    if not compress:
+        for block in _blocks(lines):
+            yield block.encode()
+        return
+    packer = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    first = True
+    for block in _blocks(lines):
+        data = packer.compress(block.encode())
+        if first:
+            data += packer.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+        if data:
+            yield data
+    yield packer.flush()
+
+
+async def astream(chunks):
+    """
+    Синхронный итератор -> асинхронный для StreamingHttpResponse под ASGI:
+    каждый кусок — next() через sync_to_async, в одном потоке (курсор БД
+    живёт между вызовами). Обрыв клиента закрывает и исходный генератор.
+    """
+    chunks = iter(chunks)
+    try:
+        while True:
+            chunk = await sync_to_async(next)(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def export(kind, store_id, fmt="csv", compress=False, **filters):
+    """
+    Итератор байт выгрузки: kind — catalog / orders, fmt — csv / jsonl,
+    filters — для заказов (status, date_from, date_to). Запросы выполняются
+    лениво, по мере чтения.
+    """
+    if kind not in KINDS or fmt not in FORMATS:
+        raise ValueError(f"unknown export: {kind}/{fmt}")
+    records = catalog(store_id) if kind == "catalog" else orders(store_id, **filters)
+    if fmt == "jsonl":
+        lines = jsonl(records)
+    else:
+        lines = catalog_csv(records) if kind == "catalog" else orders_csv(records)
+    return encode(lines, compress)
+
+
+def filename(kind, store, fmt, compress=False):
+    stamp = timezone.localtime().strftime("%Y%m%d-%H%M")
+    return f"{store.subdomain or store.pk}-{kind}-{stamp}.{fmt}" + (".gz" if compress else "")
+
+
+def content_type(fmt, compress=False):
+    return "application/gzip" if compress else CONTENT_TYPES[fmt]
@@ -0,0 +1,205 @@
+from collections import defaultdict
+
+from django.db.models import Count, Exists, OuterRef
+
+from .models import (
+    Store, Category, Brand, Gender, Product, ProductColor, ProductVariant, FacetCount,
+)
+
+
+CATEGORY = FacetCount.CATEGORY
+BRAND = FacetCount.BRAND
+GENDER = FacetCount.GENDER
+COLOR = FacetCount.COLOR
+SIZE = FacetCount.SIZE
+
+ID_FACETS = (CATEGORY, BRAND, GENDER, COLOR)
+
+
+def empty_keys():
+    return defaultdict(set)
+
+
+def _active_products(store_id):
+    # товар считается, если он активен и у него есть хотя бы один активный вариант
+    return Product.objects.filter(store_id=store_id, is_active=True).filter(
+        Exists(ProductVariant.objects.filter(product=OuterRef("pk"), is_active=True))
+    )
+
+
+def product_keys(product, variants=True):
+    """
+    Ключи фасетов, которые затрагивает товар: его category/brand/gender
+    и (опционально) цвета/размеры всех его вариантов.
+    """
+    keys = empty_keys()
+    if product.category_id:
+        keys[CATEGORY].add(product.category_id)
+    if product.brand_id:
+        keys[BRAND].add(product.brand_id)
+    if product.gender_id:
+        keys[GENDER].add(product.gender_id)
+
+    if variants and product.pk:
+        for color_id, size in ProductVariant.objects.filter(product_id=product.pk).values_list("color_id", "size"):
+            if color_id:
+                keys[COLOR].add(color_id)
+            if size:
+                keys[SIZE].add(size)
+    return keys
+
+
+def merge_keys(*parts):
+    keys = empty_keys()
+    for part in parts:
+        for facet, values in (part or {}).items():
+            keys[facet].update(v for v in values if v)
+    return keys
+
+
+def _count(store_id, facet, values):
+    """
+    Пересчитать кол-во товаров для конкретных значений фасета.
+    Возвращает {value: count}.
+    """
+    if facet in (CATEGORY, BRAND, GENDER):
+        field = f"{facet}_id"
+        rows = (
+            _active_products(store_id)
+            .filter(**{f"{field}__in": values})
+            .order_by()
+            .values(field)
+            .annotate(cnt=Count("id"))
+        )
+        return {r[field]: r["cnt"] for r in rows}
+
+    field = "color_id" if facet == COLOR else "size"
+    rows = (
+        ProductVariant.objects
+        .filter(product__store_id=store_id, product__is_active=True, is_active=True)
+        .filter(**{f"{field}__in": values})
+        .order_by()
+        .values(field)
+        .annotate(cnt=Count("product_id", distinct=True))
+    )
+    return {r[field]: r["cnt"] for r in rows}
+
+
+def _labels(store_id, facet, values):
+    """
+    Подписи для строк фасета. Для category/brand — только активные
+    объекты этого магазина (неактивных в сайдбаре нет).
+    Возвращает {value: (label, hex)}.
+    """
+    if facet == CATEGORY:
+        qs = Category.objects.filter(store_id=store_id, is_active=True, id__in=values)
+        return {o.id: (o.name, "") for o in qs}
+    if facet == BRAND:
+        qs = Brand.objects.filter(store_id=store_id, is_active=True, id__in=values)
+        return {o.id: (o.name, "") for o in qs}
+    if facet == GENDER:
+        return {o.id: (o.name, "") for o in Gender.objects.filter(id__in=values)}
+    if facet == COLOR:
+        return {o.id: (o.name, o.hex) for o in ProductColor.objects.filter(id__in=values)}
+    return {v: (v, "") for v in values}
+
+
+def refresh(store_id, keys):
+    """
+    Инкрементально пересчитать только указанные строки фасетов магазина.
+
+    category/brand/gender строки живут и с нулём (сайдбар показывает
+    все активные категории/бренды и все полы), color/size — только пока
+    есть хотя бы один товар.
+    """
+    for facet, values in keys.items():
+        values = {v for v in values if v}
+        if not values:
+            continue
+
+        counts = _count(store_id, facet, values)
+        labels = _labels(store_id, facet, values)
+
+        keep_zero = facet in (CATEGORY, BRAND, GENDER)
+        drop, upsert = [], []
+        for value in values:
+            cnt = counts.get(value, 0)
+            if value not in labels or (cnt == 0 and not keep_zero):
+                drop.append(str(value))
+                continue
+            label, hex_ = labels[value]
+            upsert.append(FacetCount(
+                store_id=store_id,
+                facet=facet,
+                key=str(value),
+                obj_id=value if facet in ID_FACETS else None,
+                label=label or "",
+                hex=hex_ or "",
+                count=cnt,
+            ))
+
+        if drop:
+            FacetCount.objects.filter(store_id=store_id, facet=facet, key__in=drop).delete()
+        if upsert:
+            FacetCount.objects.bulk_create(
+                upsert,
+                update_conflicts=True,
+                unique_fields=["store", "facet", "key"],
+                update_fields=["obj_id", "label", "hex", "count"],
+            )
+
+
+def rebuild(store_id):
+    """
+    Полная пересборка фасетов магазина (команда rebuild_facets).
+    """
+    keys = empty_keys()
+    keys[CATEGORY].update(Category.objects.filter(store_id=store_id).values_list("id", flat=True))
+    keys[BRAND].update(Brand.objects.filter(store_id=store_id).values_list("id", flat=True))
+    keys[GENDER].update(Gender.objects.values_list("id", flat=True))
+
+    variants = ProductVariant.objects.filter(product__store_id=store_id)
+    keys[COLOR].update(variants.exclude(color__isnull=True).values_list("color_id", flat=True).distinct())
+    keys[SIZE].update(variants.exclude(size="").values_list("size", flat=True).distinct())
+
+    FacetCount.objects.filter(store_id=store_id).delete()
+    refresh(store_id, keys)
+
+
+def ensure_gender_rows(store_ids=None):
+    """
+    Полы общие для всех магазинов — строки с нулём создаём для каждого магазина.
+    """
+    if store_ids is None:
+        store_ids = Store.objects.values_list("id", flat=True)
+    genders = list(Gender.objects.all())
+    FacetCount.objects.bulk_create(
+        [
+            FacetCount(store_id=sid, facet=GENDER, key=str(g.id), obj_id=g.id, label=g.name, count=0)
+            for sid in store_ids for g in genders
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def sidebar(store):
+    """
+    Списки фильтров для витрины одним запросом к FacetCount.
+    Элементы — dict с ключами id/name/hex/cnt (как раньше у annotate),
+    размеры — просто строки.
+    """
+    result = {CATEGORY: [], BRAND: [], GENDER: [], COLOR: [], SIZE: []}
+
+    rows = FacetCount.objects.filter(store=store).values_list("facet", "key", "obj_id", "label", "hex", "count")
+    for facet, key, obj_id, label, hex_, count in rows:
+        if facet == SIZE:
+            result[SIZE].append(key)
+        else:
+            result[facet].append({"id": obj_id, "name": label, "hex": hex_, "cnt": count})
+
+    result[CATEGORY].sort(key=lambda r: r["name"])
+    result[BRAND].sort(key=lambda r: r["name"])
+    result[GENDER].sort(key=lambda r: r["id"])
+    result[COLOR].sort(key=lambda r: (r["name"], r["hex"]))
+    result[SIZE].sort()
+    return result
@@ -0,0 +1,144 @@
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.db import transaction
+
+from .models import Favorite
+from .caches import is_local
+
+
+def _version_key(user_id, store_id):
+    return f"fav:v:{user_id}:{store_id}"
+
+
+def _ids_key(user_id, store_id):
+    return f"fav:ids:{user_id}:{store_id}"
+
+
+def _local():
+    # cache — прокси, isinstance проверяем на самом бэкенде
+    return is_local(caches[DEFAULT_CACHE_ALIAS])
+
+
+def _ttl():
+    # локальный кеш другие воркеры не сбросят — множество там живёт недолго
+    if _local():
+        return getattr(settings, "FAVORITES_LOCAL_TTL", 5)
+    return getattr(settings, "FAVORITES_CACHE_TTL", 24 * 3600)
+
+
+def _version_ttl():
+    # в общем кеше версия бессрочная; в локальном (LocMemCache) смену версии
+    # из другого воркера здесь не увидеть — живёт недолго, как CATALOG_VERSION_TTL
+    return getattr(settings, "FAVORITES_LOCAL_TTL", 5) if _local() else None
+
+
+def version(user_id, store_id):
+    """
+    Версия избранного пользователя в магазине — для ETag страниц с "сердечками"
+    и favorite_count. Если ключ вытеснен из кеша, берём новое значение
+    (старые ETag просто перестанут совпадать) — так же и по истечении
+    короткого TTL в локальном кеше, где сброс из другого процесса не виден.
+    """
+    key = _version_key(user_id, store_id)
+    value = cache.get(key)
+    if value is None:
+        value = time.time_ns()
+        cache.add(key, value, _version_ttl())
+        value = cache.get(key, value)
+    return value
+
+
+async def aversion(user_id, store_id):
+    """
+    version() для async-кода: кеш — через aget/aadd, без блокировки цикла событий.
+    """
+    key = _version_key(user_id, store_id)
+    value = await cache.aget(key)
+    if value is None:
+        value = time.time_ns()
+        await cache.aadd(key, value, _version_ttl())
+        value = await cache.aget(key, value)
+    return value
+
+
+# ---- множество id избранных товаров (user, store) ----
+def _query(user_id, store_id):
+    return Favorite.objects.filter(user_id=user_id, store_id=store_id).values_list("product_id", flat=True)
+
+
+def ids(user_id, store_id):
+    """
+    frozenset id избранных товаров пользователя в магазине: проверка
+    "в избранном?" и количество — без запросов. При промахе — один запрос.
+    """
+    key = _ids_key(user_id, store_id)
+    value = cache.get(key)
+    if value is None:
+        value = frozenset(_query(user_id, store_id))
+        cache.set(key, value, _ttl())
+    return value
+
+
+async def aids(user_id, store_id):
+    key = _ids_key(user_id, store_id)
+    value = await cache.aget(key)
+    if value is None:
+        value = frozenset([pk async for pk in _query(user_id, store_id)])
+        await cache.aset(key, value, _ttl())
+    return value
+
+
+def count(user_id, store_id):
+    return len(ids(user_id, store_id))
+
+
+def _apply(user_id, store_id, update=None):
+    """
+    Поправить закешированное множество на месте (update(set) -> set)
+    или, без update, выбросить его; заодно новая версия для ETag.
+    Если множества в кеше нет — следующий ids() прочитает его из БД.
+    В локальном кеше множество могло отстать (запись шла через другой
+    воркер) — его не правим, а выбрасываем.
+    """
+    key = _ids_key(user_id, store_id)
+    current = cache.get(key) if update and not _local() else None
+    if current is None:
+        cache.delete(key)
+    else:
+        cache.set(key, update(current), _ttl())
+    cache.set(_version_key(user_id, store_id), time.time_ns(), _version_ttl())
+
+
+async def _aapply(user_id, store_id, update=None):
+    # _apply() через async-методы кеша
+    key = _ids_key(user_id, store_id)
+    current = await cache.aget(key) if update and not _local() else None
+    if current is None:
+        await cache.adelete(key)
+    else:
+        await cache.aset(key, update(current), _ttl())
+    await cache.aset(_version_key(user_id, store_id), time.time_ns(), _version_ttl())
+
+
+# из сигналов Favorite — после коммита транзакции
+def added(user_id, store_id, product_id):
+    transaction.on_commit(lambda: _apply(user_id, store_id, lambda current: current | {product_id}))
+
+
+def removed(user_id, store_id, product_id):
+    transaction.on_commit(lambda: _apply(user_id, store_id, lambda current: current - {product_id}))
+
+
+def invalidate(user_id, store_id):
+    transaction.on_commit(lambda: _apply(user_id, store_id))
+
+
+# из async-view: async ORM пишет в autocommit, применяем сразу
+async def aadded(user_id, store_id, product_id):
+    await _aapply(user_id, store_id, lambda current: current | {product_id})
+
+
+async def ainvalidate(user_id, store_id):
+    await _aapply(user_id, store_id)
@@ -116,4 +116,10 @@ VariantFormSet = inlineformset_factory(
     form=VariantForm,
     extra=1,
     can_delete=True
-)
\ No newline at end of file
+)
+
+class CheckoutForm(forms.Form):
+    # пустые поля заполняются из аккаунта/профиля (views.checkout)
+    full_name = forms.CharField(max_length=150)
+    phone = forms.CharField(max_length=20)
+    address = forms.CharField(required=False)
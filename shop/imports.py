@@ -0,0 +1,529 @@
+import csv
+import io
+import json
+import os
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+from django.core.files import File
+from django.db import DatabaseError, transaction
+from django.utils.text import slugify
+
+from .models import Brand, Category, Gender, Product, ProductColor, ProductImage, ProductVariant, _norm
+from .storage import content_storage
+from . import blobs
+from . import renditions
+from . import variants as variant_ops
+
+
+# товаров на транзакцию (цены/фасеты/поиск пересчитываются раз на пачку)
+CHUNK = 500
+
+# сколько ошибок держать для показа; считаются все
+MAX_ERRORS = 200
+
+# CSV: одна строка — один вариант; строки одного товара идут подряд
+# (ключ товара — slug, если задан, иначе name). Поля товара и images
+# берутся из первой строки товара, images — через ";".
+CSV_COLUMNS = (
+    "name", "slug", "description", "category", "brand", "gender", "country", "material",
+    "discount_percent", "is_active", "color", "color_hex", "size", "price", "old_price", "sku", "images",
+)
+PRODUCT_FIELDS = (
+    "name", "slug", "description", "category", "brand", "gender", "country", "material",
+    "discount_percent", "is_active", "images",
+)
+VARIANT_FIELDS = ("color", "color_hex", "size", "price", "old_price", "sku", "is_active")
+
+FORMATS = ("csv", "jsonl")
+
+# словари справочников Importer: пополняются в транзакции пачки
+LOOKUPS = ("categories", "brands", "genders", "colors_by_hex", "colors_by_name", "hexes")
+
+
+class RowError(ValueError):
+    pass
+
+
+class Report:
+    """
+    Итог импорта: счётчики и первые MAX_ERRORS ошибок (строка, текст).
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.products = 0
+        self.variants = 0
+        self.images = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, str(message)))
+
+
+# ---- чтение: генераторы записей (line, dict) ----
+def detect_format(name):
+    ext = os.path.splitext(name or "")[1].lower()
+    return "jsonl" if ext in (".jsonl", ".ndjson", ".json") else "csv"
+
+
+def read_csv(stream):
+    """
+    Строки-варианты -> записи товаров: соседние строки с одним ключом
+    собираются в один товар. В памяти — только текущий товар.
+    """
+    reader = csv.DictReader(stream)
+    current, key = None, None
+    for row in reader:
+        line = reader.line_num
+        row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        row_key = row.get("slug") or row.get("name")
+        if current is not None and row_key == key:
+            current[1]["variants"].append({f: row.get(f, "") for f in VARIANT_FIELDS})
+            continue
+        if current is not None:
+            yield current
+        key = row_key
+        record = {f: row.get(f, "") for f in PRODUCT_FIELDS}
+        record["images"] = [x.strip() for x in record["images"].split(";") if x.strip()]
+        record["variants"] = [{f: row.get(f, "") for f in VARIANT_FIELDS}]
+        current = (line, record)
+    if current is not None:
+        yield current
+
+
+def read_jsonl(stream):
+    """
+    Один товар на строку: {"name": ..., "variants": [...], "images": [...]}.
+    Битая строка отдаётся как RowError — импорт продолжается.
+    """
+    for line, text in enumerate(stream, start=1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError as e:
+            yield line, RowError(f"JSON: {e}")
+            continue
+        yield line, record if isinstance(record, dict) else RowError("ожидается объект")
+
+
+def records(stream, fmt):
+    """
+    stream — бинарный файл (загрузка/open(..., "rb")); читается построчно.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    return read_csv(text) if fmt == "csv" else read_jsonl(text)
+
+
+# ---- разбор одной записи ----
+class ParsedVariant(NamedTuple):
+    color: tuple | None      # (name, hex) — id подставляется при записи пачки
+    size: str
+    price: Decimal
+    old_price: Decimal | None
+    sku: str
+    is_active: bool
+
+
+class ParsedProduct(NamedTuple):
+    line: int
+    name: str
+    slug: str
+    fields: dict
+    category: str
+    brand: str
+    gender: str
+    images: list
+    variants: list
+
+
+def _text(value, limit, field):
+    value = "" if value is None else str(value).strip()
+    if len(value) > limit:
+        raise RowError(f"{field}: длиннее {limit} символов")
+    return value
+
+
+def _decimal(value, field, required=True):
+    if value in (None, ""):
+        if required:
+            raise RowError(f"{field}: пусто")
+        return None
+    try:
+        out = Decimal(str(value).replace(" ", "").replace(",", "."))
+    except InvalidOperation:
+        raise RowError(f"{field}: не число") from None
+    if out < 0 or out >= Decimal("1e8"):
+        raise RowError(f"{field}: вне диапазона")
+    return out.quantize(Decimal("0.01"))
+
+
+def _bool(value, default=True):
+    if value in (None, ""):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ("0", "false", "no", "нет", "n")
+
+
+def _hex(value):
+    value = (value or "").strip()
+    if not value:
+        return ""
+    value = value if value.startswith("#") else f"#{value}"
+    if len(value) != 7 or any(c not in "0123456789abcdefABCDEF" for c in value[1:]):
+        raise RowError(f"color_hex: {value}")
+    return value.upper()
+
+
+def parse(line, raw):
+    if isinstance(raw, RowError):
+        raise raw
+    name = _text(raw.get("name"), 255, "name")
+    if not name:
+        raise RowError("name: пусто")
+    try:
+        percent = int(raw.get("discount_percent") or 0)
+    except (TypeError, ValueError):
+        raise RowError("discount_percent: не число") from None
+    if not 0 <= percent <= 100:
+        raise RowError("discount_percent: 0..100")
+
+    images = raw.get("images") or []
+    if isinstance(images, str):
+        images = [x.strip() for x in images.split(";") if x.strip()]
+
+    parsed_variants = []
+    for item in raw.get("variants") or ():
+        if not isinstance(item, dict):
+            raise RowError("variants: ожидается объект")
+        color_name = _text(item.get("color"), 50, "color")
+        color_hex = _hex(item.get("color_hex"))
+        size = _text(item.get("size"), 20, "size")
+        price = _decimal(item.get("price"), "price")
+        old_price = _decimal(item.get("old_price"), "old_price", required=False)
+        if old_price is not None and old_price < price:
+            raise RowError("old_price меньше price")
+        color = (color_name, color_hex) if (color_name or color_hex) else None
+        parsed_variants.append(ParsedVariant(
+            color, size, price, old_price, _text(item.get("sku"), 64, "sku"), _bool(item.get("is_active")),
+        ))
+    if not parsed_variants:
+        raise RowError("нет вариантов")
+
+    return ParsedProduct(
+        line=line,
+        name=name,
+        slug=slugify(_text(raw.get("slug"), 255, "slug")),
+        fields={
+            "description": _text(raw.get("description"), 100000, "description"),
+            "country": _text(raw.get("country"), 100, "country"),
+            "material": _text(raw.get("material"), 100, "material"),
+            "discount_percent": percent,
+            "discount_is_active": percent > 0,
+            "is_active": _bool(raw.get("is_active")),
+        },
+        category=_text(raw.get("category"), 100, "category"),
+        brand=_text(raw.get("brand"), 100, "brand"),
+        gender=_text(raw.get("gender"), 50, "gender"),
+        images=[str(x) for x in images],
+        variants=parsed_variants,
+    )
+
+
+# ---- уникальные slug/SKU без цикла "exists() на каждую попытку" ----
+def _suffixed(base, n, max_length):
+    if n == 1:
+        return base[:max_length]
+    tail = f"-{n}"
+    return base[:max_length - len(tail)] + tail
+
+
+def allocate(bases, exists, max_length):
+    """
+    Уникальные значения для списка желаемых: base, base-2, base-3...
+    exists(candidates) -> занятые в БД (один запрос на раунд, а не на значение);
+    повторы внутри пачки разводятся в памяти.
+    """
+    out = [None] * len(bases)
+    attempt = [1] * len(bases)
+    taken = set()
+    pending = list(range(len(bases)))
+    while pending:
+        candidates = {i: _suffixed(bases[i], attempt[i], max_length) for i in pending}
+        busy = exists(set(candidates.values()))
+        retry = []
+        for i in pending:
+            value = candidates[i]
+            if value in busy or value in taken:
+                attempt[i] += 1
+                retry.append(i)
+            else:
+                taken.add(value)
+                out[i] = value
+        pending = retry
+    return out
+
+
+class Importer:
+    """
+    Потоковый импорт каталога в магазин: записи читаются генератором,
+    копятся пачками по chunk товаров, каждая пачка — одна транзакция
+    с bulk_create. Справочники (категории, бренды, пол, цвета) — словари
+    в памяти, недостающие создаются пачкой.
+
+    images — пути внутри media (уже загруженные файлы) или, если задан
+    images_dir, файлы в этой папке: они кладутся в content-addressed
+    хранилище (одинаковые файлы — один blob).
+    """
+
+    def __init__(self, store, images_dir=None, chunk=CHUNK, dry_run=False, progress=None, on_error=None):
+        self.store = store
+        self.images_dir = images_dir
+        self.chunk = chunk
+        self.dry_run = dry_run
+        self.progress = progress
+        self.on_error = on_error
+        self.report = Report()
+
+        self.categories = {n.lower(): pk for pk, n in Category.objects.filter(store=store).values_list("id", "name")}
+        self.brands = {n.lower(): pk for pk, n in Brand.objects.filter(store=store).values_list("id", "name")}
+        self.genders = {n.lower(): pk for pk, n in Gender.objects.values_list("id", "name")}
+        self.colors_by_hex, self.colors_by_name, self.hexes = {}, {}, {}
+        self._remember_colors(ProductColor.objects.order_by("id"))
+
+    def _remember_colors(self, qs):
+        for pk, name, hex_ in qs.values_list("id", "name", "hex"):
+            self.hexes[pk] = hex_
+            self.colors_by_hex.setdefault(hex_.upper(), pk)
+            if name:
+                self.colors_by_name.setdefault(name.lower(), pk)
+
+    def run(self, items):
+        batch = []
+        items, line = iter(items), 0
+        while True:
+            # декодирование и разбор CSV — внутри генератора: после такой
+            # ошибки он закрыт, файл дальше не читается, готовое — пишем
+            try:
+                line, raw = next(items)
+            except StopIteration:
+                break
+            except UnicodeDecodeError:
+                self._error(line, "файл дальше не читается: ожидается кодировка UTF-8")
+                break
+            except csv.Error as e:
+                self._error(line, f"файл дальше не читается: CSV: {e}")
+                break
+            self.report.rows += 1
+            try:
+                product = parse(line, raw)
+                self._check(product)
+            except RowError as e:
+                self._error(line, e)
+                continue
+            batch.append(product)
+            if len(batch) >= self.chunk:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.report
+
+    def _error(self, line, message):
+        self.report.error(line, message)
+        if self.on_error:
+            self.on_error(line, message)
+
+    def _check(self, product):
+        """
+        Проверки, которым нужны справочники/файлы: ошибка — на строку,
+        а не откат всей пачки.
+        """
+        seen = set()
+        for v in product.variants:
+            color = None
+            if v.color:
+                name, hex_ = v.color
+                # цвет без hex должен быть известен по названию — создать его не из чего
+                if not hex_ and name.lower() not in self.colors_by_name:
+                    raise RowError(f"color: неизвестный цвет {name!r} (укажите color_hex)")
+                color = self.colors_by_hex.get(hex_, hex_) if hex_ else self.colors_by_name[name.lower()]
+            key = (color, _norm(v.size) if v.size else "")
+            if key in seen:
+                raise RowError(f"повтор варианта: {v.color and (v.color[0] or v.color[1])} / {v.size}")
+            seen.add(key)
+        for path in product.images:
+            self._image_path(path)
+
+    def _color_id(self, color):
+        if color is None:
+            return None
+        name, hex_ = color
+        if hex_:
+            return self.colors_by_hex[hex_]
+        return self.colors_by_name[name.lower()]
+
+    # ---- запись пачки ----
+    def _flush(self, batch):
+        if self.dry_run:
+            self._count(batch, images=sum(len(p.images) for p in batch))
+            return
+        # созданные пачкой справочники откатываются вместе с ней — их id
+        # не должны остаться в словарях для следующих пачек
+        saved = {attr: dict(getattr(self, attr)) for attr in LOOKUPS}
+        try:
+            # откат пачки — её новые файлы в blobs/ удаляются
+            with blobs.cleanup_on_error(), transaction.atomic():
+                image_count = self._write(batch)
+        except (DatabaseError, OSError, RowError) as e:
+            for attr, value in saved.items():
+                setattr(self, attr, value)
+            # пачка откатилась целиком — ошибка на каждую её запись
+            for product in batch:
+                self._error(product.line, f"пачка не записана: {e}")
+            return
+        self._count(batch, image_count)
+
+    def _count(self, batch, images):
+        self.report.products += len(batch)
+        self.report.variants += sum(len(p.variants) for p in batch)
+        self.report.images += images
+        if self.progress:
+            self.progress(self.report)
+
+    def _write(self, batch):
+        self._create_lookups(batch)
+
+        slugs = allocate(
+            [p.slug or slugify(p.name) or "product" for p in batch],
+            lambda values: set(
+                Product.objects.filter(store=self.store, slug__in=values).values_list("slug", flat=True)
+            ),
+            Product._meta.get_field("slug").max_length,
+        )
+        Product.objects.bulk_create([
+            Product(
+                store=self.store, name=p.name, slug=slug,
+                category_id=self.categories.get(p.category.lower()) if p.category else None,
+                brand_id=self.brands.get(p.brand.lower()) if p.brand else None,
+                gender_id=self.genders.get(p.gender.lower()) if p.gender else None,
+                **p.fields,
+            )
+            for p, slug in zip(batch, slugs)
+        ], batch_size=CHUNK)
+        # id новых товаров — одним запросом (bulk_create не везде возвращает pk)
+        ids = dict(Product.objects.filter(store=self.store, slug__in=slugs).values_list("slug", "id"))
+
+        rows = []
+        for p, slug in zip(batch, slugs):
+            for v in p.variants:
+                rows.append((ids[slug], slug, self._color_id(v.color), v))
+
+        skus = allocate(
+            [v.sku or variant_ops.make_sku(slug, self.hexes.get(color_id), v.size) for _pid, slug, color_id, v in rows],
+            lambda values: set(
+                ProductVariant.objects.filter(product__store=self.store, sku__in=values)
+                .values_list("sku", flat=True)
+            ),
+            ProductVariant._meta.get_field("sku").max_length,
+        )
+        # цены товаров, фасеты, версия каталога, поиск, триграммы — раз на пачку
+        variant_ops.bulk_write(create=[
+            ProductVariant(
+                product_id=product_id, color_id=color_id, size=v.size, sku=sku,
+                price=v.price, old_price=v.old_price, is_active=v.is_active,
+            )
+            for (product_id, _slug, color_id, v), sku in zip(rows, skus)
+        ])
+        return self._write_images(batch, slugs, ids)
+
+    def _write_images(self, batch, slugs, ids):
+        images = []
+        for p, slug in zip(batch, slugs):
+            for sort, path in enumerate(p.images):
+                images.append(ProductImage(
+                    product_id=ids[slug], image=self._store_image(path), is_main=sort == 0, sort=sort,
+                ))
+        if not images:
+            return 0
+        ProductImage.objects.bulk_create(images, batch_size=CHUNK)
+        # bulk_create без сигналов: ссылки на blob'ы и копии — здесь
+        for name, n in Counter(img.image.name for img in images).items():
+            blobs.acquire(name, n)
+        renditions.schedule(list(
+            ProductImage.objects.filter(product_id__in=list(ids.values())).values_list("id", flat=True)
+        ))
+        return len(images)
+
+    def _image_path(self, path):
+        """
+        Локальный путь файла (images_dir) или None — имя уже внутри media.
+        """
+        if not self.images_dir:
+            if ".." in path.split("/") or not content_storage.exists(path):
+                raise RowError(f"images: нет файла в media: {path}")
+            return None
+        root = os.path.realpath(self.images_dir)
+        full = os.path.realpath(os.path.join(root, path))
+        if not full.startswith(root + os.sep) or not os.path.isfile(full):
+            raise RowError(f"images: нет файла: {path}")
+        return full
+
+    def _store_image(self, path):
+        full = self._image_path(path)
+        if full is None:
+            return path
+        with open(full, "rb") as f:
+            return content_storage.save(os.path.basename(full), File(f))
+
+    def _create_lookups(self, batch):
+        """
+        Недостающие категории/бренды/пол/цвета пачки — bulk_create,
+        slug'и выделяются заранее (как в Category.save, но одним запросом на раунд).
+        """
+        for model, names, cache in (
+            (Category, {p.category for p in batch if p.category}, self.categories),
+            (Brand, {p.brand for p in batch if p.brand}, self.brands),
+        ):
+            missing = {}
+            for name in names:
+                missing.setdefault(name.lower(), name)
+            missing = [name for key, name in missing.items() if key not in cache]
+            if not missing:
+                continue
+            default = model.__name__.lower()
+            slugs = allocate(
+                [slugify(name) or default for name in missing],
+                lambda values, model=model: set(
+                    model.objects.filter(store=self.store, slug__in=values).values_list("slug", flat=True)
+                ),
+                model._meta.get_field("slug").max_length,
+            )
+            model.objects.bulk_create([model(store=self.store, name=n, slug=s) for n, s in zip(missing, slugs)])
+            for pk, name in model.objects.filter(store=self.store, slug__in=slugs).values_list("id", "name"):
+                cache[name.lower()] = pk
+
+        genders = {}
+        for p in batch:
+            if p.gender and p.gender.lower() not in self.genders:
+                genders.setdefault(p.gender.lower(), p.gender)
+        if genders:
+            Gender.objects.bulk_create([Gender(name=n) for n in genders.values()], ignore_conflicts=True)
+            for pk, name in Gender.objects.filter(name__in=list(genders.values())).values_list("id", "name"):
+                self.genders[name.lower()] = pk
+
+        colors = {}
+        for p in batch:
+            for v in p.variants:
+                if v.color and v.color[1] and v.color[1] not in self.colors_by_hex:
+                    colors.setdefault(v.color[1], v.color[0])
+        if colors:
+            ProductColor.objects.bulk_create([ProductColor(name=n, hex=h) for h, n in colors.items()])
+            self._remember_colors(ProductColor.objects.filter(hex__in=list(colors)).order_by("id"))
@@ -0,0 +1,195 @@
+from django.core import signing
+from django.db.models import Q
+
+
+CURSOR_SALT = "shop.keyset"
+LAST = "last"
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации. Повторяет то, что шаблону нужно
+    от django Page: object_list, number, has_next/has_previous,
+    плюс курсоры соседних страниц.
+    """
+
+    def __init__(self, object_list, number, has_next, has_previous,
+                 next_cursor=None, prev_cursor=None, num_pages=None):
+        self.object_list = object_list
+        self.number = number
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.num_pages = num_pages
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    @property
+    def next_page_number(self):
+        return self.number + 1 if self.number else None
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1 if self.number else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(data):
+    return signing.dumps(data, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(raw):
+    if not raw:
+        return None
+    if raw == LAST:
+        return {"d": LAST}
+    try:
+        return signing.loads(raw, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None
+
+
+def _row_values(obj, keys):
+    out = []
+    for name, _ in keys:
+        value = getattr(obj, name)
+        out.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+    return out
+
+
+def _parse_values(model, keys, raw_values):
+    try:
+        return [
+            model._meta.get_field(name).to_python(raw)
+            for (name, _), raw in zip(keys, raw_values, strict=True)
+        ]
+    except Exception:
+        return None
+
+
+def _seek(keys, values, forward):
+    """
+    (k1, k2, ...) строго после/до values с учётом направления каждого ключа:
+      k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...
+    """
+    q = Q()
+    for i, (name, desc) in enumerate(keys):
+        op = "lt" if desc == forward else "gt"
+        cond = Q(**{f"{name}__{op}": values[i]})
+        for j in range(i):
+            cond &= Q(**{keys[j][0]: values[j]})
+        q |= cond
+    return q
+
+
+def _order(keys, reverse=False):
+    return [("-" if desc != reverse else "") + name for name, desc in keys]
+
+
+def paginate(qs, keys, per_page, cursor=None, scope="", total=None):
+    """
+    Keyset (seek) пагинация.
+
+    keys — ключи сортировки [(field, desc), ...], последним должен быть
+    уникальный тай-брейкер (id). scope — что определяет выдачу (сортировка),
+    чужой курсор игнорируется. total (если известен) нужен только для
+    номера последней страницы.
+
+    Каждая страница — один запрос LIMIT per_page+1 по индексу, без OFFSET
+    и без COUNT(*).
+    """
+    num_pages = max(1, -(-total // per_page)) if total is not None else None
+    data = decode_cursor(cursor)
+    if data and data.get("d") != LAST and data.get("s") != scope:
+        data = None
+
+    values = None
+    if data and data.get("d") in ("next", "prev"):
+        values = _parse_values(qs.model, keys, data.get("v") or [])
+        if values is None:
+            data = None
+
+    forward = not data or data["d"] == "next"
+    last = bool(data) and data["d"] == LAST
+
+    if values is not None:
+        qs = qs.filter(_seek(keys, values, forward))
+    qs = qs.order_by(*_order(keys, reverse=not forward or last))
+
+    # последняя страница при известном total — того же размера, что и при листании вперёд
+    limit = per_page
+    if last and total:
+        limit = total - (num_pages - 1) * per_page
+
+    rows = list(qs[: limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if forward and not last:
+        number = data.get("n", 2) if data else 1
+        has_next, has_previous = has_more, bool(data)
+    else:
+        rows.reverse()
+        if last:
+            number = num_pages
+            has_next, has_previous = False, has_more
+        else:
+            number = data.get("n", 1)
+            has_next, has_previous = True, has_more
+        if not has_previous:
+            number = 1
+
+    page = KeysetPage(rows, number, has_next, has_previous, num_pages=num_pages)
+
+    if rows and has_next:
+        page.next_cursor = encode_cursor({
+            "s": scope, "d": "next", "v": _row_values(rows[-1], keys),
+            "n": number + 1 if number else None,
+        })
+    if rows and has_previous:
+        page.prev_cursor = encode_cursor({
+            "s": scope, "d": "prev", "v": _row_values(rows[0], keys),
+            "n": number - 1 if number else None,
+        })
+    return page
+
+
+def paginate_ids(ids, per_page, fetch, cursor=None, scope=""):
+    """
+    Пагинация готового ранжированного списка id (выдача поиска по релевантности):
+    список уже в памяти, курсор хранит смещение в нём. fetch(ids) -> объекты
+    в том же порядке.
+    """
+    data = decode_cursor(cursor)
+    offset = 0
+    if data and data.get("s") == scope and data.get("d") == "off":
+        offset = max(0, int(data.get("o") or 0))
+
+    total = len(ids)
+    num_pages = max(1, -(-total // per_page))
+    if data and data.get("d") == LAST:
+        offset = (num_pages - 1) * per_page
+    offset = min(offset, (num_pages - 1) * per_page)
+
+    page = KeysetPage(
+        fetch(ids[offset:offset + per_page]),
+        offset // per_page + 1,
+        offset + per_page < total,
+        offset > 0,
+        num_pages=num_pages,
+    )
+    if page.has_next_page:
+        page.next_cursor = encode_cursor({"s": scope, "d": "off", "o": offset + per_page})
+    if page.has_previous_page:
+        page.prev_cursor = encode_cursor({"s": scope, "d": "off", "o": offset - per_page})
+    return page
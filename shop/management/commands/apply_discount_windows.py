@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import pricing
+from shop import catalog
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитать цены со скидкой у товаров, чьё окно скидки (товара или категории) "
+        "открылось/закрылось. Запускать по расписанию (cron) или с --every"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--every", type=int, help="Работать постоянно, проверять раз в N секунд")
+        parser.add_argument("--all", action="store_true", help="Пересчитать все товары (после миграции/импорта)")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            with transaction.atomic():
+                n = pricing.recompute(Product.objects.all())
+                catalog.bump_all()
+            self.stdout.write(self.style.SUCCESS(f"Пересчитано товаров: {n}"))
+            return
+
+        while True:
+            affected = pricing.apply_windows()
+            for store_id, n in affected.items():
+                self.stdout.write(f"Магазин {store_id}: пересчитано товаров {n}")
+            if not options["every"]:
+                break
+            time.sleep(options["every"])
+
+        if not options["every"]:
+            self.stdout.write(self.style.SUCCESS("Готово"))
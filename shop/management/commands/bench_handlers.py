@@ -0,0 +1,225 @@
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from shop.models import Product, ProductVariant, Store
+
+# пользователь POST-замеров, если --user не задан
+BENCH_USER = "bench"
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочное сравнение WSGI и ASGI на одних и тех же view: запросы "
+        "гоняются прямо через WSGIHandler (пул потоков) и ASGIHandler (event loop), "
+        "без сети — видно разницу стека обработки, а не веб-сервера"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", help="Поддомен магазина (по умолчанию — первый активный)")
+        parser.add_argument("--path", action="append", dest="paths",
+                            help="GET-путь (можно несколько); по умолчанию витрина, товар и favorite-count")
+        parser.add_argument("--post", action="append", dest="posts",
+                            help="POST-путь, тело формы — после '?' (можно несколько); по умолчанию "
+                                 "favorite/toggle и cart/add с первым товаром")
+        parser.add_argument("--requests", type=int, default=2000, help="Запросов на каждый путь и режим")
+        parser.add_argument("--concurrency", type=int, default=64, help="Одновременных запросов")
+        parser.add_argument("--user", help="Логин пользователя — запросы пойдут с его сессией "
+                                           f"(POST без него — от пользователя {BENCH_USER!r}, создаётся)")
+        parser.add_argument("--only", choices=("wsgi", "asgi"), help="Только один режим")
+
+    def handle(self, *args, **options):
+        store = Store.objects.filter(is_active=True)
+        store = store.filter(subdomain=options["store"]) if options["store"] else store.order_by("id")
+        store = store.first()
+        if store is None:
+            raise CommandError("Нет магазина")
+        self.host = f"{store.subdomain}.{settings.BASE_DOMAIN}"
+
+        paths, posts = options["paths"], options["posts"]
+        if not paths and not posts:
+            paths = ["/shop/", "/favorite-count/"]
+            product = Product.objects.filter(store=store, is_active=True).values_list("id", "slug").first()
+            if product:
+                paths.insert(1, f"/product/{product[1]}/")
+                posts = [f"/favorite/toggle/?product_id={product[0]}"]
+                variant = ProductVariant.objects.filter(product_id=product[0]).values_list("id", flat=True).first()
+                if variant:
+                    posts.append(f"/cart/add/?variant_id={variant}&quantity=1")
+        posts = posts or []
+
+        user = None
+        if options["user"]:
+            user = get_user_model().objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"Нет пользователя {options['user']}")
+        elif posts:
+            user, created = get_user_model().objects.get_or_create(username=BENCH_USER)
+            if created:
+                user.set_unusable_password()
+                user.save(update_fields=["password"])
+        session = ""
+        if user is not None:
+            client = Client()
+            client.force_login(user)
+            session = "; ".join(f"{m.key}={m.value}" for m in client.cookies.values())
+        # POST идут через CsrfViewMiddleware: cookie и заголовок с одним секретом
+        self.csrf = get_random_string(32)
+        post_cookie = f"{session}; {settings.CSRF_COOKIE_NAME}={self.csrf}".lstrip("; ")
+
+        # (метод, путь, query, тело, cookie); GET с сессией — только при --user
+        targets = []
+        for path in paths:
+            path, _, query = path.partition("?")
+            targets.append(("GET", path, query, "", session if options["user"] else ""))
+        for path in posts:
+            path, _, body = path.partition("?")
+            targets.append(("POST", path, "", body, post_cookie))
+
+        modes = [options["only"]] if options["only"] else ["wsgi", "asgi"]
+        total, concurrency = options["requests"], max(1, options["concurrency"])
+
+        self.stdout.write(f"{self.host}, {total} запросов, {concurrency} одновременно")
+        self.stdout.write(f"{'path':<32} {'mode':<5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for target in targets:
+            label = f"{target[0]} {target[1]}" if target[0] != "GET" else target[1]
+            for mode in modes:
+                run = self.run_wsgi if mode == "wsgi" else self.run_asgi
+                run(target, min(total, 50), concurrency)   # прогрев: кеши, соединения
+                elapsed, latencies, errors = run(target, total, concurrency)
+                self.stdout.write(
+                    f"{label:<32} {mode:<5} {total / elapsed:>9.0f} "
+                    f"{_percentile(latencies, 50) * 1000:>8.1f} {_percentile(latencies, 99) * 1000:>8.1f} "
+                    f"{errors:>7}"
+                )
+
+    # ---- WSGI: как gunicorn с потоками ----
+    def run_wsgi(self, target, total, concurrency):
+        handler = WSGIHandler()
+        method, path, query, body, cookie = target
+        body = body.encode()
+
+        def one(_):
+            environ = {
+                "REQUEST_METHOD": method,
+                "PATH_INFO": path,
+                "QUERY_STRING": query,
+                "SERVER_NAME": self.host,
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": self.host,
+                "HTTP_ACCEPT_ENCODING": "gzip",
+                "wsgi.version": (1, 0),
+                "wsgi.url_scheme": "http",
+                "wsgi.input": io.BytesIO(body),
+                "wsgi.errors": sys.stderr,
+                "wsgi.multithread": True,
+                "wsgi.multiprocess": False,
+                "wsgi.run_once": False,
+            }
+            if cookie:
+                environ["HTTP_COOKIE"] = cookie
+            if method == "POST":
+                environ["CONTENT_TYPE"] = "application/x-www-form-urlencoded"
+                environ["CONTENT_LENGTH"] = str(len(body))
+                environ[settings.CSRF_HEADER_NAME] = self.csrf
+            status = []
+            start = time.perf_counter()
+            result = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+            try:
+                for _chunk in result:
+                    pass
+            finally:
+                # close() -> request_finished -> закрытие соединений с БД
+                result.close()
+            return time.perf_counter() - start, int(status[0].split()[0]) >= 400
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(total)))
+        elapsed = time.perf_counter() - started
+        return elapsed, [r[0] for r in results], sum(r[1] for r in results)
+
+    # ---- ASGI: как uvicorn/daphne, один event loop ----
+    def run_asgi(self, target, total, concurrency):
+        handler = ASGIHandler()
+        method, path, query, body, cookie = target
+        body = body.encode()
+        headers = [(b"host", self.host.encode()), (b"accept-encoding", b"gzip")]
+        if cookie:
+            headers.append((b"cookie", cookie.encode()))
+        if method == "POST":
+            # HTTP_X_CSRFTOKEN -> x-csrftoken
+            csrf_header = settings.CSRF_HEADER_NAME.removeprefix("HTTP_").replace("_", "-").lower()
+            headers += [
+                (b"content-type", b"application/x-www-form-urlencoded"),
+                (b"content-length", str(len(body)).encode()),
+                (csrf_header.encode(), self.csrf.encode()),
+            ]
+
+        async def one():
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": method,
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": query.encode(),
+                "headers": headers,
+                "server": (self.host, 80),
+                "client": ("127.0.0.1", 0),
+            }
+            status, done = [], asyncio.Event()
+            messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # тело отдано — дальше клиент "висит" до конца ответа
+                await done.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+                elif not message.get("more_body"):
+                    done.set()
+
+            start = time.perf_counter()
+            await handler(scope, receive, send)
+            return time.perf_counter() - start, status[0] >= 400
+
+        async def worker(queue, out):
+            while queue:
+                queue.pop()
+                out.append(await one())
+
+        async def main():
+            queue, out = list(range(total)), []
+            await asyncio.gather(*(worker(queue, out) for _ in range(concurrency)))
+            return out
+
+        started = time.perf_counter()
+        results = asyncio.run(main())
+        elapsed = time.perf_counter() - started
+        return elapsed, [r[0] for r in results], sum(r[1] for r in results)
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from shop import renditions
+from shop.models import ProductImage
+
+
+def _render(image_id):
+    close_old_connections()
+    try:
+        return image_id, renditions.render(image_id), None
+    except Exception as e:
+        return image_id, 0, e
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Сгенерировать уменьшенные копии (thumb/card/zoom, webp+jpeg) для фото товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, help="ID магазина (по умолчанию — все)")
+        parser.add_argument("--all", action="store_true", help="Пересоздать и уже готовые")
+        parser.add_argument("--workers", type=int, default=4, help="Параллельных потоков (Pillow отпускает GIL)")
+
+    def handle(self, *args, **options):
+        qs = ProductImage.objects.all()
+        if options["store"]:
+            qs = qs.filter(product__store_id=options["store"])
+        if not options["all"]:
+            qs = qs.filter(renditions_ready=False)
+        ids = list(qs.values_list("id", flat=True))
+
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            for future in as_completed([pool.submit(_render, i) for i in ids]):
+                image_id, files, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f"Фото {image_id}: {error}")
+                else:
+                    done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Готово: {done}, ошибок: {failed}, файлов на фото: {len(renditions.WIDTHS) * len(renditions.enabled_formats())}"))
@@ -0,0 +1,112 @@
+import os
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import blobs
+from shop.storage import BLOB_PREFIX, blob_name, content_storage, is_blob
+
+
+# служебные каталоги media, которые не трогаем при поиске дублей
+SKIP_DIRS = {BLOB_PREFIX, "renditions"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Перенести фото товаров и аватары в content-addressed хранилище (blobs/), "
+        "пересчитать ссылки и убрать дубли в остальном media"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет сделано")
+        parser.add_argument("--no-link", action="store_true",
+                            help="Не заменять дубли вне blobs/ жёсткими ссылками")
+
+    def handle(self, *args, **options):
+        dry = options["dry_run"]
+        self.saved = 0
+
+        self.migrate_fields(dry)
+        if not dry:
+            with transaction.atomic():
+                orphans = blobs.recount()
+            for name in orphans:
+                content_storage.delete(name)
+            self.stdout.write(f"Удалено blob'ов без ссылок: {len(orphans)}")
+        if not options["no_link"]:
+            self.link_duplicates(dry)
+
+        self.stdout.write(self.style.SUCCESS(f"Освобождено: {self.saved / 1024 / 1024:.1f} МБ"))
+
+    # ---- 1. файлы, на которые ссылаются поля ----
+    def migrate_fields(self, dry):
+        names = set()
+        for model, field in blobs.FIELDS:
+            names.update(
+                n for n in model.objects.exclude(**{field: ""}).exclude(**{field: None})
+                .values_list(field, flat=True).distinct()
+                if not is_blob(n)
+            )
+
+        moved = {}
+        for name in sorted(names):
+            path = content_storage.path(name)
+            if not os.path.exists(path):
+                self.stderr.write(f"Нет файла: {name}")
+                continue
+            target = blob_name(blobs.file_digest(path), os.path.splitext(name)[1])
+            moved[name] = target
+            if dry:
+                continue
+            target_path = content_storage.path(target)
+            if os.path.exists(target_path):
+                self.saved += os.path.getsize(path)
+                os.unlink(path)
+            else:
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                os.replace(path, target_path)
+
+        unique = len(set(moved.values()))
+        self.stdout.write(f"Файлов в полях: {len(moved)}, уникальных: {unique}")
+        if dry or not moved:
+            return
+
+        with transaction.atomic():
+            for model, field in blobs.FIELDS:
+                for old, new in moved.items():
+                    model.objects.filter(**{field: old}).update(**{field: new})
+
+    # ---- 2. остальные каталоги media: одинаковые файлы -> жёсткие ссылки ----
+    def link_duplicates(self, dry):
+        root = content_storage.location
+        by_size = defaultdict(list)
+        for dirpath, dirnames, filenames in os.walk(root):
+            if dirpath == root:
+                dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if not os.path.islink(path):
+                    by_size[os.path.getsize(path)].append(path)
+
+        groups = 0
+        for size, paths in by_size.items():
+            if len(paths) < 2:
+                continue
+            by_digest = defaultdict(list)
+            for path in paths:
+                by_digest[blobs.file_digest(path)].append(path)
+            for same in by_digest.values():
+                first, rest = same[0], [p for p in same[1:] if not os.path.samefile(p, same[0])]
+                if not rest:
+                    continue
+                groups += 1
+                self.saved += size * len(rest)
+                if dry:
+                    continue
+                for path in rest:
+                    tmp = path + ".dedupe"
+                    os.link(first, tmp)
+                    os.replace(tmp, path)
+
+        self.stdout.write(f"Групп одинаковых файлов вне {BLOB_PREFIX}/: {groups}")
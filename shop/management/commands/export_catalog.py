@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Store
+from shop import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгрузка товаров с вариантами, фото и ценами в CSV/JSONL (потоково). "
+        "CSV загружается обратно через import_catalog."
+    )
+    kind = "catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", required=True, help="ID или поддомен магазина")
+        parser.add_argument("--format", choices=exports.FORMATS, default="csv")
+        parser.add_argument("--gzip", action="store_true", help="Сжимать на лету")
+        parser.add_argument("-o", "--output", default="-", help="Файл или - (stdout)")
+
+    def filters(self, options):
+        return {}
+
+    def handle(self, *args, **options):
+        ref = options["store"]
+        store = Store.objects.filter(**{"pk" if ref.isdigit() else "subdomain": ref}).first()
+        if store is None:
+            raise CommandError(f"Магазин не найден: {ref}")
+
+        chunks = exports.export(
+            self.kind, store.id, options["format"], options["gzip"], **self.filters(options),
+        )
+        path = options["output"]
+        out = sys.stdout.buffer if path == "-" else open(path, "wb")
+        size = 0
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                size += len(chunk)
+            out.flush()
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        if path != "-":
+            self.stderr.write(self.style.SUCCESS(f"Готово: {path}, {size} байт"))
@@ -0,0 +1,28 @@
+from django.core.management.base import CommandError
+from django.utils.dateparse import parse_date
+
+from shop.models import Order
+from shop.management.commands.export_catalog import Command as ExportCommand
+
+
+class Command(ExportCommand):
+    help = "Выгрузка заказов со строками в CSV/JSONL (потоково, старые сначала)."
+    kind = "orders"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--status", choices=[key for key, _label in Order.STATUS])
+        parser.add_argument("--from", dest="date_from", help="С даты (ГГГГ-ММ-ДД)")
+        parser.add_argument("--to", dest="date_to", help="По дату включительно")
+
+    def filters(self, options):
+        dates = {}
+        for key in ("date_from", "date_to"):
+            value = options[key]
+            try:
+                dates[key] = parse_date(value) if value else None
+            except ValueError:
+                dates[key] = None
+            if value and dates[key] is None:
+                raise CommandError(f"Неверная дата: {value}")
+        return {"status": options["status"], **dates}
@@ -0,0 +1,61 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Store
+from shop import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Импорт товаров с вариантами и фото из CSV/JSONL (потоково, пачками). "
+        "CSV: строка на вариант, колонки " + ", ".join(imports.CSV_COLUMNS)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл CSV/JSONL или - (stdin)")
+        parser.add_argument("--store", required=True, help="ID или поддомен магазина")
+        parser.add_argument("--format", choices=imports.FORMATS, help="По умолчанию — по расширению файла")
+        parser.add_argument("--images-dir", help="Папка с файлами из колонки images (иначе — пути внутри media)")
+        parser.add_argument("--chunk", type=int, default=imports.CHUNK, help="Товаров на транзакцию")
+        parser.add_argument("--dry-run", action="store_true", help="Только проверить файл, ничего не писать")
+
+    def handle(self, *args, **options):
+        ref = options["store"]
+        store = Store.objects.filter(**{"pk" if ref.isdigit() else "subdomain": ref}).first()
+        if store is None:
+            raise CommandError(f"Магазин не найден: {ref}")
+
+        path = options["path"]
+        fmt = options["format"] or imports.detect_format(path)
+
+        def progress(report):
+            self.stdout.write(
+                f"строк: {report.rows}, товаров: {report.products}, "
+                f"вариантов: {report.variants}, ошибок: {report.error_count}"
+            )
+
+        def error(line, message):
+            # ошибки строк — сразу, по мере чтения
+            self.stderr.write(f"строка {line}: {message}")
+
+        importer = imports.Importer(
+            store, images_dir=options["images_dir"], chunk=max(1, options["chunk"]),
+            dry_run=options["dry_run"], progress=progress, on_error=error,
+        )
+
+        try:
+            stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        except OSError as e:
+            raise CommandError(f"Не открыть файл {path}: {e.strerror}")
+        try:
+            report = importer.run(imports.records(stream, fmt))
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+
+        style = self.style.SUCCESS if not report.error_count else self.style.WARNING
+        self.stdout.write(style(
+            f"Готово: товаров {report.products}, вариантов {report.variants}, фото {report.images}, "
+            f"ошибок {report.error_count}" + (" (dry run)" if options["dry_run"] else "")
+        ))
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import page_cache
+
+
+class Command(BaseCommand):
+    help = "Статистика кеша страниц витрины (попадания/промахи)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Обнулить счётчики")
+
+    def handle(self, *args, **options):
+        if not page_cache.observable():
+            alias = getattr(settings, "PAGE_CACHE_ALIAS", "default")
+            raise CommandError(
+                f"Кеш '{alias}' локален для процесса (LocMemCache/DummyCache): счётчики "
+                "серверных воркеров отсюда не видны. Укажите в PAGE_CACHE_ALIAS общий кеш "
+                "(Redis, Memcached, база данных)."
+            )
+
+        s = page_cache.stats()
+        self.stdout.write(f"hits: {s['hits']}  misses: {s['misses']}  hit rate: {s['hit_rate']:.1%}")
+
+        if options["reset"]:
+            page_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Счётчики обнулены"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import Store
+from shop import facets
+
+
+class Command(BaseCommand):
+    help = "Пересобрать счётчики фильтров витрины (FacetCount)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, help="ID магазина (по умолчанию — все)")
+
+    def handle(self, *args, **options):
+        stores = Store.objects.all()
+        if options["store"]:
+            stores = stores.filter(pk=options["store"])
+
+        for store in stores:
+            with transaction.atomic():
+                facets.rebuild(store.pk)
+            self.stdout.write(f"{store.subdomain}: ok")
+
+        self.stdout.write(self.style.SUCCESS("Фильтры пересобраны"))
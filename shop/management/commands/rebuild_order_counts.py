@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.models import Store
+from shop import orders
+
+
+class Command(BaseCommand):
+    help = "Пересчитать счётчики заказов по статусам (OrderStatusCount)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, help="ID магазина (по умолчанию — все)")
+
+    def handle(self, *args, **options):
+        stores = Store.objects.all()
+        if options["store"]:
+            stores = stores.filter(pk=options["store"])
+
+        for store in stores:
+            with transaction.atomic():
+                counts = orders.rebuild_status_counts(store.pk)
+            self.stdout.write(f"{store.subdomain}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+        self.stdout.write(self.style.SUCCESS("Счётчики заказов пересчитаны"))
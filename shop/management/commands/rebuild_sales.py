@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from shop.models import Store
+from shop import sales
+
+
+class Command(BaseCommand):
+    help = "Пересобрать дневные итоги продаж (DailySales, DailyProductSales) из заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, help="ID магазина (по умолчанию — все)")
+        parser.add_argument("--since", help="Только с этой даты (YYYY-MM-DD), раньше — не трогать")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = parse_date(options["since"])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError("--since: ожидается дата YYYY-MM-DD")
+
+        stores = Store.objects.all()
+        if options["store"]:
+            stores = stores.filter(pk=options["store"])
+
+        for store in stores:
+            with transaction.atomic():
+                days = sales.rebuild(store.pk, since=since)
+            self.stdout.write(f"{store.subdomain}: дней с продажами — {days}")
+
+        self.stdout.write(self.style.SUCCESS("Итоги продаж пересобраны"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = "Пересобрать полнотекстовый индекс товаров (FTS5)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, help="ID магазина (по умолчанию — все)")
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stdout.write(self.style.WARNING("FTS5 доступен только на sqlite — пропускаем"))
+            return
+
+        with transaction.atomic():
+            search.rebuild(options["store"])
+
+        self.stdout.write(self.style.SUCCESS("Поисковый индекс пересобран"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import trigram
+
+
+class Command(BaseCommand):
+    help = "Пересобрать триграммный индекс товаров (поиск в дашборде)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, help="ID магазина (по умолчанию — все)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            trigram.rebuild(options["store"])
+
+        self.stdout.write(self.style.SUCCESS("Триграммы пересобраны"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop import ratings
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Полностью пересчитать рейтинг товаров (сумма, кол-во, средняя, гистограмма) по отзывам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--store", type=int, help="ID магазина (по умолчанию — все)")
+
+    def handle(self, *args, **options):
+        product_ids = None
+        if options["store"]:
+            product_ids = list(Product.objects.filter(store_id=options["store"]).values_list("id", flat=True))
+
+        with transaction.atomic():
+            ratings.recompute(product_ids)
+
+        self.stdout.write(self.style.SUCCESS("Рейтинги пересчитаны"))
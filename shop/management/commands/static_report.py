@@ -0,0 +1,114 @@
+import os
+import re
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# ссылки на файлы внутри шаблонов / css / js: {% static '...' %}, url(...), "assets/..."
+REF_RE = re.compile(r"""[\w@~.\-/]+\.(?:css|js|mjs|map|json|svg|png|jpe?g|gif|webp|avif|ico|woff2?|ttf|otf|eot|mp4|webm)\b""", re.I)
+# текстовые файлы, внутри которых ищем ссылки дальше
+TEXT_EXT = {".html", ".css", ".js", ".mjs", ".json", ".svg", ".txt", ".py"}
+# каталоги, которые подключает сам Django (admin) — не считаем неиспользуемыми
+KEEP_DIRS = {"admin"}
+
+
+def _strip(ref):
+    ref = ref.split("?", 1)[0].split("#", 1)[0]
+    while ref.startswith(("./", "../", "/")):
+        ref = ref.split("/", 1)[1] if not ref.startswith("/") else ref[1:]
+    prefix = settings.STATIC_URL.strip("/") + "/"
+    if ref.startswith(prefix):
+        ref = ref[len(prefix):]
+    return ref
+
+
+class Command(BaseCommand):
+    help = (
+        "Отчёт по статике: файлы из STATICFILES_DIRS, на которые не ссылаются "
+        "шаблоны, код и другие css/js (обычно — остатки вендорных тем)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--list", action="store_true", help="Вывести все неиспользуемые файлы")
+        parser.add_argument("--depth", type=int, default=2, help="Глубина группировки каталогов в сводке")
+
+    def handle(self, *args, **options):
+        files = {}   # относительное имя -> абсолютный путь
+        for root in settings.STATICFILES_DIRS:
+            root = str(root)
+            for dirpath, _dirnames, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    files[os.path.relpath(path, root).replace(os.sep, "/")] = path
+
+        by_suffix = defaultdict(set)
+        for name in files:
+            by_suffix[os.path.basename(name)].add(name)
+
+        used = {n for n in files if n.split("/", 1)[0] in KEEP_DIRS}
+        queue = []
+
+        def resolve(ref, base=None):
+            out = set()
+            if base is not None and not ref.startswith(("/", "http")):
+                rel = os.path.normpath(os.path.join(os.path.dirname(base), ref.split("?", 1)[0])).replace(os.sep, "/")
+                if rel in files:
+                    return {rel}
+            ref = _strip(ref)
+            if ref in files:
+                return {ref}
+            for name in by_suffix.get(os.path.basename(ref), ()):
+                if name.endswith("/" + ref) or name == ref:
+                    out.add(name)
+            return out
+
+        def scan(text, base=None):
+            for ref in REF_RE.findall(text):
+                for name in resolve(ref, base):
+                    if name not in used:
+                        used.add(name)
+                        if os.path.splitext(name)[1].lower() in TEXT_EXT:
+                            queue.append(name)
+
+        # корни: шаблоны и код проекта
+        seeds = [str(d) for t in settings.TEMPLATES for d in t.get("DIRS", [])]
+        seeds += [app.path for app in apps.get_app_configs() if app.path.startswith(str(settings.BASE_DIR))]
+        static_roots = {os.path.realpath(str(r)) for r in settings.STATICFILES_DIRS}
+        for seed in seeds:
+            for dirpath, dirnames, filenames in os.walk(seed):
+                dirnames[:] = [d for d in dirnames if os.path.realpath(os.path.join(dirpath, d)) not in static_roots]
+                for filename in filenames:
+                    if os.path.splitext(filename)[1] in (".html", ".py", ".txt"):
+                        with open(os.path.join(dirpath, filename), encoding="utf-8", errors="ignore") as f:
+                            scan(f.read())
+
+        # дальше по ссылкам внутри найденных css/js
+        while queue:
+            name = queue.pop()
+            with open(files[name], encoding="utf-8", errors="ignore") as f:
+                scan(f.read(), base=name)
+
+        unused = sorted(set(files) - used)
+        total = sum(os.path.getsize(p) for p in files.values())
+        wasted = {n: os.path.getsize(files[n]) for n in unused}
+
+        groups = defaultdict(lambda: [0, 0])
+        for name, size in wasted.items():
+            folder = name.rsplit("/", 1)[0] if "/" in name else "."
+            key = "/".join(folder.split("/")[:options["depth"]])
+            groups[key][0] += 1
+            groups[key][1] += size
+
+        self.stdout.write(
+            f"Файлов: {len(files)} ({total / 1024 / 1024:.1f} МБ), "
+            f"используется: {len(files) - len(unused)}, "
+            f"без ссылок: {len(unused)} ({sum(wasted.values()) / 1024 / 1024:.1f} МБ)"
+        )
+        for key, (count, size) in sorted(groups.items(), key=lambda item: -item[1][1]):
+            self.stdout.write(f"  {key:<40} {count:>6}  {size / 1024 / 1024:8.2f} МБ")
+        if options["list"]:
+            for name in unused:
+                self.stdout.write(name)
@@ -1,41 +1,50 @@
-from django.http import Http404
+import mimetypes
+import os
+from urllib.parse import unquote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.http import FileResponse, Http404, HttpResponseNotModified
 from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
-from django.core.exceptions import DisallowedHost
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import DisallowedHost, SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
 
-from .models import Store
+from .staticfiles import ENCODINGS, compressible
+from .storage import BLOB_PREFIX
+from .store_cache import store_cache
 
 
 class StoreSubdomainMiddleware(MiddlewareMixin):
 
-    def process_request(self, request):
-
-        request.store = None
+    def __init__(self, get_response):
+        super().__init__(get_response)
 
-        try:
-            host = request.get_host()  # может быть "shop1.example.com:8000"
-        except DisallowedHost:
-            return None
+        # настройки читаем один раз при старте, а не на каждый запрос
+        base_domain = getattr(settings, "BASE_DOMAIN", None)  # например: "example.com"
+        self.base_domain = base_domain.lower().strip(".") if base_domain else None
+        self.base_suffix = "." + self.base_domain if self.base_domain else None
+        self.ignored = frozenset(getattr(settings, "SUBDOMAIN_IGNORED", ["www"]))
+        self.bypass_prefixes = frozenset(getattr(settings, "SUBDOMAIN_BYPASS_PREFIXES", ["api", "admin"]))
 
+    def get_subdomain(self, host):
         # убираем порт
         host = host.split(":")[0].lower().strip(".")
 
-        base_domain = getattr(settings, "BASE_DOMAIN", None)  # например: "example.com"
-        ignored = set(getattr(settings, "SUBDOMAIN_IGNORED", ["www"]))
-        bypass_prefixes = tuple(getattr(settings, "SUBDOMAIN_BYPASS_PREFIXES", ["api", "admin"]))
-
         # Если dashboard/api на отдельном поддомене — пропускаем
-        if host.split(".")[0] in bypass_prefixes:
+        if host.split(".")[0] in self.bypass_prefixes:
             return None
 
         subdomain = None
 
-        if base_domain:
-            base_domain = base_domain.lower().strip(".")
-            if host == base_domain:
+        if self.base_domain:
+            if host == self.base_domain:
                 subdomain = None
-            elif host.endswith("." + base_domain):
-                subdomain = host[: -(len(base_domain) + 1)]  # всё слева от .base_domain
+            elif host.endswith(self.base_suffix):
+                subdomain = host[: -len(self.base_suffix)]  # всё слева от .base_domain
             else:
                 return None
 
@@ -44,19 +53,159 @@ class StoreSubdomainMiddleware(MiddlewareMixin):
             if len(parts) >= 3:
                 subdomain = parts[0]
 
-        if not subdomain or subdomain in ignored:
+        if not subdomain or subdomain in self.ignored:
+            return None
+
+        return subdomain
+
+    def request_subdomain(self, request):
+        request.store = None
+
+        try:
+            host = request.get_host()  # может быть "shop1.example.com:8000"
+        except DisallowedHost:
             return None
 
-        store = Store.objects.filter(
-            subdomain=subdomain,
-            is_active=True,
-        ).first()
+        return self.get_subdomain(host)
 
+    def check_store(self, store):
         if not store:
             raise Http404("Магазин не найден")
 
         if hasattr(store, "is_blocked") and store.is_blocked:
             raise Http404("Магазин недоступен")
 
-        request.store = store
+        return store
+
+    def process_request(self, request):
+        subdomain = self.request_subdomain(request)
+        if subdomain:
+            request.store = self.check_store(store_cache.get(subdomain))
         return None
+
+    async def __acall__(self, request):
+        # ASGI: магазин ищем в event loop (async ORM при промахе кеша),
+        # без перехода в поток, который MiddlewareMixin делает для process_request
+        subdomain = self.request_subdomain(request)
+        if subdomain:
+            request.store = self.check_store(await store_cache.aget(subdomain))
+        return await self.get_response(request)
+
+
+def accepted_encodings(header):
+    """
+    Accept-Encoding -> множество кодировок, которые клиент принимает (q > 0).
+    """
+    out = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token and q > 0:
+            out.add(token)
+    return out
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Отдаёт статику из STATIC_ROOT (после collectstatic) и blob'ы из media:
+      - при Accept-Encoding br/gzip — готовый .br/.gz рядом с файлом;
+      - имена с хешем из манифеста и blobs/<sha256> — Cache-Control immutable на год,
+        остальное — короткий max-age с Last-Modified / 304.
+
+    В DEBUG статику отдаёт runserver — middleware стоит, но до него не доходит.
+    """
+
+    IMMUTABLE = "public, max-age=31536000, immutable"
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        self.static_prefix = "/" + settings.STATIC_URL.strip("/") + "/"
+        self.static_root = getattr(settings, "STATIC_ROOT", None)
+        self.media_prefix = "/" + settings.MEDIA_URL.strip("/") + "/" + BLOB_PREFIX + "/"
+        self.media_root = settings.MEDIA_ROOT
+        self.max_age = getattr(settings, "STATIC_MAX_AGE", 60)
+
+        self.immutable = set()
+        if self.static_root:
+            storage = staticfiles_storage
+            if hasattr(storage, "immutable_names"):
+                self.immutable = storage.immutable_names()
+
+    def match(self, request):
+        """
+        (каталог, имя, immutable) для запроса к статике/blob'ам, иначе None.
+        """
+        if request.method not in ("GET", "HEAD"):
+            return None
+        path = request.path_info
+        if self.static_root and path.startswith(self.static_prefix):
+            name = unquote(path[len(self.static_prefix):])
+            return self.static_root, name, name in self.immutable
+        if path.startswith(self.media_prefix):
+            # blobs/ — имя это хеш содержимого
+            return self.media_root, BLOB_PREFIX + "/" + unquote(path[len(self.media_prefix):]), True
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        target = self.match(request)
+        if target is not None:
+            response = self.serve(request, *target)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        target = self.match(request)
+        if target is not None:
+            # stat/open — блокирующие, уводим из event loop
+            response = await sync_to_async(self.serve, thread_sensitive=False)(request, *target)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def serve(self, request, root, name, immutable):
+        try:
+            path = safe_join(str(root), name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        content_type, _ = mimetypes.guess_type(path)
+        file_path, encoding = path, None
+        if compressible(path):
+            accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING"))
+            for enc, suffix in ENCODINGS:
+                if enc in accepted and os.path.isfile(path + suffix):
+                    file_path, encoding = path + suffix, enc
+                    break
+
+        stat = os.stat(file_path)
+        if not immutable and not was_modified_since(request.META.get("HTTP_IF_MODIFIED_SINCE"), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(file_path, "rb"), content_type=content_type or "application/octet-stream")
+            response.headers.pop("Content-Disposition", None)
+            if encoding:
+                response["Content-Encoding"] = encoding
+
+        if compressible(path):
+            patch_vary_headers(response, ("Accept-Encoding",))
+        response["Last-Modified"] = http_date(stat.st_mtime)
+        response["Cache-Control"] = self.IMMUTABLE if immutable else f"public, max-age={self.max_age}"
+        return response
@@ -0,0 +1,93 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef
+
+
+def fill_facet_counts(apps, schema_editor):
+    """
+    Начальные счётчики — как shop.facets.rebuild по каждому магазину:
+    категории/бренды/полы — с нулём, цвета/размеры — только с товарами.
+    """
+    Store = apps.get_model("shop", "Store")
+    Category = apps.get_model("shop", "Category")
+    Brand = apps.get_model("shop", "Brand")
+    Gender = apps.get_model("shop", "Gender")
+    ProductColor = apps.get_model("shop", "ProductColor")
+    Product = apps.get_model("shop", "Product")
+    ProductVariant = apps.get_model("shop", "ProductVariant")
+    FacetCount = apps.get_model("shop", "FacetCount")
+
+    products = Product.objects.filter(is_active=True).filter(
+        Exists(ProductVariant.objects.filter(product=OuterRef("pk"), is_active=True))
+    ).order_by()
+    variants = ProductVariant.objects.filter(product__is_active=True, is_active=True).order_by()
+
+    def product_counts(field):
+        rows = products.values("store_id", field).annotate(cnt=Count("id"))
+        return {(r["store_id"], r[field]): r["cnt"] for r in rows}
+
+    def variant_counts(field):
+        rows = variants.values("product__store_id", field).annotate(cnt=Count("product_id", distinct=True))
+        return {(r["product__store_id"], r[field]): r["cnt"] for r in rows}
+
+    rows = []
+    for facet, model in (("category", Category), ("brand", Brand)):
+        counts = product_counts(f"{facet}_id")
+        for obj in model.objects.filter(is_active=True):
+            rows.append(FacetCount(
+                store_id=obj.store_id, facet=facet, key=str(obj.id), obj_id=obj.id,
+                label=obj.name, count=counts.get((obj.store_id, obj.id), 0),
+            ))
+
+    counts = product_counts("gender_id")
+    genders = list(Gender.objects.all())
+    for store_id in Store.objects.values_list("id", flat=True):
+        for g in genders:
+            rows.append(FacetCount(
+                store_id=store_id, facet="gender", key=str(g.id), obj_id=g.id,
+                label=g.name, count=counts.get((store_id, g.id), 0),
+            ))
+
+    colors = {c.id: c for c in ProductColor.objects.all()}
+    for (store_id, color_id), cnt in variant_counts("color_id").items():
+        if color_id in colors:
+            color = colors[color_id]
+            rows.append(FacetCount(
+                store_id=store_id, facet="color", key=str(color_id), obj_id=color_id,
+                label=color.name, hex=color.hex, count=cnt,
+            ))
+
+    for (store_id, size), cnt in variant_counts("size").items():
+        if size:
+            rows.append(FacetCount(store_id=store_id, facet="size", key=size, label=size, count=cnt))
+
+    FacetCount.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Категория'), ('brand', 'Бренд'), ('gender', 'Пол'), ('color', 'Цвет'), ('size', 'Размер')], max_length=16)),
+                ('key', models.CharField(max_length=64)),
+                ('obj_id', models.BigIntegerField(blank=True, null=True)),
+                ('label', models.CharField(blank=True, max_length=255)),
+                ('hex', models.CharField(blank=True, max_length=7)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='shop.store')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('store', 'facet', 'key'), name='uniq_facet_per_store')],
+            },
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
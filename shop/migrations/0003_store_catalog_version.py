@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_facetcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='catalog_version',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+FTS_TABLE = "shop_product_fts"
+
+CREATE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, description, brand, category, material, country, skus,
+    store_id UNINDEXED,
+    tokenize = "unicode61 remove_diacritics 2",
+    prefix = '2 3'
+)
+"""
+
+
+def _fold(col):
+    return f"replace(replace(COALESCE({col}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+POPULATE_SQL = f"""
+INSERT INTO {FTS_TABLE}(rowid, name, description, brand, category, material, country, skus, store_id)
+SELECT
+    p.id,
+    {_fold("p.name")},
+    {_fold("p.description")},
+    {_fold("b.name")},
+    {_fold("c.name")},
+    {_fold("p.material")},
+    {_fold("p.country")},
+    {_fold("(SELECT group_concat(v.sku, ' ') FROM shop_productvariant v WHERE v.product_id = p.id AND v.is_active)")},
+    p.store_id
+FROM shop_product p
+LEFT JOIN shop_brand b ON b.id = p.brand_id
+LEFT JOIN shop_category c ON c.id = p.category_id
+WHERE p.is_active
+"""
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 есть только у sqlite; на других БД поиск идёт запасным путём (icontains)
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(CREATE_SQL)
+        cur.execute(POPULATE_SQL)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_seek_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
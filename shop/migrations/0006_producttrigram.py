@@ -0,0 +1,55 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _trigrams(text):
+    # как shop.trigram.trigrams на момент миграции
+    text = (text or "").lower().replace("ё", "е")
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def fill_trigrams(apps, schema_editor):
+    Product = apps.get_model("shop", "Product")
+    ProductVariant = apps.get_model("shop", "ProductVariant")
+    ProductTrigram = apps.get_model("shop", "ProductTrigram")
+
+    skus = {}
+    for product_id, sku in ProductVariant.objects.values_list("product_id", "sku").iterator():
+        skus.setdefault(product_id, []).append(sku)
+
+    rows = []
+    for product_id, store_id, name in Product.objects.order_by("id").values_list("id", "store_id", "name").iterator():
+        grams = _trigrams(name)
+        for sku in skus.get(product_id, ()):
+            grams |= _trigrams(sku)
+        rows += [ProductTrigram(store_id=store_id, product_id=product_id, gram=g) for g in grams]
+        if len(rows) >= 5000:
+            ProductTrigram.objects.bulk_create(rows, batch_size=1000)
+            rows = []
+    ProductTrigram.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='shop.product')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['store', 'gram', 'product'], name='shop_produc_store_i_6d1136_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'gram'), name='uniq_trigram_per_product')],
+            },
+        ),
+        migrations.RunPython(fill_trigrams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Floor
+
+
+def fill_effective_prices(apps, schema_editor):
+    # без скидок; действующие скидки применит manage.py apply_discount_windows
+    Product = apps.get_model("shop", "Product")
+    Product.objects.update(
+        effective_min_price=Floor(F("min_price")),
+        effective_max_price=Floor(F("max_price")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_seek_price',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_discount',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Действующая скидка (%)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_max_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_min_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'is_active', 'effective_min_price', 'id'], name='product_seek_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_min_price', 'effective_max_price'], name='product_effective_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'effective_discount'], name='product_discount_flag'),
+        ),
+        migrations.RunPython(fill_effective_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_histogram(apps, schema_editor):
+    Product = apps.get_model("shop", "Product")
+    ProductReview = apps.get_model("shop", "ProductReview")
+
+    def agg(expr):
+        return Coalesce(Subquery(
+            ProductReview.objects
+            .filter(product=OuterRef("pk"), is_published=True)
+            .order_by()
+            .values("product")
+            .annotate(value=expr)
+            .values("value")
+        ), Value(0))
+
+    Product.objects.update(
+        rating_sum=agg(Sum("rating")),
+        **{f"rating_{star}": agg(Count("id", filter=Q(rating=star))) for star in range(1, 6)},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='renditions_ready',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('thumb', 'Миниатюра'), ('card', 'Карточка'), ('zoom', 'Увеличение')], max_length=10)),
+                ('format', models.CharField(max_length=10)),
+                ('file', models.FileField(max_length=255, upload_to='renditions/%Y/%m/')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='shop.productimage')),
+            ],
+            options={
+                'verbose_name': 'Копия изображения',
+                'verbose_name_plural': 'Копии изображений',
+                'constraints': [models.UniqueConstraint(fields=('image', 'kind', 'format'), name='uniq_rendition')],
+            },
+        ),
+    ]
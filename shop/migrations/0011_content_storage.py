@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+import shop.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Файл (blob)',
+                'verbose_name_plural': 'Файлы (blob)',
+            },
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(max_length=255, storage=shop.storage.get_content_storage, upload_to='products/%Y/%m/', verbose_name='Фото'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, max_length=255, null=True, storage=shop.storage.get_content_storage, upload_to='users/avatars/'),
+        ),
+    ]
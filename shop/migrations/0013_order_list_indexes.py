@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_order_counts(apps, schema_editor):
+    Order = apps.get_model("shop", "Order")
+    OrderStatusCount = apps.get_model("shop", "OrderStatusCount")
+    rows = Order.objects.order_by().values("store_id", "status").annotate(n=Count("id"))
+    OrderStatusCount.objects.bulk_create(
+        [OrderStatusCount(store_id=r["store_id"], status=r["status"], count=r["n"]) for r in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('processing', 'В обработке'), ('done', 'Завершён'), ('cancelled', 'Отменён')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', 'status', 'created_at', 'id'], name='order_seek_status'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', 'created_at', 'id'], name='order_seek_created'),
+        ),
+        migrations.AddField(
+            model_name='orderstatuscount',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_counts', to='shop.store'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderstatuscount',
+            constraint=models.UniqueConstraint(fields=('store', 'status'), name='uniq_order_status_per_store'),
+        ),
+        migrations.RunPython(fill_order_counts, migrations.RunPython.noop),
+    ]
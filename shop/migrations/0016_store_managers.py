@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_cart_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='managers',
+            field=models.ManyToManyField(blank=True, related_name='managed_stores', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+def mark_counted(apps, schema_editor):
+    # как после rebuild_sales: учтены все неотменённые заказы
+    # (итоги приводит в соответствие manage.py rebuild_sales)
+    Order = apps.get_model("shop", "Order")
+    Order.objects.exclude(status="cancelled").update(in_sales=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_store_managers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='in_sales',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_counted, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_order_in_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountWindowRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['discount_start'], name='category_discount_start'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['discount_end'], name='category_discount_end'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['discount_start'], name='product_discount_start'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['discount_end'], name='product_discount_end'),
+        ),
+    ]
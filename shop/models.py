@@ -2,16 +2,17 @@ import re
 import secrets
 from django.utils import timezone
 from django.db import models, transaction, IntegrityError
-from django.db.models import Avg, Count, Q, F, Min, Max
+from django.db.models import Q, F, Min, Max
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 from django.conf import settings
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from decimal import Decimal
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 
+from .storage import get_content_storage
+
 class User(AbstractUser):
     phone = models.CharField(max_length=20, blank=True)
 
@@ -30,6 +31,8 @@ class UserProfile(models.Model):
 
     avatar = models.ImageField(
         upload_to="users/avatars/",
+        storage=get_content_storage,
+        max_length=255,
         blank=True,
         null=True
     )
@@ -56,6 +59,15 @@ class Store(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # кто ведёт магазин в дашборде (вместе с is_staff); суперпользователю — все магазины
+    managers = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="managed_stores", blank=True)
+
+    # растёт при любом изменении каталога (shop.catalog.bump);
+    # читать через shop.catalog.get_version — request.store из кеша может быть устаревшим
+    catalog_version = models.PositiveBigIntegerField(default=0, editable=False)
+    catalog_updated_at = models.DateTimeField(default=timezone.now, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def save(self, *args, **kwargs):
         if not self.subdomain:
             base = slugify(self.name) or "store"
@@ -67,6 +79,11 @@ class Store(models.Model):
             self.subdomain = sub
         super().save(*args, **kwargs)
 
+    def is_managed_by(self, user):
+        if not (user.is_active and user.is_staff):
+            return False
+        return user.is_superuser or self.managers.filter(pk=user.pk).exists()
+
 hex_validator = RegexValidator(
     regex=r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$',
     message='Введите корректный HEX-код (например, #FFFFFF)'
@@ -83,6 +100,7 @@ class Category(models.Model):
     slug = models.SlugField(max_length=120, blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField("Дата добавления", auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     discount_percent = models.PositiveSmallIntegerField("Скидка (%)", default=0)
     discount_active = models.BooleanField(default=False)
     discount_start = models.DateTimeField(null=True, blank=True)
@@ -94,6 +112,11 @@ class Category(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["store", "slug"], name="uniq_category_slug_per_store")
         ]
+        indexes = [
+            # границы окон скидок, прошедшие с прошлого запуска (shop.pricing.stale)
+            models.Index(fields=["discount_start"], name="category_discount_start"),
+            models.Index(fields=["discount_end"], name="category_discount_end"),
+        ]
         ordering = ["name"]
 
     def save(self, *args, **kwargs):
@@ -127,6 +150,7 @@ class Brand(models.Model):
     name = models.CharField("Название", max_length=100)
     slug = models.SlugField(max_length=120, blank=True)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Бренд"
@@ -185,13 +209,26 @@ class Product(models.Model):
     views = models.PositiveIntegerField("Просмотры", default=0)
     rating_avg = models.DecimalField("Средний рейтинг", max_digits=3, decimal_places=2, default=0)
     rating_count = models.PositiveIntegerField("Кол-во отзывов", default=0)
+    # сумма оценок и гистограмма по звёздам — поддерживаются дельтами (shop.ratings)
+    rating_sum = models.PositiveIntegerField("Сумма оценок", default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
 
     # Денормализация цен
     min_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     max_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # цены с учётом действующей скидки товара/категории (shop.pricing.recompute)
+    effective_min_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    effective_max_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    effective_discount = models.PositiveSmallIntegerField("Действующая скидка (%)", default=0, editable=False)
 
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # меняется и при изменении вариантов/фото (см. shop.signals) — валидатор для Last-Modified
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Товар"
@@ -200,21 +237,39 @@ class Product(models.Model):
             models.Index(fields=["store", "is_active"]),
             models.Index(fields=["min_price", "max_price"]),
             models.Index(fields=["created_at"]),
+            # keyset-пагинация витрины (сортировка + id)
+            models.Index(fields=["store", "is_active", "created_at", "id"], name="product_seek_created"),
+            models.Index(fields=["store", "is_active", "rating_count", "id"], name="product_seek_reviews"),
+            models.Index(fields=["store", "is_active", "effective_min_price", "id"], name="product_seek_price"),
+            models.Index(fields=["effective_min_price", "effective_max_price"], name="product_effective_price"),
+            models.Index(fields=["store", "effective_discount"], name="product_discount_flag"),
+            models.Index(fields=["discount_start"], name="product_discount_start"),
+            models.Index(fields=["discount_end"], name="product_discount_end"),
         ]
         constraints = [
             models.UniqueConstraint(fields=["store", "slug"], name="uniq_product_slug_per_store"),
         ]
 
     def update_rating(self):
-        stats = self.reviews.filter(is_published=True).aggregate(
-            avg=Avg("rating"),
-            count=Count("id")
-        )
-        avg = stats["avg"] or 0
-        count = stats["count"] or 0
-        Product.objects.filter(pk=self.pk).update(rating_avg=avg, rating_count=count)
-        self.rating_avg = avg
-        self.rating_count = count
+        # полный пересчёт (ремонт); в обычной работе агрегаты меняются дельтами
+        from .ratings import recompute
+        recompute([self.pk])
+        self.refresh_from_db(fields=[
+            "rating_avg", "rating_count", "rating_sum",
+            "rating_1", "rating_2", "rating_3", "rating_4", "rating_5",
+        ])
+
+    @property
+    def rating_histogram(self):
+        """
+        [(звёзды, кол-во, %), ...] от 5 к 1 — из хранимых счётчиков, без агрегации.
+        """
+        total = self.rating_count
+        out = []
+        for star in (5, 4, 3, 2, 1):
+            cnt = getattr(self, f"rating_{star}")
+            out.append((star, cnt, round(cnt * 100 / total) if total else 0))
+        return out
 
     def update_prices(self):
         stats = self.variants.filter(is_active=True).aggregate(
@@ -227,6 +282,9 @@ class Product(models.Model):
         self.min_price = min_p
         self.max_price = max_p
 
+        from .pricing import recompute
+        recompute(Product.objects.filter(pk=self.pk))
+
     def save(self, *args, **kwargs):
         # Slug: optimistic + IntegrityError retry (anti-race)
         if self.slug:
@@ -276,6 +334,7 @@ class ProductVariant(models.Model):
 
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Вариант товара"
@@ -312,29 +371,34 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} | {self.color} | {self.size}"
 
+    def _get_price(self):
+        # обычно цены уже посчитаны пачкой (shop.pricing.apply); иначе — для одного варианта
+        if getattr(self, "_price", None) is None:
+            from .pricing import resolve
+            self._price = resolve([self])[self.pk]
+        return self._price
+
     @property
     def price_final(self):
-        cat = self.product.category
-        if not cat or not cat.discount_is_active_now():
-            return int(self.price)
-
-        d = Decimal(cat.discount_percent) / Decimal("100")
-        res = self.price * (Decimal("1") - d)
-        return int(res)
+        return self._get_price().final
 
     @property
     def old_price_effective(self):
         # чтобы на витрине показать "старая цена"
-        if self.product.category and self.product.category.discount_is_active_now():
-            return self.price
-        return self.old_price
+        return self._get_price().old
 
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name="images", on_delete=models.CASCADE)
-    image = models.ImageField("Фото", upload_to="products/%Y/%m/")
+    image = models.ImageField("Фото", upload_to="products/%Y/%m/", storage=get_content_storage, max_length=255)
     is_main = models.BooleanField("Главное фото", default=False)
     sort = models.PositiveIntegerField("Порядок", default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # размеры оригинала и готовность уменьшенных копий (shop.renditions)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    renditions_ready = models.BooleanField(default=False, editable=False)
 
     class Meta:
         verbose_name = "Изображение"
@@ -345,6 +409,30 @@ class ProductImage(models.Model):
         return f"Image for {self.product.name}"
 
 
+class ImageRendition(models.Model):
+    THUMB = "thumb"
+    CARD = "card"
+    ZOOM = "zoom"
+    KIND_CHOICES = [(THUMB, "Миниатюра"), (CARD, "Карточка"), (ZOOM, "Увеличение")]
+
+    image = models.ForeignKey(ProductImage, related_name="renditions", on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    format = models.CharField(max_length=10)   # webp / jpeg / avif
+    file = models.FileField(upload_to="renditions/%Y/%m/", max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Копия изображения"
+        verbose_name_plural = "Копии изображений"
+        constraints = [
+            models.UniqueConstraint(fields=["image", "kind", "format"], name="uniq_rendition"),
+        ]
+
+    def __str__(self):
+        return f"{self.image_id} {self.kind}.{self.format} {self.width}x{self.height}"
+
+
 
 class ProductReview(models.Model):
     product = models.ForeignKey(Product, related_name="reviews", on_delete=models.CASCADE)
@@ -370,46 +458,17 @@ class ProductReview(models.Model):
             )
         ]
 
-    def update_product_rating(self):
-        stats = self.product.reviews.filter(is_published=True).aggregate(
-            avg=Avg("rating"),
-            count=Count("id")
-        )
-
-        self.product.rating_avg = stats["avg"] or 0
-        self.product.rating_count = stats["count"] or 0
-        self.product.save(update_fields=["rating_avg", "rating_count"])
-
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.update_product_rating()
-
-    def delete(self, *args, **kwargs):
-        product = self.product
-        super().delete(*args, **kwargs)
-
-        stats = product.reviews.filter(is_published=True).aggregate(
-            avg=Avg("rating"),
-            count=Count("id")
-        )
-
-        product.rating_avg = stats["avg"] or 0
-        product.rating_count = stats["count"] or 0
-        product.save(update_fields=["rating_avg", "rating_count"])
-
     def __str__(self):
         return f"{self.product.name} - {self.rating}"
 
 
 # --- СИГНАЛЫ ---
-@receiver([post_save, post_delete], sender=ProductReview)
-def handle_review_change(sender, instance, **kwargs):
-    instance.product.update_rating()
-
-
 @receiver(post_delete, sender=ProductVariant)
 def handle_variant_delete(sender, instance, **kwargs):
-    # при одиночном delete ок
+    # при одиночном delete ок; variants.bulk_write пересчитывает цены сам
+    from .variants import in_bulk_delete
+    if in_bulk_delete():
+        return
     instance.product.update_prices()
 
 class StoreSocial(models.Model):
@@ -444,6 +503,10 @@ class Cart(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # растёт при любом изменении строк (shop.carts.invalidate) — входит
+    # в ключ кеша итогов, поэтому устаревшая запись не читается ни одним процессом
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -497,6 +560,85 @@ class Order(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # ключ клиента (Idempotency-Key): повтор/двойной сабмит возвращает тот же заказ
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    # заказ учтён в дневных итогах продаж (shop.sales): что вычитать при отмене/удалении
+    in_sales = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["store", "user", "idempotency_key"],
+                condition=models.Q(idempotency_key__isnull=False),
+                name="uniq_order_idempotency_key",
+            )
+        ]
+        indexes = [
+            # keyset-пагинация списка заказов в дашборде (новые сверху): вкладка статуса и «все»
+            models.Index(fields=["store", "status", "created_at", "id"], name="order_seek_status"),
+            models.Index(fields=["store", "created_at", "id"], name="order_seek_created"),
+        ]
+
+class OrderStatusCount(models.Model):
+    """
+    Кол-во заказов магазина в каждом статусе (вкладки списка заказов).
+    Поддерживается сигналами Order (shop.orders.count_status),
+    полная пересборка — manage.py rebuild_order_counts.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="order_counts")
+    status = models.CharField(max_length=20, choices=Order.STATUS)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["store", "status"], name="uniq_order_status_per_store"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} {self.status}: {self.count}"
+
+class DailySales(models.Model):
+    """
+    Продажи магазина за день (локальная дата заказа), без отменённых заказов.
+    Поддерживается инкрементально (shop.sales), полная пересборка —
+    manage.py rebuild_sales. Графики дашборда читают только эти таблицы.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="daily_sales")
+    day = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["store", "day"], name="uniq_daily_sales"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} {self.day}: {self.orders} / {self.revenue}"
+
+class DailyProductSales(models.Model):
+    """
+    Продажи товара за день — топ товаров за период (shop.sales).
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    day = models.DateField()
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["store", "product", "day"], name="uniq_daily_product_sales"),
+        ]
+        indexes = [
+            models.Index(fields=["store", "day"], name="daily_product_sales_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} {self.product_id} {self.day}: {self.quantity}"
+
 class OrderItem(models.Model):
     order = models.ForeignKey(
         Order,
@@ -546,4 +688,93 @@ class Favorite(models.Model):
         if self.product_id and not self.store_id:
             self.store = self.product.store
         self.full_clean()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+class DiscountWindowRun(models.Model):
+    """
+    Момент последней проверки окон скидок (apply_discount_windows), одна
+    строка: следующий запуск смотрит только границы окон после него.
+    """
+    checked_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.checked_at:%Y-%m-%d %H:%M:%S}"
+
+
+class Blob(models.Model):
+    """
+    Файл в content-addressed хранилище (shop.storage) и число записей,
+    которые на него ссылаются. При refcount=0 файл удаляется (shop.blobs).
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Файл (blob)"
+        verbose_name_plural = "Файлы (blob)"
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+class FacetCount(models.Model):
+    """
+    Денормализованные счётчики фильтров витрины (сайдбар shop).
+    Поддерживается инкрементально сигналами (shop.facets.refresh),
+    полная пересборка — manage.py rebuild_facets.
+    """
+
+    CATEGORY = "category"
+    BRAND = "brand"
+    GENDER = "gender"
+    COLOR = "color"
+    SIZE = "size"
+
+    FACETS = (
+        (CATEGORY, "Категория"),
+        (BRAND, "Бренд"),
+        (GENDER, "Пол"),
+        (COLOR, "Цвет"),
+        (SIZE, "Размер"),
+    )
+
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="facet_counts")
+    facet = models.CharField(max_length=16, choices=FACETS)
+
+    # id объекта строкой, для размеров — сам размер
+    key = models.CharField(max_length=64)
+    obj_id = models.BigIntegerField(null=True, blank=True)
+
+    label = models.CharField(max_length=255, blank=True)
+    hex = models.CharField(max_length=7, blank=True)
+
+    # кол-во активных товаров с хотя бы одним активным вариантом
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["store", "facet", "key"], name="uniq_facet_per_store"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} {self.facet}={self.key}: {self.count}"
+
+
+class ProductTrigram(models.Model):
+    """
+    Триграммы названия товара и SKU его вариантов — индекс для поиска
+    по подстроке в дашборде (shop.trigram.lookup).
+    """
+
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="trigrams")
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["product", "gram"], name="uniq_trigram_per_product"),
+        ]
+        indexes = [
+            models.Index(fields=["store", "gram", "product"]),
+        ]
@@ -0,0 +1,168 @@
+import re
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Cart, Order, OrderItem, OrderStatusCount
+from . import carts
+from . import sales
+
+
+# Idempotency-Key: uuid или любой токен клиента
+KEY_RE = re.compile(r"^[A-Za-z0-9_.:-]{8,64}$")
+
+CENTS = Decimal("0.01")
+
+CLEAR_CART_SQL = "DELETE FROM shop_cartitem WHERE cart_id = %s"
+
+STATUS_COUNT_SQL = """
+INSERT INTO shop_orderstatuscount (store_id, status, count) VALUES (%s, %s, 1)
+ON CONFLICT (store_id, status) DO UPDATE SET count = shop_orderstatuscount.count + 1
+"""
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class Unavailable(CheckoutError):
+    """
+    В корзине есть снятые с продажи варианты — заказ не создаём,
+    пусть покупатель поправит корзину.
+    """
+
+    def __init__(self, variant_ids):
+        super().__init__(variant_ids)
+        self.variant_ids = variant_ids
+
+
+def clean_key(value):
+    """
+    Пустой ключ — None (без идемпотентности), кривой — ValueError.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    if not KEY_RE.match(value):
+        raise ValueError("bad idempotency key")
+    return value
+
+
+def _existing(store_id, user_id, key):
+    return Order.objects.filter(store_id=store_id, user_id=user_id, idempotency_key=key).first()
+
+
+def _item_name(name, color, size):
+    extra = ", ".join(x for x in (color, size) if x)
+    return (f"{name} ({extra})" if extra else name)[:255]
+
+
+def _snapshot(cart_id, now):
+    # те же цены/итоги, что в карточке корзины (carts.priced), + название для строки заказа
+    return list(carts.priced(cart_id, now).values_list(
+        "variant_id", "quantity", "unit_price", "subtotal",
+        "variant__product__name", "variant__color__name", "variant__size",
+        "variant__product_id", "variant__is_active", "variant__product__is_active",
+    ))
+
+
+@transaction.atomic
+def _place(user_id, store_id, full_name, phone, address, key):
+    # блокировка корзины: два оформления одной корзины идут по очереди
+    cart_id = (
+        Cart.objects.select_for_update()
+        .filter(user_id=user_id, store_id=store_id)
+        .values_list("id", flat=True)
+        .first()
+    )
+    if key:
+        order = _existing(store_id, user_id, key)
+        if order is not None:
+            return order, False
+
+    rows = _snapshot(cart_id, timezone.now()) if cart_id else []
+    if not rows:
+        raise EmptyCart()
+    unavailable = [row[0] for row in rows if not (row[8] and row[9])]
+    if unavailable:
+        raise Unavailable(unavailable)
+
+    order = Order(
+        store_id=store_id, user_id=user_id,
+        full_name=full_name, phone=phone, address=address,
+        total_price=Decimal(rows[0][3]).quantize(CENTS), idempotency_key=key,
+    )
+    # в дневные итоги заказ попадает ниже (order_placed), сразу со строками
+    order.in_sales = sales.counted(order.status)
+    order.save(force_insert=True)
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, variant_id=variant_id, quantity=quantity, price=price,
+            product_name=_item_name(name, color, size),
+        )
+        for variant_id, quantity, price, _subtotal, name, color, size, *_rest in rows
+    ])
+    # дневные итоги продаж — из того же снимка, без чтения OrderItem
+    sales.order_placed(order, [(row[7], row[1], row[2] * row[1]) for row in rows])
+    # один DELETE: ORM-удаление с сигналами CartItem выбирало бы строки по одной
+    with connection.cursor() as cur:
+        cur.execute(CLEAR_CART_SQL, [cart_id])
+    carts.invalidate(cart_id)
+    return order, True
+
+
+def place_order(user_id, store_id, full_name, phone, address="", key=None):
+    """
+    Корзина магазина -> заказ одной транзакцией: цены снимаются одним
+    SELECT, строки заказа — один bulk INSERT, корзина чистится одним DELETE.
+    Возвращает (order, created); повтор с тем же key — (тот же заказ, False).
+    """
+    try:
+        return _place(user_id, store_id, full_name, phone, address, key)
+    except IntegrityError:
+        # параллельный запрос с тем же ключом успел раньше
+        order = _existing(store_id, user_id, key) if key else None
+        if order is None:
+            raise
+        return order, False
+
+
+# ---- счётчики статусов (вкладки списка заказов в дашборде) ----
+def count_status(store_id, old=None, new=None):
+    """
+    Заказ перешёл из old в new (None — заказа не было / больше нет):
+    -1 одной строке счётчика, +1 другой, без COUNT(*) по заказам.
+    """
+    if old == new:
+        return
+    if old:
+        OrderStatusCount.objects.filter(store_id=store_id, status=old, count__gt=0).update(count=F("count") - 1)
+    if new:
+        with connection.cursor() as cur:
+            cur.execute(STATUS_COUNT_SQL, [store_id, new])
+
+
+def status_counts(store_id):
+    """
+    {status: кол-во} по всем статусам Order.STATUS — одна выборка из ≤4 строк.
+    """
+    counts = dict(OrderStatusCount.objects.filter(store_id=store_id).values_list("status", "count"))
+    return {status: counts.get(status, 0) for status, _label in Order.STATUS}
+
+
+def rebuild_status_counts(store_id):
+    """
+    Полный пересчёт счётчиков магазина (manage.py rebuild_order_counts).
+    """
+    rows = Order.objects.filter(store_id=store_id).order_by().values("status").annotate(n=Count("id"))
+    OrderStatusCount.objects.filter(store_id=store_id).delete()
+    OrderStatusCount.objects.bulk_create(
+        [OrderStatusCount(store_id=store_id, status=row["status"], count=row["n"]) for row in rows]
+    )
+    return status_counts(store_id)
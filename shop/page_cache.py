@@ -0,0 +1,149 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from . import catalog
+from .caches import is_local
+from .aio import load_user
+
+
+HITS_KEY = "pagecache:hits"
+MISSES_KEY = "pagecache:misses"
+
+# параметры, которые не меняют страницу
+IGNORED_PARAMS = {"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "fbclid", "gclid"}
+
+
+def _cache():
+    return caches[getattr(settings, "PAGE_CACHE_ALIAS", "default")]
+
+
+def normalized_query(request):
+    """
+    Query string в каноничном виде: параметры и значения отсортированы,
+    пустые и трекинговые отброшены — ?b=1&a=2 и ?a=2&b=1 дают один ключ.
+    """
+    items = []
+    for key in sorted(request.GET.keys()):
+        if key in IGNORED_PARAMS:
+            continue
+        for value in sorted(set(request.GET.getlist(key))):
+            if value != "":
+                items.append((key, value))
+    return urlencode(items)
+
+
+def page_key(request, version):
+    raw = f"{request.path}?{normalized_query(request)}"
+    digest = hashlib.md5(raw.encode("utf-8")).hexdigest()
+    return f"page:{request.store.id}:{version}:{digest}"
+
+
+def _count(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def observable():
+    """
+    Счётчики видны снаружи процесса (manage.py page_cache_stats) только
+    в общем кеше: в LocMemCache у каждого воркера свои, команда увидит 0/0.
+    """
+    return not is_local(_cache())
+
+
+def stats():
+    cache = _cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": (hits / total) if total else 0.0}
+
+
+def reset_stats():
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def cacheable(request):
+    return (
+        request.method == "GET"
+        and getattr(request, "store", None) is not None
+        and not request.user.is_authenticated
+    )
+
+
+def cache_anonymous_page(view):
+    """
+    Кеш целой страницы витрины для анонимных GET.
+
+    Ключ: магазин + версия каталога + путь + нормализованный query string.
+    Любое изменение каталога магазина увеличивает версию (shop.catalog.bump),
+    поэтому инвалидация — O(1): старые ключи просто перестают читаться
+    и вытесняются по таймауту.
+    """
+
+    def lookup(request, version):
+        # csrf-токен в страницу не вшиваем (JS берёт его из cookie) — ставим cookie здесь
+        get_token(request)
+
+        key = page_key(request, version)
+        cached = _cache().get(key)
+        if cached is None:
+            _count(MISSES_KEY)
+            return key, None
+
+        _count(HITS_KEY)
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response["X-Page-Cache"] = "HIT"
+        return key, response
+
+    def store(key, response):
+        if response.status_code == 200 and not response.streaming and not response.cookies:
+            if hasattr(response, "render") and callable(response.render):
+                response = response.render()
+            _cache().set(
+                key,
+                (response.content, response["Content-Type"]),
+                getattr(settings, "PAGE_CACHE_TIMEOUT", 600),
+            )
+        response["X-Page-Cache"] = "MISS"
+        return response
+
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            await load_user(request)
+            if not cacheable(request):
+                return await view(request, *args, **kwargs)
+
+            version, _ = await catalog.aget_state(request.store.id)
+            key, response = lookup(request, version)
+            if response is not None:
+                return response
+            return store(key, await view(request, *args, **kwargs))
+
+    else:
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not cacheable(request):
+                return view(request, *args, **kwargs)
+
+            key, response = lookup(request, catalog.get_version(request.store.id))
+            if response is not None:
+                return response
+            return store(key, view(request, *args, **kwargs))
+
+    return wrapper
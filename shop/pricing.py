@@ -0,0 +1,265 @@
+from decimal import Decimal, ROUND_DOWN
+from typing import NamedTuple
+
+from django.db import transaction
+from django.db.models import (
+    Case, When, Q, F, Value, Subquery, OuterRef, ExpressionWrapper,
+    DecimalField, PositiveSmallIntegerField,
+)
+from django.db.models.functions import Coalesce, Floor
+from django.utils import timezone
+
+from .models import Product, Category, DiscountWindowRun
+from . import catalog
+from . import bitmap_index
+
+
+HUNDRED = Decimal("100")
+WHOLE = Decimal("1")
+
+
+class Price(NamedTuple):
+    final: Decimal          # к оплате (целые тенге, как раньше int(...))
+    old: Decimal | None     # зачёркнутая цена
+    percent: int            # применённая скидка, 0 — без скидки
+
+
+def window_open(now, enabled, percent, start, end):
+    """
+    Скидка действует в момент now: включена, ненулевая и now внутри окна.
+    """
+    if not enabled or not percent:
+        return False
+    if start and now < start:
+        return False
+    if end and now > end:
+        return False
+    return True
+
+
+def percent_for(now, row):
+    """
+    Итоговый процент для товара. row — поля скидки товара и его категории
+    (как в DISCOUNT_FIELDS). Скидка товара важнее скидки категории.
+    """
+    (p_percent, p_active, p_start, p_end,
+     c_percent, c_active, c_start, c_end) = row
+    if window_open(now, p_active, p_percent, p_start, p_end):
+        return p_percent
+    if window_open(now, c_active, c_percent, c_start, c_end):
+        return c_percent
+    return 0
+
+
+DISCOUNT_FIELDS = (
+    "discount_percent", "discount_is_active", "discount_start", "discount_end",
+    "category__discount_percent", "category__discount_active",
+    "category__discount_start", "category__discount_end",
+)
+
+
+def _price(price, old_price, percent, factors):
+    if not percent:
+        return Price(price.quantize(WHOLE, rounding=ROUND_DOWN), old_price, 0)
+    if percent not in factors:
+        factors[percent] = (HUNDRED - percent) / HUNDRED
+    final = (price * factors[percent]).quantize(WHOLE, rounding=ROUND_DOWN)
+    # при скидке зачёркиваем исходную цену варианта
+    return Price(final, price, percent)
+
+
+def product_percents(product_ids, now=None):
+    """
+    {product_id: процент скидки} одним запросом (товар + категория).
+    """
+    now = now or timezone.now()
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+    return {
+        pk: percent_for(now, row)
+        for pk, *row in Product.objects.filter(pk__in=product_ids).values_list("id", *DISCOUNT_FIELDS)
+    }
+
+
+def resolve(variants, now=None):
+    """
+    Цены для пачки вариантов: одно чтение часов, один запрос за скидками
+    товаров/категорий. Возвращает {variant_id: Price}.
+    """
+    variants = list(variants)
+    percents = product_percents({v.product_id for v in variants}, now)
+    factors = {}
+    return {
+        v.pk: _price(v.price, v.old_price, percents.get(v.product_id, 0), factors)
+        for v in variants
+    }
+
+
+def apply(variants, now=None):
+    """
+    Посчитать цены пачкой и положить их на варианты — price_final /
+    old_price_effective дальше читают готовое значение без запросов.
+    """
+    variants = list(variants)
+    prices = resolve(variants, now)
+    for v in variants:
+        v._price = prices[v.pk]
+    return variants
+
+
+def apply_loaded(product, variants, now=None):
+    """
+    apply() для вариантов одного товара, уже загруженного вместе с категорией:
+    процент скидки считается по его полям, без запроса (годится и для async-view).
+    """
+    now = now or timezone.now()
+    category = product.category
+    percent = percent_for(now, (
+        product.discount_percent, product.discount_is_active, product.discount_start, product.discount_end,
+        *((category.discount_percent, category.discount_active, category.discount_start, category.discount_end)
+          if category else (0, False, None, None)),
+    ))
+    variants = list(variants)
+    factors = {}
+    for v in variants:
+        v._price = _price(v.price, v.old_price, percent, factors)
+    return variants
+
+
+def apply_products(products, now=None):
+    """
+    Для карточек списка: цены активных вариантов (prefetch active_variants)
+    и на товаре price_from / price_from_old — минимальная цена с учётом скидки.
+    """
+    products = list(products)
+    apply([v for p in products for v in getattr(p, "active_variants", ())], now)
+    for p in products:
+        prices = [v._price for v in getattr(p, "active_variants", ())]
+        if prices:
+            best = min(prices, key=lambda price: price.final)
+            p.price_from, p.price_from_old = best.final, best.old
+        else:
+            p.price_from, p.price_from_old = p.min_price, None
+    return products
+
+
+# ---- материализованные цены (effective_min_price / effective_max_price) ----
+def _window_q(now, prefix="", active="discount_is_active"):
+    return (
+        Q(**{active: True, f"{prefix}discount_percent__gt": 0})
+        & (Q(**{f"{prefix}discount_start__isnull": True}) | Q(**{f"{prefix}discount_start__lte": now}))
+        & (Q(**{f"{prefix}discount_end__isnull": True}) | Q(**{f"{prefix}discount_end__gte": now}))
+    )
+
+
+def percent_expression(now):
+    """
+    То же, что percent_for, но SQL-выражением над строкой shop_product
+    (категория — коррелированным подзапросом: в UPDATE join нельзя).
+    """
+    category_percent = Subquery(
+        Category.objects
+        .filter(_window_q(now, active="discount_active"), pk=OuterRef("category_id"))
+        .values("discount_percent")[:1]
+    )
+    return Case(
+        When(_window_q(now), then=F("discount_percent")),
+        default=Coalesce(category_percent, Value(0)),
+        output_field=PositiveSmallIntegerField(),
+    )
+
+
+def _discounted(field):
+    return Floor(ExpressionWrapper(
+        F(field) * (Value(100) - F("effective_discount")) / Value(100),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+def recompute(products, now=None):
+    """
+    Пересчитать effective_* для набора товаров (queryset) двумя UPDATE
+    без обхода вариантов: процент скидки, затем цены от min_price/max_price
+    (скидка одна на товар, поэтому min от цен со скидкой = скидка от min).
+    """
+    now = now or timezone.now()
+    products.update(effective_discount=percent_expression(now))
+    return products.update(
+        effective_min_price=_discounted("min_price"),
+        effective_max_price=_discounted("max_price"),
+    )
+
+
+# id в одном IN (...)
+CHUNK = 500
+
+
+def recompute_ids(product_ids, now=None):
+    product_ids = list(product_ids)
+    for i in range(0, len(product_ids), CHUNK):
+        recompute(Product.objects.filter(pk__in=product_ids[i:i + CHUNK]), now)
+
+
+def _passed(since, now, prefix=""):
+    # граница окна пройдена в (since, now]: окно открылось (start) или закрылось (end);
+    # window_open включает обе границы, поэтому закрытие — end в [since, now)
+    return (
+        Q(**{f"{prefix}discount_start__gt": since, f"{prefix}discount_start__lte": now})
+        | Q(**{f"{prefix}discount_end__gte": since, f"{prefix}discount_end__lt": now})
+    )
+
+
+def stale(now=None, since=None):
+    """
+    Товары, у которых окно скидки (своё или категории) открылось/закрылось
+    после последнего пересчёта: сохранённый процент не совпадает с текущим.
+
+    since — момент прошлой проверки: тогда смотрим только товары и категории
+    с границей окна в (since, now] (индексы по discount_start/discount_end),
+    без since — все товары. Правки самих скидок пересчитывают сигналы.
+    """
+    now = now or timezone.now()
+    products = Product.objects.all()
+    if since is not None:
+        categories = Category.objects.filter(_passed(since, now)).values("id")
+        products = products.filter(_passed(since, now) | Q(category_id__in=categories))
+    return (
+        products
+        .annotate(current_discount=percent_expression(now))
+        .exclude(effective_discount=F("current_discount"))
+    )
+
+
+def apply_windows(now=None):
+    """
+    Для планировщика: пересчитать ровно затронутые товары и сдвинуть версии
+    каталога их магазинов (кеш страниц, ETag). Возвращает {store_id: кол-во}.
+    Первый запуск (нет DiscountWindowRun) проверяет все товары, следующие —
+    только границы окон после прошлого.
+    """
+    now = now or timezone.now()
+    affected = {}
+    with transaction.atomic():
+        # строка отметки под блокировкой: параллельный запуск ждёт этот
+        run = DiscountWindowRun.objects.select_for_update().order_by("pk").first()
+        since = run.checked_at if run is not None else None
+        if run is None:
+            DiscountWindowRun.objects.create(checked_at=now)
+        elif since < now:
+            DiscountWindowRun.objects.filter(pk=run.pk).update(checked_at=now)
+
+        for pk, store_id in stale(now, since).values_list("id", "store_id"):
+            affected.setdefault(store_id, []).append(pk)
+        if not affected:
+            return {}
+
+        for store_id, ids in affected.items():
+            recompute_ids(ids, now)
+            for i in range(0, len(ids), CHUNK):
+                Product.objects.filter(pk__in=ids[i:i + CHUNK]).update(updated_at=now)
+            catalog.bump(
+                store_id,
+                on_commit=lambda version, store_id=store_id: bitmap_index.advance(store_id, version),
+            )
+    return {store_id: len(ids) for store_id, ids in affected.items()}
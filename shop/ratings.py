@@ -0,0 +1,84 @@
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from .models import Product, ProductReview
+
+
+STARS = (1, 2, 3, 4, 5)
+
+
+def star_field(star):
+    return f"rating_{star}"
+
+
+def _avg(sum_delta, count_delta):
+    # считается от старых значений строки в том же UPDATE
+    return Coalesce(
+        Cast(F("rating_sum") + Value(sum_delta), FloatField())
+        / NullIf(F("rating_count") + Value(count_delta), Value(0)),
+        Value(0.0),
+    )
+
+
+def apply(product_id, add=None, remove=None):
+    """
+    Применить изменение одного отзыва к агрегатам товара одним UPDATE
+    с F()-дельтами: add — оценка, которая начала учитываться,
+    remove — оценка, которая перестала (опубликованные отзывы).
+    """
+    if add == remove:
+        return
+    sum_delta = (add or 0) - (remove or 0)
+    count_delta = (1 if add else 0) - (1 if remove else 0)
+
+    updates = {
+        "rating_sum": F("rating_sum") + sum_delta,
+        "rating_count": F("rating_count") + count_delta,
+        "rating_avg": _avg(sum_delta, count_delta),
+        "updated_at": timezone.now(),
+    }
+    if add:
+        updates[star_field(add)] = F(star_field(add)) + 1
+    if remove:
+        updates[star_field(remove)] = F(star_field(remove)) - 1
+    Product.objects.filter(pk=product_id).update(**updates)
+
+
+def recompute(product_ids=None):
+    """
+    Полный пересчёт агрегатов по опубликованным отзывам (для ремонта):
+    один GROUP BY по отзывам + bulk_update. Без product_ids — все товары.
+    """
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+
+    stats = {
+        row["product_id"]: row
+        for row in (
+            ProductReview.objects
+            .filter(is_published=True, product__in=products)
+            .order_by()
+            .values("product_id")
+            .annotate(
+                total=Sum("rating"),
+                cnt=Count("id"),
+                **{f"s{star}": Count("id", filter=Q(rating=star)) for star in STARS},
+            )
+        )
+    }
+
+    fields = ["rating_sum", "rating_count", "rating_avg", *(star_field(s) for s in STARS)]
+    batch = []
+    for product in products.only("id", *fields).iterator(chunk_size=500):
+        row = stats.get(product.pk, {})
+        product.rating_sum = row.get("total") or 0
+        product.rating_count = row.get("cnt") or 0
+        product.rating_avg = round(product.rating_sum / product.rating_count, 2) if product.rating_count else 0
+        for star in STARS:
+            setattr(product, star_field(star), row.get(f"s{star}") or 0)
+        batch.append(product)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, fields)
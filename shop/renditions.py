@@ -0,0 +1,168 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import ImageRendition, Product, ProductImage
+from . import bitmap_index
+from . import catalog
+
+
+logger = logging.getLogger(__name__)
+
+# ширина каждой копии, px (меньше оригинала — не увеличиваем)
+WIDTHS = {
+    ImageRendition.THUMB: 160,
+    ImageRendition.CARD: 480,
+    ImageRendition.ZOOM: 1400,
+}
+
+# формат -> (mime, параметры Pillow)
+FORMATS = {
+    "avif": ("image/avif", {"quality": 55}),
+    "webp": ("image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# jpeg — последний: это fallback для <img>
+FALLBACK = "jpeg"
+
+
+def enabled_formats():
+    wanted = getattr(settings, "IMAGE_RENDITION_FORMATS", ("webp", "jpeg"))
+    out = [f for f in wanted if f in FORMATS and (f == "jpeg" or features.check(f))]
+    if FALLBACK not in out:
+        out.append(FALLBACK)
+    return out
+
+
+def _open(field):
+    field.open("rb")
+    try:
+        img = Image.open(field)
+        img.load()
+    finally:
+        field.close()
+    # фото с телефонов повернуты через EXIF
+    return ImageOps.exif_transpose(img)
+
+
+def _flatten(img):
+    if img.mode in ("RGB", "L"):
+        return img.convert("RGB")
+    # прозрачность — на белый фон (jpeg её не умеет, для карточек так и нужно)
+    rgba = img.convert("RGBA")
+    bg = Image.new("RGB", rgba.size, (255, 255, 255))
+    bg.paste(rgba, mask=rgba.split()[-1])
+    return bg
+
+
+def render(image_id):
+    """
+    Сгенерировать все копии одного изображения (синхронно).
+    Старые копии заменяются. Возвращает кол-во созданных файлов.
+    """
+    pi = ProductImage.objects.filter(pk=image_id).select_related("product").first()
+    if pi is None or not pi.image:
+        return 0
+
+    src = _flatten(_open(pi.image))
+    width, height = src.size
+    base = os.path.splitext(os.path.basename(pi.image.name))[0]
+
+    created = []
+    for kind, target in WIDTHS.items():
+        w = min(target, width)
+        h = max(1, round(height * w / width))
+        resized = src if w == width else src.resize((w, h), Image.Resampling.LANCZOS)
+        for fmt in enabled_formats():
+            _mime, params = FORMATS[fmt]
+            buf = io.BytesIO()
+            resized.save(buf, format=fmt.upper(), **params)
+            r = ImageRendition(image=pi, kind=kind, format=fmt, width=w, height=h)
+            r.file.save(f"{base}-{kind}.{fmt}", ContentFile(buf.getvalue()), save=False)
+            created.append(r)
+
+    now = timezone.now()
+    with transaction.atomic():
+        if not ProductImage.objects.filter(pk=pi.pk).update(width=width, height=height, renditions_ready=True):
+            # фото удалили, пока считали копии
+            transaction.on_commit(lambda: delete_files([r.file.name for r in created]))
+            return 0
+        old = list(ImageRendition.objects.filter(image=pi).values_list("file", flat=True))
+        ImageRendition.objects.filter(image=pi).delete()
+        ImageRendition.objects.bulk_create(created)
+        # страницы с оригиналами заменяем: updated_at (ETag) + версия каталога (кеш страниц);
+        # фильтров витрины фото не меняют — битмап-индексу только новая версия
+        Product.objects.filter(pk=pi.product_id).update(updated_at=now)
+        store_id = pi.product.store_id
+        catalog.bump(store_id, on_commit=lambda version: bitmap_index.advance(store_id, version))
+        transaction.on_commit(lambda: delete_files(old))
+    return len(created)
+
+
+def delete_files(names):
+    storage = ImageRendition._meta.get_field("file").storage
+    for name in names:
+        if name:
+            try:
+                storage.delete(name)
+            except OSError:
+                logger.warning("can't delete rendition %s", name)
+
+
+# ---- пул воркеров: обработка вне запроса ----
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, "IMAGE_RENDITION_WORKERS", 2),
+                thread_name_prefix="renditions",
+            )
+        return _pool
+
+
+def _job(image_id):
+    close_old_connections()
+    try:
+        return render(image_id)
+    except Exception:
+        logger.exception("rendition failed for image %s", image_id)
+        return 0
+    finally:
+        close_old_connections()
+
+
+def schedule(image_ids):
+    """
+    Поставить изображения в очередь пула после коммита транзакции.
+    До готовности шаблоны показывают оригинал.
+    """
+    image_ids = [i for i in image_ids if i]
+    if not image_ids:
+        return
+    if not getattr(settings, "IMAGE_RENDITION_ASYNC", True):
+        transaction.on_commit(lambda: [render(i) for i in image_ids])
+        return
+    transaction.on_commit(lambda: [_get_pool().submit(_job, i) for i in image_ids])
+
+
+def srcset(image, fmt):
+    """
+    [(url, width), ...] копий изображения в формате fmt, по возрастанию ширины.
+    renditions берутся из prefetch, если он был.
+    """
+    out = [(r.file.url, r.width) for r in image.renditions.all() if r.format == fmt]
+    return sorted(out, key=lambda item: item[1])
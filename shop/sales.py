@@ -0,0 +1,273 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Sum, Value, When
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Order, OrderItem
+
+
+# отменённые заказы в продажи не входят
+EXCLUDED = {"cancelled"}
+
+# окна графиков дашборда (дней); длинное — помесячно
+PERIODS = (7, 30, 365)
+MONTHLY_FROM = 60
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+# только прибавление: у отрицательной строки INSERT не прошёл бы CHECK (>= 0)
+DAILY_SQL = """
+INSERT INTO shop_dailysales (store_id, day, orders, items, revenue) VALUES (%s, %s, %s, %s, %s)
+ON CONFLICT (store_id, day) DO UPDATE SET
+    orders = shop_dailysales.orders + excluded.orders,
+    items = shop_dailysales.items + excluded.items,
+    revenue = shop_dailysales.revenue + excluded.revenue
+"""
+
+PRODUCT_SQL = """
+INSERT INTO shop_dailyproductsales (store_id, product_id, day, quantity, revenue) VALUES {values}
+ON CONFLICT (store_id, product_id, day) DO UPDATE SET
+    quantity = shop_dailyproductsales.quantity + excluded.quantity,
+    revenue = shop_dailyproductsales.revenue + excluded.revenue
+"""
+
+
+def counted(status):
+    return status not in EXCLUDED
+
+
+def _day(order):
+    return timezone.localdate(order.created_at)
+
+
+def _lines(order_id):
+    """
+    [(product_id, quantity, revenue)] строк заказа — один GROUP BY.
+    Вариант удалён (variant=NULL) — product_id None: в итоги дня идёт, в товары нет.
+    """
+    return list(
+        OrderItem.objects.filter(order_id=order_id)
+        .order_by()
+        .values("variant__product_id")
+        .annotate(q=Sum("quantity"), r=Sum(ExpressionWrapper(F("price") * F("quantity"), output_field=MONEY)))
+        .values_list("variant__product_id", "q", "r")
+    )
+
+
+def apply(store_id, day, lines, sign=1, orders=1):
+    """
+    Добавить (sign=1) или вычесть (sign=-1) из дневных итогов orders заказов
+    (1 — заказ целиком, 0 — правка строк уже учтённого заказа) и их строки:
+    lines — [(product_id, quantity, revenue)].
+    """
+    if not lines and not orders:
+        return
+    items = sum(q for _p, q, _r in lines)
+    revenue = sum((Decimal(r) for _p, _q, r in lines), Decimal(0))
+    products = [(p, q, Decimal(r)) for p, q, r in lines if p]
+
+    if sign < 0:
+        # вычитаем только из строк, которые это выдержат: неучтённый заказ
+        # не должен «съесть» итоги дня вместе с чужими заказами
+        DailySales.objects.filter(store_id=store_id, day=day, orders__gte=orders, items__gte=items).update(
+            orders=F("orders") - orders, items=F("items") - items, revenue=F("revenue") - revenue,
+        )
+        for product_id, quantity, product_revenue in products:
+            DailyProductSales.objects.filter(
+                store_id=store_id, product_id=product_id, day=day, quantity__gte=quantity,
+            ).update(quantity=F("quantity") - quantity, revenue=F("revenue") - product_revenue)
+        # опустевшие строки убираем — как после rebuild
+        DailySales.objects.filter(store_id=store_id, day=day, orders=0).delete()
+        DailyProductSales.objects.filter(store_id=store_id, day=day, quantity=0).delete()
+        return
+
+    day = connection.ops.adapt_datefield_value(day)
+    with connection.cursor() as cur:
+        cur.execute(DAILY_SQL, [store_id, day, orders, items, revenue])
+        if products:
+            values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(products))
+            params = [x for p, q, r in products for x in (store_id, p, day, q, r)]
+            cur.execute(PRODUCT_SQL.format(values=values), params)
+
+
+def _claim(order, value):
+    """
+    Переключить Order.in_sales (заказ учтён в итогах) условным UPDATE:
+    True — переключили мы, итоги правим; False — уже учтён/снят, ничего не делаем.
+    Повтор сигнала или гонка двух запросов не учтут заказ дважды.
+    """
+    if not Order.objects.filter(pk=order.pk, in_sales=not value).update(in_sales=value):
+        return False
+    order.in_sales = value
+    return True
+
+
+def order_placed(order, lines):
+    """
+    Новый заказ из корзины (создан с in_sales=counted): строки уже на руках
+    (снимок цен), без чтения OrderItem.
+    """
+    if order.in_sales:
+        apply(order.store_id, _day(order), lines)
+
+
+def order_created(order):
+    """
+    Заказ создан не из корзины (админка, shell): в итоги сразу как заказ,
+    его строки добавят сигналы OrderItem (line_changed).
+    """
+    if counted(order.status) and not order.in_sales and _claim(order, True):
+        apply(order.store_id, _day(order), [])
+
+
+def order_changed(order):
+    # в итоги входит/выходит только при отмене и её снятии
+    if _claim(order, counted(order.status)):
+        apply(order.store_id, _day(order), _lines(order.pk), 1 if order.in_sales else -1)
+
+
+def order_removed(order):
+    if _claim(order, False):
+        apply(order.store_id, _day(order), _lines(order.pk), -1)
+
+
+def line_changed(order_id, old=None, new=None):
+    """
+    Строка заказа добавлена/изменена/удалена через ORM (админка):
+    old/new — (product_id, quantity, revenue). Трогает итоги, только если
+    заказ в них учтён.
+    """
+    row = Order.objects.filter(pk=order_id, in_sales=True).values_list("store_id", "created_at").first()
+    if row is None:
+        return
+    store_id, day = row[0], timezone.localdate(row[1])
+    if old:
+        apply(store_id, day, [old], -1, orders=0)
+    if new:
+        apply(store_id, day, [new], orders=0)
+
+
+def rebuild(store_id, since=None):
+    """
+    Пересобрать итоги магазина (с даты since или целиком) из Order/OrderItem.
+    Возвращает кол-во дней с продажами.
+    """
+    orders = Order.objects.filter(store_id=store_id).exclude(status__in=EXCLUDED)
+    items = OrderItem.objects.filter(order__store_id=store_id).exclude(order__status__in=EXCLUDED)
+    daily = DailySales.objects.filter(store_id=store_id)
+    per_product = DailyProductSales.objects.filter(store_id=store_id)
+    if since:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        orders = orders.filter(created_at__gte=start)
+        items = items.filter(order__created_at__gte=start)
+        daily = daily.filter(day__gte=since)
+        per_product = per_product.filter(day__gte=since)
+
+    line_total = ExpressionWrapper(F("price") * F("quantity"), output_field=MONEY)
+    days = {
+        row["d"]: DailySales(store_id=store_id, day=row["d"], orders=row["n"])
+        for row in orders.annotate(d=TruncDate("created_at")).order_by().values("d").annotate(n=Count("id"))
+    }
+    products = []
+    for row in (
+        items.annotate(d=TruncDate("order__created_at")).order_by()
+        .values("d", "variant__product_id")
+        .annotate(q=Sum("quantity"), r=Sum(line_total))
+    ):
+        rollup = days[row["d"]]
+        rollup.items += row["q"]
+        rollup.revenue += row["r"]
+        if row["variant__product_id"]:
+            products.append(DailyProductSales(
+                store_id=store_id, product_id=row["variant__product_id"], day=row["d"],
+                quantity=row["q"], revenue=row["r"],
+            ))
+
+    daily.delete()
+    per_product.delete()
+    # отметки «учтён в итогах» — как у пересчёта: все неотменённые заказы окна
+    window = Order.objects.filter(store_id=store_id)
+    if since:
+        window = window.filter(created_at__gte=start)
+    window.update(in_sales=Case(When(status__in=EXCLUDED, then=Value(False)), default=Value(True)))
+    DailySales.objects.bulk_create(days.values(), batch_size=500)
+    DailyProductSales.objects.bulk_create(products, batch_size=500)
+    return len(days)
+
+
+# ---- чтение для дашборда: только таблицы итогов ----
+def _window(days, today=None):
+    end = today or timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+def _totals(store_id, start, end):
+    row = DailySales.objects.filter(store_id=store_id, day__gte=start, day__lte=end).aggregate(
+        orders=Sum("orders"), items=Sum("items"), revenue=Sum("revenue"),
+    )
+    orders = row["orders"] or 0
+    revenue = row["revenue"] or Decimal(0)
+    return {
+        "orders": orders,
+        "items": row["items"] or 0,
+        "revenue": revenue,
+        "avg_basket": (revenue / orders).quantize(Decimal("0.01")) if orders else Decimal(0),
+    }
+
+
+def _series(store_id, start, end, monthly):
+    qs = DailySales.objects.filter(store_id=store_id, day__gte=start, day__lte=end).order_by()
+    if monthly:
+        rows = {
+            row["m"]: row
+            for row in qs.annotate(m=TruncMonth("day")).values("m")
+            .annotate(orders=Sum("orders"), items=Sum("items"), revenue=Sum("revenue"))
+        }
+        keys, cur = [], start.replace(day=1)
+        while cur <= end:
+            keys.append(cur)
+            cur = (cur + timedelta(days=32)).replace(day=1)
+    else:
+        rows = {row["day"]: row for row in qs.values("day", "orders", "items", "revenue")}
+        keys = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+    # дни без продаж — нули, чтобы ось графика была сплошной
+    return [
+        {
+            "date": key.isoformat(),
+            "orders": rows[key]["orders"] if key in rows else 0,
+            "items": rows[key]["items"] if key in rows else 0,
+            "revenue": str(rows[key]["revenue"]) if key in rows else "0",
+        }
+        for key in keys
+    ]
+
+
+def top_products(store_id, start, end, limit=5):
+    return list(
+        DailyProductSales.objects.filter(store_id=store_id, day__gte=start, day__lte=end)
+        .order_by()
+        .values("product_id", "product__name")
+        .annotate(quantity=Sum("quantity"), revenue=Sum("revenue"))
+        .order_by("-revenue", "product_id")[:limit]
+    )
+
+
+def report(store_id, days, today=None):
+    """
+    Всё для графиков за days дней: ряд (по дням, для длинного окна — по месяцам),
+    итоги, итоги предыдущего такого же окна (тренд) и топ товаров.
+    """
+    start, end = _window(days, today)
+    prev_start, prev_end = start - timedelta(days=days), start - timedelta(days=1)
+    return {
+        "days": days,
+        "bucket": "month" if days >= MONTHLY_FROM else "day",
+        "series": _series(store_id, start, end, days >= MONTHLY_FROM),
+        "totals": _totals(store_id, start, end),
+        "previous": _totals(store_id, prev_start, prev_end),
+        "top": top_products(store_id, start, end),
+    }
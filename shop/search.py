@@ -0,0 +1,159 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+
+FTS_TABLE = "shop_product_fts"
+
+# сколько лучших по релевантности товаров отдаёт поиск
+SEARCH_LIMIT = 1000
+
+# веса колонок для bm25: name, description, brand, category, material, country, skus
+BM25_WEIGHTS = (10.0, 1.0, 4.0, 4.0, 2.0, 1.0, 6.0)
+
+CREATE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, description, brand, category, material, country, skus,
+    store_id UNINDEXED,
+    tokenize = "unicode61 remove_diacritics 2",
+    prefix = '2 3'
+)
+"""
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def available():
+    return connection.vendor == "sqlite"
+
+
+def _fold(col):
+    # unicode61 не считает "ё" диакритикой — сводим к "е" сами (и в запросе тоже)
+    return f"replace(replace(COALESCE({col}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+INSERT_SQL = f"""
+INSERT INTO {FTS_TABLE}(rowid, name, description, brand, category, material, country, skus, store_id)
+SELECT
+    p.id,
+    {_fold("p.name")},
+    {_fold("p.description")},
+    {_fold("b.name")},
+    {_fold("c.name")},
+    {_fold("p.material")},
+    {_fold("p.country")},
+    {_fold("(SELECT group_concat(v.sku, ' ') FROM shop_productvariant v WHERE v.product_id = p.id AND v.is_active)")},
+    p.store_id
+FROM shop_product p
+LEFT JOIN shop_brand b ON b.id = p.brand_id
+LEFT JOIN shop_category c ON c.id = p.category_id
+WHERE p.is_active AND {{where}}
+"""
+
+
+# id в одном IN (...)
+CHUNK = 500
+
+
+def _chunks(product_ids):
+    product_ids = [int(i) for i in product_ids]
+    for i in range(0, len(product_ids), CHUNK):
+        part = product_ids[i:i + CHUNK]
+        yield ", ".join(["%s"] * len(part)), part
+
+
+def reindex(product_ids):
+    """
+    Переиндексировать товары по id (удалить + вставить заново одним INSERT ... SELECT).
+    Неактивные товары из индекса просто пропадают.
+    """
+    if not available() or not product_ids:
+        return
+    with connection.cursor() as cur:
+        for marks, params in _chunks(product_ids):
+            cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", params)
+            cur.execute(INSERT_SQL.format(where=f"p.id IN ({marks})"), params)
+
+
+def remove(product_ids):
+    if not available() or not product_ids:
+        return
+    with connection.cursor() as cur:
+        for marks, params in _chunks(product_ids):
+            cur.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", params)
+
+
+def reindex_where(field, value):
+    """
+    Переиндексировать все товары с category_id/brand_id = value
+    (переименование категории/бренда).
+    """
+    if not available():
+        return
+    assert field in ("category_id", "brand_id")
+    with connection.cursor() as cur:
+        cur.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT id FROM shop_product WHERE {field} = %s)",
+            [value],
+        )
+        cur.execute(INSERT_SQL.format(where=f"p.{field} = %s"), [value])
+
+
+def rebuild(store_id=None):
+    if not available():
+        return
+    with connection.cursor() as cur:
+        cur.execute(CREATE_SQL)
+        if store_id is None:
+            cur.execute(f"DELETE FROM {FTS_TABLE}")
+            cur.execute(INSERT_SQL.format(where="1"))
+        else:
+            cur.execute(f"DELETE FROM {FTS_TABLE} WHERE store_id = %s", [store_id])
+            cur.execute(INSERT_SQL.format(where="p.store_id = %s"), [store_id])
+
+
+def match_query(text):
+    """
+    Пользовательский ввод -> выражение FTS5: каждое слово как префикс, все через AND.
+    Кавычки/операторы из ввода не пропускаем — только токены.
+    """
+    text = (text or "").replace("ё", "е").replace("Ё", "Е")
+    tokens = TOKEN_RE.findall(text)[:10]
+    return " AND ".join(f'"{t}"*' for t in tokens)
+
+
+def search(store_id, text, limit=SEARCH_LIMIT):
+    """
+    id товаров магазина по релевантности (bm25), не больше limit.
+    Без FTS5 (не sqlite) — запасной вариант через icontains.
+    """
+    query = match_query(text)
+    if not query:
+        return []
+
+    if not available():
+        text = text.strip()
+        return list(
+            Product.objects.filter(store_id=store_id, is_active=True)
+            .filter(
+                Q(name__icontains=text) | Q(description__icontains=text)
+                | Q(brand__name__icontains=text) | Q(category__name__icontains=text)
+                | Q(variants__sku__icontains=text)
+            )
+            .order_by("-created_at")
+            .values_list("id", flat=True)
+            .distinct()[:limit]
+        )
+
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"SELECT rowid FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND store_id = %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+            [query, store_id, limit],
+        )
+        return [row[0] for row in cur.fetchall()]
@@ -1,28 +1,622 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from django.db.models import Avg, Count
+from django.db import transaction
 
-from .models import ProductReview, Product
+from .models import (
+    ProductReview, Product, Store, ProductVariant, Category, Brand, Gender, ProductColor, FacetCount,
+    ProductImage, Favorite, UserProfile, CartItem, Order, OrderItem,
+)
+from .store_cache import store_cache
+from django.utils import timezone
+from . import facets
+from . import catalog
+from . import bitmap_index
+from . import search
+from . import trigram
+from . import favorites
+from . import pricing
+from . import ratings
+from . import renditions
+from . import blobs
+from . import carts
+from . import orders
+from . import sales
+from . import variants
 
 
-def recalc_product_rating(product_id: int):
-    qs = ProductReview.objects.filter(product_id=product_id, is_published=True)
-    agg = qs.aggregate(avg=Avg("rating"), cnt=Count("id"))
+# --- рейтинг товара: дельты вместо пересчёта Avg/Count ---
+def _review_weight(rating, is_published):
+    return rating if is_published else None
 
-    avg = agg["avg"] or 0
-    cnt = agg["cnt"] or 0
 
-    Product.objects.filter(id=product_id).update(
-        rating_avg=avg,
-        rating_count=cnt
-    )
+@receiver(pre_save, sender=ProductReview)
+def review_remember(sender, instance, **kwargs):
+    instance._old_review = None
+    if instance.pk:
+        instance._old_review = (
+            ProductReview.objects.filter(pk=instance.pk)
+            .values_list("product_id", "rating", "is_published")
+            .first()
+        )
+
+
+def _review_changed(product_id):
+    store_id = Product.objects.filter(pk=product_id).values_list("store_id", flat=True).first()
+    if store_id:
+        _bump_product(store_id, product_id)
 
 
 @receiver(post_save, sender=ProductReview)
 def review_saved(sender, instance, **kwargs):
-    recalc_product_rating(instance.product_id)
+    new = _review_weight(instance.rating, instance.is_published)
+    old_product_id, old = instance.product_id, None
+    if getattr(instance, "_old_review", None):
+        old_product_id, rating, is_published = instance._old_review
+        old = _review_weight(rating, is_published)
+
+    if old_product_id != instance.product_id:
+        ratings.apply(old_product_id, remove=old)
+        ratings.apply(instance.product_id, add=new)
+        _review_changed(old_product_id)
+    elif old == new:
+        return
+    else:
+        ratings.apply(instance.product_id, add=new, remove=old)
+    _review_changed(instance.product_id)
 
 
 @receiver(post_delete, sender=ProductReview)
 def review_deleted(sender, instance, **kwargs):
-    recalc_product_rating(instance.product_id)
+    # вместе с товаром/магазином — агрегаты удаляются с ним
+    if _origin_model(kwargs) in (Product, Store):
+        return
+    if instance.is_published:
+        ratings.apply(instance.product_id, remove=instance.rating)
+        _review_changed(instance.product_id)
+
+
+# --- кеш резолва магазина по поддомену ---
+@receiver(pre_save, sender=Store)
+def store_remember_subdomain(sender, instance, **kwargs):
+    # поддомен мог смениться — запоминаем старый, чтобы сбросить и его
+    instance._old_subdomain = None
+    if instance.pk:
+        instance._old_subdomain = (
+            Store.objects.filter(pk=instance.pk).values_list("subdomain", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Store)
+def store_saved(sender, instance, **kwargs):
+    # после коммита: иначе параллельный запрос успеет закешировать старую строку
+    subdomains = (instance.subdomain, getattr(instance, "_old_subdomain", None))
+    transaction.on_commit(lambda: store_cache.invalidate(*subdomains))
+
+
+@receiver(post_delete, sender=Store)
+def store_deleted(sender, instance, **kwargs):
+    subdomain = instance.subdomain
+    transaction.on_commit(lambda: store_cache.invalidate(subdomain))
+
+
+# --- счётчики фильтров витрины (FacetCount) ---
+PRODUCT_FACET_FIELDS = {"category", "category_id", "brand", "brand_id", "gender", "gender_id", "is_active"}
+VARIANT_FACET_FIELDS = {"color", "color_id", "size", "is_active"}
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & fields)
+
+
+def _origin_model(kwargs):
+    origin = kwargs.get("origin")
+    return getattr(origin, "model", type(origin))
+
+
+def _variant_recomputed(kwargs):
+    # вариант удалён каскадом от товара/магазина или из variants.bulk_write —
+    # товар пересчитывается там, один раз
+    return _origin_model(kwargs) in (Product, Store) or variants.in_bulk_delete()
+
+
+@receiver(pre_save, sender=Product)
+def product_remember_facets(sender, instance, update_fields=None, **kwargs):
+    instance._old_facets = None
+    if instance.pk and _touches(update_fields, PRODUCT_FACET_FIELDS):
+        instance._old_facets = (
+            Product.objects.filter(pk=instance.pk)
+            .values("category_id", "brand_id", "gender_id", "is_active")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def product_facets_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not _touches(update_fields, PRODUCT_FACET_FIELDS):
+        return
+
+    old = getattr(instance, "_old_facets", None) or {}
+    if old and all(old[f] == getattr(instance, f) for f in old):
+        return
+
+    # цвета/размеры меняются только если товар включили/выключили
+    with_variants = bool(old) and old["is_active"] != instance.is_active
+    keys = facets.merge_keys(
+        facets.product_keys(instance, variants=with_variants),
+        {
+            facets.CATEGORY: {old.get("category_id")},
+            facets.BRAND: {old.get("brand_id")},
+            facets.GENDER: {old.get("gender_id")},
+        },
+    )
+    facets.refresh(instance.store_id, keys)
+
+
+@receiver(pre_delete, sender=Product)
+def product_remember_facets_delete(sender, instance, **kwargs):
+    instance._old_facets = facets.product_keys(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_facets_deleted(sender, instance, **kwargs):
+    if _origin_model(kwargs) is Store:
+        return
+    facets.refresh(instance.store_id, getattr(instance, "_old_facets", None) or {})
+
+
+@receiver(pre_save, sender=ProductVariant)
+def variant_remember_facets(sender, instance, update_fields=None, **kwargs):
+    instance._old_facets = None
+    if instance.pk and _touches(update_fields, VARIANT_FACET_FIELDS):
+        instance._old_facets = (
+            ProductVariant.objects.filter(pk=instance.pk)
+            .values("color_id", "size", "is_active")
+            .first()
+        )
+
+
+def _variant_keys(variant, old=None):
+    old = old or {}
+    product = variant.product
+    return facets.merge_keys(
+        facets.product_keys(product, variants=False),
+        {
+            facets.COLOR: {variant.color_id, old.get("color_id")},
+            facets.SIZE: {variant.size, old.get("size")},
+        },
+    )
+
+
+@receiver(post_save, sender=ProductVariant)
+def variant_facets_saved(sender, instance, update_fields=None, **kwargs):
+    if not _touches(update_fields, VARIANT_FACET_FIELDS):
+        return
+
+    old = getattr(instance, "_old_facets", None) or {}
+    if old and all(old[f] == getattr(instance, f) for f in old):
+        return
+
+    facets.refresh(instance.product.store_id, _variant_keys(instance, old))
+
+
+@receiver(post_delete, sender=ProductVariant)
+def variant_facets_deleted(sender, instance, **kwargs):
+    # каскад от товара/магазина пересчитывается на уровне товара
+    if _variant_recomputed(kwargs):
+        return
+    facets.refresh(instance.product.store_id, _variant_keys(instance))
+
+
+@receiver(post_save, sender=Category)
+def category_facets_saved(sender, instance, **kwargs):
+    facets.refresh(instance.store_id, {facets.CATEGORY: {instance.pk}})
+
+
+@receiver(post_delete, sender=Category)
+def category_facets_deleted(sender, instance, **kwargs):
+    FacetCount.objects.filter(store_id=instance.store_id, facet=facets.CATEGORY, key=str(instance.pk)).delete()
+
+
+@receiver(post_save, sender=Brand)
+def brand_facets_saved(sender, instance, **kwargs):
+    facets.refresh(instance.store_id, {facets.BRAND: {instance.pk}})
+
+
+@receiver(post_delete, sender=Brand)
+def brand_facets_deleted(sender, instance, **kwargs):
+    FacetCount.objects.filter(store_id=instance.store_id, facet=facets.BRAND, key=str(instance.pk)).delete()
+
+
+@receiver(post_save, sender=Gender)
+def gender_facets_saved(sender, instance, created, **kwargs):
+    if created:
+        facets.ensure_gender_rows()
+    else:
+        FacetCount.objects.filter(facet=facets.GENDER, key=str(instance.pk)).update(label=instance.name)
+
+
+@receiver(post_delete, sender=Gender)
+def gender_facets_deleted(sender, instance, **kwargs):
+    FacetCount.objects.filter(facet=facets.GENDER, key=str(instance.pk)).delete()
+
+
+@receiver(post_save, sender=ProductColor)
+def color_facets_saved(sender, instance, **kwargs):
+    FacetCount.objects.filter(facet=facets.COLOR, key=str(instance.pk)).update(
+        label=instance.name, hex=instance.hex
+    )
+
+
+@receiver(post_save, sender=Store)
+def store_facets_saved(sender, instance, created, **kwargs):
+    if created:
+        facets.ensure_gender_rows([instance.pk])
+
+
+# --- версия каталога магазина + битмап-индекс витрины ---
+def _bump_product(store_id, product_id):
+    catalog.bump(
+        store_id,
+        on_commit=lambda version: bitmap_index.product_changed(store_id, product_id, version),
+    )
+
+
+def _bump_store(store_id, rebuild=False):
+    # без rebuild — только сдвинуть версию индекса; rebuild — выбросить индекс
+    def _apply(version):
+        if rebuild:
+            bitmap_index.drop(store_id)
+        else:
+            bitmap_index.advance(store_id, version)
+
+    catalog.bump(store_id, on_commit=_apply)
+
+
+@receiver(post_save, sender=Product)
+def product_catalog_saved(sender, instance, **kwargs):
+    _bump_product(instance.store_id, instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def product_catalog_deleted(sender, instance, **kwargs):
+    if _origin_model(kwargs) is Store:
+        return
+    _bump_product(instance.store_id, instance.pk)
+
+
+@receiver(post_save, sender=ProductVariant)
+def variant_catalog_saved(sender, instance, **kwargs):
+    _bump_product(instance.product.store_id, instance.product_id)
+
+
+@receiver(post_delete, sender=ProductVariant)
+def variant_catalog_deleted(sender, instance, **kwargs):
+    if _variant_recomputed(kwargs):
+        return
+    _bump_product(instance.product.store_id, instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def taxonomy_catalog_saved(sender, instance, **kwargs):
+    _bump_store(instance.store_id)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+def taxonomy_catalog_deleted(sender, instance, **kwargs):
+    # товары получили category/brand = NULL массовым UPDATE — индекс пересобираем
+    if _origin_model(kwargs) is Store:
+        return
+    _bump_store(instance.store_id, rebuild=True)
+
+
+@receiver(post_delete, sender=Gender)
+def gender_catalog_deleted(sender, instance, **kwargs):
+    catalog.bump_all()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def image_catalog_changed(sender, instance, **kwargs):
+    # фото не влияет на битмап-индекс, но меняет страницы (кеш страниц по версии)
+    if _origin_model(kwargs) in (Product, Store):
+        return
+    _bump_store(instance.product.store_id)
+
+
+@receiver(post_save, sender=Store)
+def store_catalog_saved(sender, instance, created, **kwargs):
+    # название/слоган/телефон магазина выводятся на каждой странице витрины
+    if not created:
+        _bump_store(instance.pk)
+
+
+# --- полнотекстовый поиск (FTS5) ---
+SEARCH_PRODUCT_FIELDS = {
+    "name", "description", "country", "material", "is_active",
+    "category", "category_id", "brand", "brand_id",
+}
+SEARCH_VARIANT_FIELDS = {"sku", "is_active"}
+
+
+@receiver(post_save, sender=Product)
+def product_search_saved(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, SEARCH_PRODUCT_FIELDS):
+        search.reindex([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_search_deleted(sender, instance, **kwargs):
+    search.remove([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+def variant_search_saved(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, SEARCH_VARIANT_FIELDS):
+        search.reindex([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductVariant)
+def variant_search_deleted(sender, instance, **kwargs):
+    if _variant_recomputed(kwargs):
+        return
+    search.reindex([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+def category_search_saved(sender, instance, created, **kwargs):
+    if not created:
+        search.reindex_where("category_id", instance.pk)
+
+
+@receiver(post_save, sender=Brand)
+def brand_search_saved(sender, instance, created, **kwargs):
+    if not created:
+        search.reindex_where("brand_id", instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Brand)
+def taxonomy_search_remember(sender, instance, **kwargs):
+    # после удаления у товаров будет NULL — запоминаем, кого переиндексировать
+    instance._search_product_ids = list(instance.products.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+def taxonomy_search_deleted(sender, instance, **kwargs):
+    if _origin_model(kwargs) is Store:
+        return
+    search.reindex(getattr(instance, "_search_product_ids", None))
+
+
+# --- триграммы для поиска в дашборде ---
+@receiver(post_save, sender=Product)
+def product_trigram_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or _touches(update_fields, {"name"}):
+        trigram.index_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+def variant_trigram_saved(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, {"sku"}):
+        trigram.index_products([instance.product_id])
+
+
+@receiver(post_delete, sender=ProductVariant)
+def variant_trigram_deleted(sender, instance, **kwargs):
+    if _variant_recomputed(kwargs):
+        return
+    trigram.index_products([instance.product_id])
+
+
+# --- отметки времени для conditional GET ---
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product(sender, instance, **kwargs):
+    # страница товара включает варианты и фото — двигаем Product.updated_at
+    if _variant_recomputed(kwargs):
+        return
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# --- итоги корзины (shop.carts) ---
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    carts.invalidate(instance.cart_id)
+
+
+# --- счётчики статусов заказов (shop.orders) ---
+@receiver(pre_save, sender=Order)
+def order_remember_status(sender, instance, **kwargs):
+    instance._old_status = None
+    if instance.pk:
+        instance._old_status = (
+            Order.objects.filter(pk=instance.pk).values_list("store_id", "status").first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def order_status_saved(sender, instance, created, **kwargs):
+    old = getattr(instance, "_old_status", None)
+    if created or not old:
+        orders.count_status(instance.store_id, new=instance.status)
+        if created:
+            sales.order_created(instance)
+    elif old[0] != instance.store_id:
+        orders.count_status(old[0], old=old[1])
+        orders.count_status(instance.store_id, new=instance.status)
+    else:
+        orders.count_status(instance.store_id, old=old[1], new=instance.status)
+        # отмена/снятие отмены — заказ выходит из дневных продаж или возвращается
+        if sales.counted(old[1]) != sales.counted(instance.status):
+            sales.order_changed(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def order_sales_deleted(sender, instance, **kwargs):
+    # до удаления: строки заказа ещё на месте; с магазином итоги удаляются сами
+    if _origin_model(kwargs) is Store:
+        return
+    sales.order_removed(instance)
+
+
+def _sales_line(item):
+    # (product_id, quantity, revenue) строки заказа — как в sales._lines
+    product_id = None
+    if item.variant_id:
+        product_id = ProductVariant.objects.filter(pk=item.variant_id).values_list("product_id", flat=True).first()
+    return product_id, item.quantity, item.price * item.quantity
+
+
+@receiver(pre_save, sender=OrderItem)
+def order_item_remember(sender, instance, **kwargs):
+    instance._sales_old = None
+    if instance.pk:
+        row = (
+            OrderItem.objects.filter(pk=instance.pk)
+            .values_list("order_id", "variant__product_id", "quantity", "price")
+            .first()
+        )
+        if row:
+            order_id, product_id, quantity, price = row
+            instance._sales_old = (order_id, (product_id, quantity, price * quantity))
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_sales_saved(sender, instance, **kwargs):
+    # строки из админки/shell; оформление из корзины пишет их bulk_create без сигналов
+    old = getattr(instance, "_sales_old", None)
+    if old and old[0] != instance.order_id:
+        sales.line_changed(old[0], old=old[1])
+        old = None
+    sales.line_changed(instance.order_id, old=old[1] if old else None, new=_sales_line(instance))
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_sales_deleted(sender, instance, **kwargs):
+    # вместе с заказом/магазином — заказ уже вычтен целиком (order_sales_deleted)
+    if _origin_model(kwargs) in (Order, Store):
+        return
+    sales.line_changed(instance.order_id, old=_sales_line(instance))
+
+
+@receiver(post_delete, sender=Order)
+def order_status_deleted(sender, instance, **kwargs):
+    # вместе с магазином — счётчики удаляются с ним
+    if _origin_model(kwargs) is Store:
+        return
+    orders.count_status(instance.store_id, old=instance.status)
+
+
+# --- кеш избранного (множество id на пользователя и магазин) ---
+@receiver(pre_save, sender=Favorite)
+def favorite_remember(sender, instance, **kwargs):
+    # запись могли перевесить на другого пользователя/магазин (админка)
+    instance._favorite_old = None
+    if instance.pk:
+        instance._favorite_old = (
+            Favorite.objects.filter(pk=instance.pk).values_list("user_id", "store_id").first()
+        )
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        favorites.added(instance.user_id, instance.store_id, instance.product_id)
+        return
+    favorites.invalidate(instance.user_id, instance.store_id)
+    old = getattr(instance, "_favorite_old", None)
+    if old and old != (instance.user_id, instance.store_id):
+        favorites.invalidate(*old)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    favorites.removed(instance.user_id, instance.store_id, instance.product_id)
+
+
+# --- материализованные цены со скидкой ---
+PRODUCT_DISCOUNT_FIELDS = {"discount_percent", "discount_is_active", "discount_start", "discount_end", "category"}
+CATEGORY_DISCOUNT_FIELDS = {"discount_percent", "discount_active", "discount_start", "discount_end"}
+
+
+@receiver(post_save, sender=Product)
+def product_prices_saved(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, PRODUCT_DISCOUNT_FIELDS):
+        pricing.recompute(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def category_prices_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created and _touches(update_fields, CATEGORY_DISCOUNT_FIELDS):
+        pricing.recompute(Product.objects.filter(category_id=instance.pk))
+
+
+@receiver(pre_delete, sender=Category)
+def category_prices_remember(sender, instance, **kwargs):
+    # после удаления category_id у товаров уже NULL — запоминаем их заранее
+    if _origin_model(kwargs) is Store:
+        return
+    instance._pricing_product_ids = list(instance.products.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_prices_deleted(sender, instance, **kwargs):
+    # скидка категории у её бывших товаров больше не действует
+    if _origin_model(kwargs) is Store:
+        return
+    pricing.recompute_ids(getattr(instance, "_pricing_product_ids", None) or [])
+
+
+# --- уменьшенные копии фото (renditions) ---
+@receiver(post_save, sender=ProductImage)
+def image_renditions_saved(sender, instance, created, update_fields=None, **kwargs):
+    if not created and not _touches(update_fields, {"image"}):
+        return
+    if not created:
+        # файл мог смениться — пока копии пересоздаются, показываем оригинал
+        ProductImage.objects.filter(pk=instance.pk).update(renditions_ready=False)
+    renditions.schedule([instance.pk])
+
+
+@receiver(pre_delete, sender=ProductImage)
+def image_renditions_remember(sender, instance, **kwargs):
+    instance._rendition_files = list(instance.renditions.values_list("file", flat=True))
+
+
+@receiver(post_delete, sender=ProductImage)
+def image_renditions_deleted(sender, instance, **kwargs):
+    files = getattr(instance, "_rendition_files", None)
+    if files:
+        transaction.on_commit(lambda: renditions.delete_files(files))
+
+
+# --- ссылки на файлы content-addressed хранилища (Blob.refcount) ---
+@receiver(pre_save, sender=ProductImage)
+@receiver(pre_save, sender=UserProfile)
+def blob_remember(sender, instance, **kwargs):
+    field = dict(blobs.FIELDS)[sender]
+    instance._old_blob = None
+    if instance.pk:
+        instance._old_blob = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=UserProfile)
+def blob_saved(sender, instance, **kwargs):
+    new = getattr(instance, dict(blobs.FIELDS)[sender]).name or None
+    old = getattr(instance, "_old_blob", None) or None
+    if new != old:
+        blobs.acquire(new)
+        blobs.release(old)
+
+
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=UserProfile)
+def blob_deleted(sender, instance, **kwargs):
+    blobs.release(getattr(instance, dict(blobs.FIELDS)[sender]).name)
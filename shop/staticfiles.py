@@ -0,0 +1,88 @@
+import gzip
+import logging
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+# что имеет смысл сжимать (шрифты woff/woff2 и картинки уже сжаты)
+COMPRESSIBLE = {
+    ".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".html", ".xml",
+    ".ico", ".ttf", ".otf", ".eot", ".webmanifest",
+}
+MIN_SIZE = 512
+# сжатая копия должна быть хотя бы на 5% меньше — иначе не пишем
+MIN_RATIO = 0.95
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz")) if brotli else (("gzip", ".gz"),)
+
+
+def compressible(name):
+    return os.path.splitext(name)[1].lower() in COMPRESSIBLE
+
+
+def compress_file(path):
+    """
+    Записать рядом path.gz (и path.br, если есть brotli).
+    Возвращает список созданных суффиксов.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < MIN_SIZE:
+        return []
+
+    out = []
+    variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli:
+        variants.append((".br", brotli.compress(data, quality=11)))
+    for suffix, packed in variants:
+        if len(packed) <= len(data) * MIN_RATIO:
+            with open(path + suffix, "wb") as f:
+                f.write(packed)
+            out.append(suffix)
+    return out
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage (имена с хешем содержимого + staticfiles.json
+    для {% static %}) плюс заранее сжатые .gz/.br копии при collectstatic.
+
+    Вендорные css ссылаются на файлы, которых в дереве нет, — такие
+    ссылки оставляем как есть вместо падения collectstatic.
+    """
+
+    manifest_strict = False
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            logger.warning("static: missing file referenced: %s", name)
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        # сжимаем и оригинальные имена, и хешированные — отдаются оба
+        for name in list(paths) + list(self.hashed_files.values()):
+            if not compressible(name) or not self.exists(name):
+                continue
+            compress_file(self.path(name))
+
+    def immutable_names(self):
+        """
+        Имена с хешем из манифеста — их содержимое никогда не меняется.
+        """
+        return set(self.hashed_files.values())
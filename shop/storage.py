@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+BLOB_PREFIX = "blobs"
+
+
+def blob_name(digest, ext=""):
+    return f"{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + "/")
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище "по содержимому": файл пишется во временный, по ходу
+    считается sha256, и итоговое имя — blobs/ab/cd/<sha256>.<ext>.
+    Одинаковые загрузки ложатся в один файл (второй раз ничего не пишется),
+    имя от содержимого не меняется — URL можно кешировать навсегда.
+
+    Сколько записей ссылается на файл, считает shop.blobs (таблица Blob);
+    удалять файл напрямую через storage не нужно. Сохранение сразу берёт
+    ссылку (blobs.pin) — до проверки, что файл уже есть.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # одинаковое имя = одинаковое содержимое, суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1]
+        tmp_dir = self.path(f"{BLOB_PREFIX}/tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as out:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            name = blob_name(digest.hexdigest(), ext)
+            # ссылка — до проверки "файл уже есть": иначе collect() другой
+            # транзакции успеет удалить найденный файл до acquire() записи
+            from . import blobs
+            blobs.pin(name)
+            path = self.path(name)
+            if os.path.exists(path):
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp_path, self.file_permissions_mode)
+                os.replace(tmp_path, path)
+                blobs.written(name)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return name
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    return content_storage
@@ -0,0 +1,132 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Store
+
+
+# маркер "магазина нет" — кешируем и промахи, чтобы боты с
+# случайными поддоменами не ходили в БД на каждый запрос
+MISSING = "__missing__"
+
+
+class StoreCache:
+    """
+    Кеш резолва поддомен -> Store.
+
+    Два уровня:
+      1) локальный LRU в процессе (OrderedDict + TTL);
+      2) опционально общий кеш Django (settings.STORE_CACHE_ALIAS).
+
+    Хранит и найденные магазины, и промахи (MISSING) — с отдельным TTL.
+    Инвалидация — invalidate(subdomain) из сигналов Store (после коммита).
+    Закешированный Store общий для всех запросов: наружу отдаётся копия.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, negative_ttl=30, local_ttl=None, alias=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # при общем кеше локальный уровень держим коротким:
+        # другие процессы узнают об инвалидации не позже local_ttl
+        self.local_ttl = local_ttl if local_ttl is not None else ttl
+        self.alias = alias
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def _key(self, subdomain):
+        return f"store:sub:{subdomain}"
+
+    # ---- локальный уровень ----
+    def _local_get(self, subdomain):
+        with self._lock:
+            item = self._data.get(subdomain)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[subdomain]
+                return None
+            self._data.move_to_end(subdomain)
+            return value
+
+    def _local_set(self, subdomain, value, ttl):
+        with self._lock:
+            self._data[subdomain] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(subdomain)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # ---- API ----
+    def get(self, subdomain):
+        """
+        Вернуть Store или None (магазина нет / неактивен).
+        """
+        value = self._cached(subdomain)
+        if value is None:
+            store = Store.objects.filter(subdomain=subdomain, is_active=True).first()
+            value = self._remember(subdomain, store)
+        return self._result(value)
+
+    async def aget(self, subdomain):
+        """
+        get() для async-кода: промах кеша — через async ORM.
+        """
+        value = self._cached(subdomain)
+        if value is None:
+            store = await Store.objects.filter(subdomain=subdomain, is_active=True).afirst()
+            value = self._remember(subdomain, store)
+        return self._result(value)
+
+    def _result(self, value):
+        return None if value == MISSING else copy.copy(value)
+
+    def _cached(self, subdomain):
+        value = self._local_get(subdomain)
+
+        if value is None and self.shared is not None:
+            value = self.shared.get(self._key(subdomain))
+            if value is not None:
+                ttl = self.negative_ttl if value == MISSING else self.ttl
+                self._local_set(subdomain, value, min(ttl, self.local_ttl))
+        return value
+
+    def _remember(self, subdomain, store):
+        value = store if store else MISSING
+        ttl = self.negative_ttl if value == MISSING else self.ttl
+
+        self._local_set(subdomain, value, min(ttl, self.local_ttl))
+        if self.shared is not None:
+            self.shared.set(self._key(subdomain), value, ttl)
+        return value
+
+    def invalidate(self, *subdomains):
+        for sub in subdomains:
+            if not sub:
+                continue
+            with self._lock:
+                self._data.pop(sub, None)
+            if self.shared is not None:
+                self.shared.delete(self._key(sub))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+store_cache = StoreCache(
+    maxsize=getattr(settings, "STORE_CACHE_MAXSIZE", 1024),
+    ttl=getattr(settings, "STORE_CACHE_TTL", 300),
+    negative_ttl=getattr(settings, "STORE_CACHE_NEGATIVE_TTL", 30),
+    local_ttl=getattr(settings, "STORE_CACHE_LOCAL_TTL", None),
+    alias=getattr(settings, "STORE_CACHE_ALIAS", None),
+)
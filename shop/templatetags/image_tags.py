@@ -0,0 +1,78 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from shop import renditions
+
+register = template.Library()
+
+# подсказка браузеру, какой ширины будет картинка на странице
+SIZES = {
+    "thumb": "160px",
+    "card": "(max-width: 576px) 50vw, 480px",
+    "zoom": "(max-width: 992px) 100vw, 700px",
+}
+
+
+def _srcset(items):
+    # копии одной ширины (маленький оригинал) — оставляем одну
+    seen = {}
+    for url, width in items:
+        seen.setdefault(width, url)
+    return ", ".join(f"{url} {width}w" for width, url in sorted(seen.items()))
+
+
+def _pick(image, kind, fmt):
+    for r in image.renditions.all():
+        if r.kind == kind and r.format == fmt:
+            return r
+    return None
+
+
+@register.simple_tag
+def rendition_url(image, kind="zoom"):
+    """
+    URL копии нужного размера (jpeg), пока копий нет — оригинал.
+    """
+    if not image:
+        return ""
+    if image.renditions_ready:
+        r = _pick(image, kind, renditions.FALLBACK)
+        if r:
+            return r.file.url
+    return image.image.url
+
+
+@register.simple_tag
+def product_picture(image, kind="card", alt="", css_class="", fallback=""):
+    """
+    <picture> с srcset по всем копиям (webp/avif + jpeg для <img>).
+    Пока копии не готовы — обычный <img> с оригиналом.
+    """
+    if not image:
+        if not fallback:
+            return ""
+        return format_html('<img class="{}" src="{}" alt="{}" loading="lazy">', css_class, fallback, alt)
+
+    main = _pick(image, kind, renditions.FALLBACK) if image.renditions_ready else None
+    if main is None:
+        return format_html(
+            '<img class="{}" src="{}" alt="{}" loading="lazy" decoding="async">',
+            css_class, image.image.url, alt,
+        )
+
+    sizes = SIZES.get(kind, "100vw")
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (renditions.FORMATS[fmt][0], _srcset(renditions.srcset(image, fmt)), sizes)
+            for fmt in renditions.enabled_formats()
+            if fmt != renditions.FALLBACK and renditions.srcset(image, fmt)
+        ),
+    )
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'alt="{}" loading="lazy" decoding="async"></picture>',
+        sources, css_class, main.file.url, _srcset(renditions.srcset(image, renditions.FALLBACK)),
+        sizes, main.width, main.height, alt,
+    )
@@ -5,6 +5,9 @@ register = template.Library()
 @register.simple_tag
 def qs_remove(request, key, value=None):
     q = request.GET.copy()
+    # фильтры поменялись — пагинация с начала
+    q.pop("cursor", None)
+    q.pop("page", None)
 
     if value is None:
         q.pop(key, None)
@@ -30,6 +33,8 @@ def qs_set(request, key, value):
     """
 
     q = request.GET.copy()
+    q.pop("cursor", None)
+    q.pop("page", None)
 
     if value:
         q[key] = value
@@ -46,4 +51,20 @@ def qs_page(request, page_number):
     q = request.GET.copy()
     q["page"] = page_number
     query = q.urlencode()
-    return f"{request.path}?{query}" if query else request.path
\ No newline at end of file
+    return f"{request.path}?{query}" if query else request.path
+
+@register.simple_tag
+def qs_cursor(request, cursor=None):
+    """
+    Ссылка на страницу keyset-пагинации (cursor=None — первая страница)
+    """
+    q = request.GET.copy()
+    q.pop("page", None)
+
+    if cursor:
+        q["cursor"] = cursor
+    else:
+        q.pop("cursor", None)
+
+    query = q.urlencode()
+    return f"{request.path}?{query}" if query else request.path
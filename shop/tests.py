@@ -1,3 +1,933 @@
-from django.test import TestCase
+import gzip
+import io
+import uuid
+from datetime import timedelta
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db.models import Exists, OuterRef
+from django.db import DatabaseError, connection, transaction
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .models import (
+    Blob, Brand, Cart, Category, DailyProductSales, DailySales, DiscountWindowRun, Gender, Order, OrderItem, Product, ProductColor,
+    ProductVariant, Store, FacetCount,
+)
+from . import bitmap_index
+from . import blobs
+from . import carts
+from . import catalog
+from . import exports
+from . import favorites
+from . import imports
+from . import keyset
+from . import orders
+from . import pricing
+from . import sales
+from . import trigram
+from . import variants
+from .storage import content_storage
+from .store_cache import store_cache
+
+
+class SalesRollupTests(TestCase):
+    """
+    Дневные итоги (shop.sales) при заказах из корзины и из админки:
+    после каждого шага они совпадают с полным пересчётом (rebuild).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name="Sales test")
+        cls.user = get_user_model().objects.create_user(username="buyer", password="x")
+        cls.product = Product.objects.create(store=cls.store, name="Футболка")
+        cls.variant = ProductVariant.objects.create(product=cls.product, size="M", price=Decimal("45.00"))
+
+    def checkout(self, quantity=3):
+        carts.add(self.user.pk, self.store.id, self.variant.id, quantity)
+        order, created = orders.place_order(self.user.pk, self.store.id, "Покупатель", "77000000000")
+        self.assertTrue(created)
+        return order
+
+    def admin_order(self, quantity=1, price="50.00"):
+        # как инлайн в админке: сначала заказ, потом строки
+        order = Order.objects.create(store=self.store, full_name="Из админки", phone="1", total_price=price)
+        OrderItem.objects.create(
+            order=order, variant=self.variant, product_name="Футболка", quantity=quantity, price=Decimal(price),
+        )
+        return order
+
+    def set_status(self, order, status):
+        order.status = status
+        order.save(update_fields=["status"])
+
+    def day(self):
+        row = DailySales.objects.filter(store=self.store).values_list("orders", "items", "revenue").first()
+        return (row[0], row[1], Decimal(row[2])) if row else None
+
+    def snapshot(self):
+        return (
+            sorted(
+                (day, n, items, Decimal(revenue))
+                for day, n, items, revenue in DailySales.objects.filter(store=self.store)
+                .values_list("day", "orders", "items", "revenue")
+            ),
+            sorted(
+                (product_id, day, quantity, Decimal(revenue))
+                for product_id, day, quantity, revenue in DailyProductSales.objects.filter(store=self.store)
+                .values_list("product_id", "day", "quantity", "revenue")
+            ),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        sales.rebuild(self.store.id)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_checkout_order_counted(self):
+        order = self.checkout()
+        self.assertTrue(Order.objects.get(pk=order.pk).in_sales)
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+        self.assertMatchesRebuild()
+
+    def test_admin_order_counted_with_its_lines(self):
+        self.checkout()
+        self.admin_order()
+        self.assertEqual(self.day(), (2, 4, Decimal("185.00")))
+        self.assertMatchesRebuild()
+
+    def test_cancel_admin_order_keeps_other_orders(self):
+        self.checkout()
+        order = self.admin_order()
+        self.set_status(order, "cancelled")
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+        self.assertMatchesRebuild()
+
+    def test_cancel_uncounted_order_subtracts_nothing(self):
+        self.checkout()
+        order = self.admin_order()
+        # заказ, который итоги не видели (например, до отметки in_sales)
+        Order.objects.filter(pk=order.pk).update(in_sales=False)
+        DailySales.objects.filter(store=self.store).update(orders=1, items=3, revenue=Decimal("135.00"))
+        DailyProductSales.objects.filter(store=self.store).update(quantity=3, revenue=Decimal("135.00"))
+        self.set_status(order, "cancelled")
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+
+    def test_subtraction_limited_to_what_the_day_holds(self):
+        self.checkout()
+        sales.apply(self.store.id, sales._day(Order.objects.get()), [(self.product.id, 5, Decimal("250"))], -1)
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+
+    def test_uncancel_returns_order(self):
+        order = self.checkout()
+        self.set_status(order, "cancelled")
+        self.assertIsNone(self.day())
+        self.set_status(order, "processing")
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+        self.assertMatchesRebuild()
+
+    def test_status_change_within_counted_is_noop(self):
+        order = self.checkout()
+        self.set_status(order, "processing")
+        self.set_status(order, "done")
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+
+    def test_delete_orders(self):
+        order = self.checkout()
+        admin = self.admin_order()
+        admin.delete()
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+        self.assertMatchesRebuild()
+        order.delete()
+        self.assertIsNone(self.day())
+        self.assertFalse(DailyProductSales.objects.filter(store=self.store).exists())
+
+    def test_delete_cancelled_order(self):
+        self.checkout()
+        admin = self.admin_order()
+        self.set_status(admin, "cancelled")
+        admin.delete()
+        self.assertEqual(self.day(), (1, 3, Decimal("135.00")))
+
+    def test_edit_and_remove_lines(self):
+        order = self.admin_order(quantity=2)
+        item = order.items.get()
+        item.quantity = 4
+        item.save()
+        self.assertEqual(self.day(), (1, 4, Decimal("200.00")))
+        self.assertMatchesRebuild()
+        OrderItem.objects.create(order=order, variant=None, product_name="Удалённый", quantity=1, price=Decimal("10"))
+        self.assertEqual(self.day(), (1, 5, Decimal("210.00")))
+        self.assertMatchesRebuild()
+        item = OrderItem.objects.get(pk=item.pk)
+        item.delete()
+        self.assertEqual(self.day(), (1, 1, Decimal("10.00")))
+        self.assertMatchesRebuild()
+
+    def test_lines_of_cancelled_order_ignored(self):
+        order = self.admin_order()
+        self.set_status(order, "cancelled")
+        OrderItem.objects.create(order=order, variant=self.variant, product_name="x", quantity=2, price=Decimal("5"))
+        self.assertIsNone(self.day())
+        self.assertMatchesRebuild()
+
+
+class StoreCacheTests(TestCase):
+    """
+    Кеш поддомен -> Store: сброс после коммита, наружу — копия.
+    """
+
+    def setUp(self):
+        store_cache.clear()
+        self.store = Store.objects.create(name="Кеш", subdomain="cached")
+
+    def test_returns_copy(self):
+        first = store_cache.get("cached")
+        first.name = "Изменён в запросе"
+        self.assertEqual(store_cache.get("cached").name, "Кеш")
+
+    def test_invalidated_after_commit(self):
+        store_cache.get("cached")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.store.name = "Новое имя"
+            self.store.save()
+            # до коммита в кеше ещё старая строка
+            self.assertEqual(store_cache.get("cached").name, "Кеш")
+        self.assertTrue(callbacks)
+        self.assertEqual(store_cache.get("cached").name, "Новое имя")
+
+
+class BitmapIndexTests(TestCase):
+    """
+    Битмап-индекс витрины: выборка и счётчики фасетов совпадают
+    с тем же фильтром через ORM.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name="Индекс")
+        cats = [Category.objects.create(store=cls.store, name=n, slug=n) for n in ("dress", "shoes")]
+        brands = [Brand.objects.create(store=cls.store, name=n, slug=n) for n in ("a", "b")]
+        gender = Gender.objects.create(name="Унисекс")
+        red, blue = ProductColor.objects.create(name="red", hex="#FF0000"), ProductColor.objects.create(name="blue", hex="#0000FF")
+        # (категория, бренд, активен, [(цвет, размер, вариант активен)])
+        rows = [
+            (0, 0, True, [(red, "S", True), (blue, "M", True)]),
+            (0, 1, True, [(red, "M", True)]),
+            (1, 0, True, [(blue, "S", True), (None, "L", True)]),
+            (1, None, True, [(red, "S", False), (blue, "L", True)]),
+            (None, 1, True, [(blue, "M", True)]),
+            (0, 0, False, [(red, "S", True)]),
+            (1, 1, True, [(red, "M", False)]),
+        ]
+        for i, (cat, brand, active, variants) in enumerate(rows):
+            product = Product.objects.create(
+                store=cls.store, name=f"Товар {i}", slug=f"p{i}", is_active=active, gender=gender,
+                category=cats[cat] if cat is not None else None,
+                brand=brands[brand] if brand is not None else None,
+            )
+            for color, size, is_active in variants:
+                ProductVariant.objects.create(product=product, color=color, size=size, price=Decimal("10"), is_active=is_active)
+        cls.cats = [c.id for c in cats]
+        cls.brands = [b.id for b in brands]
+        cls.colors = [red.id, blue.id]
+
+    def orm_ids(self, filters):
+        variants = ProductVariant.objects.filter(product=OuterRef("pk"), is_active=True)
+        if filters[bitmap_index.COLOR]:
+            variants = variants.filter(color_id__in=filters[bitmap_index.COLOR])
+        if filters[bitmap_index.SIZE]:
+            variants = variants.filter(size__in=filters[bitmap_index.SIZE])
+        qs = Product.objects.filter(store=self.store, is_active=True).filter(Exists(variants))
+        for facet in (bitmap_index.CATEGORY, bitmap_index.BRAND, bitmap_index.GENDER):
+            if filters[facet]:
+                qs = qs.filter(**{f"{facet}_id__in": filters[facet]})
+        return set(qs.values_list("id", flat=True))
+
+    def combinations(self):
+        yield bitmap_index.normalize()
+        yield bitmap_index.normalize(category=[self.cats[0]])
+        yield bitmap_index.normalize(category=self.cats, brand=[self.brands[0]])
+        yield bitmap_index.normalize(color=[self.colors[0]])
+        yield bitmap_index.normalize(color=[self.colors[1]], size=["S"])
+        yield bitmap_index.normalize(size=["M", "L"], brand=[self.brands[1]])
+        yield bitmap_index.normalize(category=[self.cats[1]], color=self.colors, size=["L"])
+
+    def test_match_equals_orm(self):
+        index = bitmap_index.StoreIndex.build(self.store.id, 1)
+        for filters in self.combinations():
+            with self.subTest(filters=filters):
+                self.assertEqual(set(index.product_ids(index.match(filters))), self.orm_ids(filters))
+
+    def test_facet_counts_equal_orm(self):
+        index = bitmap_index.StoreIndex.build(self.store.id, 1)
+        for filters in self.combinations():
+            counts = index.facet_counts(filters)
+            for facet, values in (
+                (bitmap_index.CATEGORY, self.cats), (bitmap_index.BRAND, self.brands),
+                (bitmap_index.COLOR, self.colors), (bitmap_index.SIZE, ["S", "M", "L"]),
+            ):
+                for value in values:
+                    with self.subTest(filters=filters, facet=facet, value=value):
+                        # выбор внутри фасета — OR, для своих счётчиков он не учитывается
+                        expected = len(self.orm_ids({**filters, facet: {value}}))
+                        self.assertEqual(counts[facet].get(value, 0), expected)
+
+    def test_product_changed_leaves_published_index(self):
+        bitmap_index.drop(self.store.id)
+        old = bitmap_index.get_index(self.store.id)
+        before = set(old.product_ids(old.all))
+        product = Product.objects.get(slug="p4")
+        with self.captureOnCommitCallbacks(execute=True):
+            product.is_active = False
+            product.save()
+        new = bitmap_index.get_index(self.store.id)
+        self.assertIsNot(new, old)
+        # инкрементально (product_changed), а не пересборкой: позиция освобождена
+        self.assertEqual(new.free, [old.pos[product.id]])
+        self.assertEqual(set(old.product_ids(old.all)), before)
+        self.assertEqual(set(new.product_ids(new.all)), before - {product.id})
+        rebuilt = bitmap_index.StoreIndex.build(self.store.id, new.version)
+        for filters in self.combinations():
+            self.assertEqual(new.facet_counts(filters), rebuilt.facet_counts(filters))
+
+    def test_advance_keeps_structures(self):
+        bitmap_index.drop(self.store.id)
+        old = bitmap_index.get_index(self.store.id)
+        bitmap_index.advance(self.store.id, old.version + 1)
+        new = bitmap_index._indexes[self.store.id]
+        self.assertEqual(new.version, old.version + 1)
+        self.assertIs(new.category, old.category)
+        # отставший индекс выбрасывается
+        bitmap_index.advance(self.store.id, new.version + 2)
+        self.assertNotIn(self.store.id, bitmap_index._indexes)
+
+
+class KeysetTests(TestCase):
+    """
+    Keyset-пагинация: полный обход в обе стороны без пропусков и повторов
+    при равных ключах; подделанный или чужой курсор — первая страница.
+    """
+
+    KEYS = [("rating_count", True), ("id", True)]
+
+    @classmethod
+    def setUpTestData(cls):
+        store = Store.objects.create(name="Курсоры")
+        for i in range(11):
+            Product.objects.create(store=store, name=f"Товар {i}", slug=f"k{i}")
+        # три группы с одинаковым rating_count — порядок решает id
+        for i, product in enumerate(Product.objects.filter(store=store).order_by("id")):
+            Product.objects.filter(pk=product.pk).update(rating_count=i % 3)
+        cls.qs = Product.objects.filter(store=store)
+        cls.expected = list(cls.qs.order_by("-rating_count", "-id").values_list("id", flat=True))
+
+    def page(self, cursor=None, scope="reviews"):
+        return keyset.paginate(self.qs, self.KEYS, 4, cursor=cursor, scope=scope, total=len(self.expected))
+
+    def ids(self, page):
+        return [p.id for p in page]
+
+    def test_walk_forward_and_back(self):
+        pages = [self.page()]
+        while pages[-1].has_next():
+            pages.append(self.page(pages[-1].next_cursor))
+        self.assertEqual([i for p in pages for i in self.ids(p)], self.expected)
+        self.assertEqual([p.number for p in pages], [1, 2, 3])
+
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(self.page(back[-1].prev_cursor))
+        self.assertEqual([self.ids(p) for p in reversed(back)], [self.ids(p) for p in pages])
+        self.assertEqual(back[-1].number, 1)
+
+    def test_last_page(self):
+        page = self.page(keyset.LAST)
+        self.assertEqual(self.ids(page), self.expected[8:])
+        self.assertEqual(page.number, 3)
+        self.assertFalse(page.has_next())
+        self.assertEqual(self.ids(self.page(page.prev_cursor)), self.expected[4:8])
+
+    def test_tampered_cursor_is_first_page(self):
+        cursor = self.page().next_cursor
+        data = signing.loads(cursor, salt=keyset.CURSOR_SALT)
+        forged = signing.dumps({**data, "v": ["0", "0"]}, salt="другая соль", compress=True)
+        for raw in (cursor[:-2] + "xx", forged, "мусор"):
+            with self.subTest(cursor=raw):
+                page = self.page(raw)
+                self.assertEqual(self.ids(page), self.expected[:4])
+                self.assertFalse(page.has_previous())
+
+    def test_cursor_of_other_sort_ignored(self):
+        cursor = self.page().next_cursor
+        self.assertEqual(self.ids(self.page(cursor, scope="")), self.expected[:4])
+
+    def test_bad_values_in_signed_cursor_ignored(self):
+        cursor = keyset.encode_cursor({"s": "reviews", "d": "next", "v": ["не число", "1"], "n": 2})
+        self.assertEqual(self.ids(self.page(cursor)), self.expected[:4])
+
+    def test_paginate_ids_offset(self):
+        fetch = lambda ids: list(ids)
+        page = keyset.paginate_ids(self.expected, 4, fetch, scope="relevance")
+        page = keyset.paginate_ids(self.expected, 4, fetch, cursor=page.next_cursor, scope="relevance")
+        self.assertEqual(page.object_list, self.expected[4:8])
+        forged = signing.dumps({"s": "relevance", "d": "off", "o": 8}, salt="другая соль")
+        self.assertEqual(keyset.paginate_ids(self.expected, 4, fetch, cursor=forged, scope="relevance").number, 1)
+
+
+class TrigramLookupTests(TestCase):
+    """
+    Поиск в дашборде: подстрока названия или SKU без учёта регистра и ё/е.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name="Поиск")
+        cls.dress = Product.objects.create(store=cls.store, name="Платье ёжик", slug="dress")
+        ProductVariant.objects.create(product=cls.dress, size="S", sku="DR-Abcd-01", price=Decimal("10"))
+        cls.other = Product.objects.create(store=cls.store, name="Abca shirt", slug="shirt")
+        Product.objects.create(store=Store.objects.create(name="Чужой"), name="Платье", slug="x")
+
+    def found(self, text):
+        return trigram.lookup(self.store.id, text)
+
+    def test_cyrillic_case_and_yo(self):
+        for text in ("Платье", "платье", "ПЛАТЬЕ", "ёжик", "ежик", "ЕЖИК", "тье ёж"):
+            with self.subTest(text=text):
+                self.assertEqual(self.found(text), [self.dress.id])
+
+    def test_sku_and_name(self):
+        self.assertEqual(self.found("dr-abcd"), [self.dress.id])
+        self.assertEqual(self.found("ABC"), [self.dress.id, self.other.id])
+
+    def test_candidates_rechecked(self):
+        coconut = Product.objects.create(store=self.store, name="Кокос", slug="coconut")
+        self.assertEqual(self.found("КОКОС"), [coconut.id])
+        # все триграммы запроса у товара есть, подстроки — нет
+        self.assertEqual(self.found("кококос"), [])
+
+    def test_short_query(self):
+        self.assertEqual(self.found("пл"), [self.dress.id])
+
+
+class FavoritesTests(TestCase):
+    """
+    Избранное из async-view: переключение решает БД, ETag страницы
+    товара и favorite-count меняется вместе с избранным.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name="Избранное", subdomain="favs")
+        cls.user = get_user_model().objects.create_user(username="fan", password="x")
+        cls.product = Product.objects.create(store=cls.store, name="Сумка", slug="bag")
+        ProductVariant.objects.create(product=cls.product, size="M", price=Decimal("10"))
+
+    def setUp(self):
+        cache.clear()
+        store_cache.clear()
+        self.client = Client(HTTP_HOST=f"favs.{settings.BASE_DOMAIN}")
+        self.client.force_login(self.user)
+
+    def toggle(self):
+        # удаление правит кеш в on_commit: в бою — до ответа (atomic внутри
+        # delete()), в TestCase — только на выходе из блока
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/favorite/toggle/", {"product_id": self.product.id}).json()
+
+    def test_toggle(self):
+        self.assertEqual(self.toggle(), {"status": "added", "count": 1})
+        self.assertEqual(favorites.ids(self.user.pk, self.store.id), {self.product.id})
+        self.assertEqual(self.toggle()["status"], "removed")
+        self.assertFalse(favorites.ids(self.user.pk, self.store.id))
+
+    def test_toggle_with_stale_cache(self):
+        self.toggle()
+        # множество в кеше отстало: товара в нём нет, в БД — есть
+        cache.set(favorites._ids_key(self.user.pk, self.store.id), frozenset(), 60)
+        self.assertEqual(self.toggle()["status"], "removed")
+
+    def test_etag_follows_favorites(self):
+        for url in ("/product/bag/", "/favorite-count/"):
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.toggle()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DiscountWindowTests(TestCase):
+    """
+    Цены со скидкой пачкой (pricing.resolve): окно скидки товара важнее
+    окна категории, вне окна — без скидки, цена округляется вниз.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        hour = timedelta(hours=1)
+        cls.store = Store.objects.create(name="Скидки")
+        cls.category = Category.objects.create(
+            store=cls.store, name="Распродажа", slug="sale",
+            discount_percent=20, discount_active=True,
+            discount_start=cls.now - hour, discount_end=cls.now + hour,
+        )
+
+        def product(slug, **discount):
+            p = Product.objects.create(store=cls.store, name=slug, slug=slug, category=cls.category, **discount)
+            return ProductVariant.objects.create(product=p, size="M", price=Decimal("999.99"), old_price=Decimal("1200"))
+
+        # своя скидка ещё не началась — действует скидка категории
+        cls.future = product("future", discount_percent=10, discount_is_active=True, discount_start=cls.now + hour)
+        # своя скидка без окна — важнее категории
+        cls.own = product("own", discount_percent=30, discount_is_active=True)
+        # своя выключена — категория
+        cls.off = product("off", discount_percent=50, discount_is_active=False)
+        # своя закончилась — категория
+        cls.ended = product("ended", discount_percent=40, discount_is_active=True, discount_end=cls.now - hour)
+
+    def prices(self, now):
+        return pricing.resolve(ProductVariant.objects.filter(product__store=self.store), now)
+
+    def test_product_window_beats_category(self):
+        prices = self.prices(self.now)
+        self.assertEqual(prices[self.own.pk], pricing.Price(Decimal("699"), Decimal("999.99"), 30))
+        for variant in (self.future, self.off, self.ended):
+            with self.subTest(variant=variant.product.slug):
+                self.assertEqual(prices[variant.pk], pricing.Price(Decimal("799"), Decimal("999.99"), 20))
+
+    def test_windows_open_and_close(self):
+        later = self.now + timedelta(hours=2)
+        prices = self.prices(later)
+        # категория закрылась, своя скидка future открылась
+        self.assertEqual(prices[self.future.pk].percent, 10)
+        self.assertEqual(prices[self.own.pk].percent, 30)
+        self.assertEqual(prices[self.off.pk], pricing.Price(Decimal("999"), Decimal("1200"), 0))
+
+    def test_window_bounds_inclusive(self):
+        start = self.category.discount_start
+        self.assertTrue(pricing.window_open(start, True, 20, start, self.category.discount_end))
+        self.assertTrue(pricing.window_open(self.category.discount_end, True, 20, start, self.category.discount_end))
+        self.assertFalse(pricing.window_open(start - timedelta(microseconds=1), True, 20, start, None))
+        self.assertFalse(pricing.window_open(start, True, 0, None, None))
+
+    def test_apply_loaded_matches_resolve(self):
+        prices = self.prices(self.now)
+        for variant in (self.future, self.own, self.off, self.ended):
+            product = Product.objects.select_related("category").get(pk=variant.product_id)
+            [loaded] = pricing.apply_loaded(product, [ProductVariant.objects.get(pk=variant.pk)], self.now)
+            self.assertEqual(loaded._price, prices[variant.pk])
+
+    def test_sql_percent_matches_python(self):
+        for now in (self.now, self.now + timedelta(hours=2), self.now - timedelta(hours=2)):
+            rows = Product.objects.filter(store=self.store).annotate(sql=pricing.percent_expression(now))
+            for product in rows:
+                with self.subTest(now=now, product=product.slug):
+                    self.assertEqual(product.sql, pricing.product_percents([product.pk], now)[product.pk])
+
+
+class ApplyWindowsTests(TestCase):
+    """
+    apply_discount_windows: после первого запуска проверяются только
+    товары и категории, у которых граница окна прошла с прошлого.
+    """
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.store = Store.objects.create(name="Окна")
+        self.category = Category.objects.create(store=self.store, name="Кат", slug="cat")
+        self.opens = self.product("opens", discount_percent=10, discount_is_active=True,
+                                  discount_start=self.now + timedelta(minutes=30))
+        self.in_category = self.product("in-category", category=self.category)
+        self.stuck = self.product("stuck")
+
+    def product(self, slug, **fields):
+        product = Product.objects.create(store=self.store, name=slug, slug=slug, **fields)
+        ProductVariant.objects.create(product=product, size="M", price=Decimal("100"))
+        return Product.objects.get(pk=product.pk)
+
+    def discount(self, product):
+        return Product.objects.values_list("effective_discount", flat=True).get(pk=product.pk)
+
+    def test_only_passed_bounds_rechecked(self):
+        self.assertEqual(pricing.apply_windows(self.now), {})
+        self.assertEqual(DiscountWindowRun.objects.get().checked_at, self.now)
+
+        # рассинхрон без прошедшей границы окна следующий запуск не ищет
+        Product.objects.filter(pk=self.stuck.pk).update(effective_discount=99)
+        Category.objects.filter(pk=self.category.pk).update(
+            discount_percent=15, discount_active=True, discount_end=self.now + timedelta(minutes=50),
+        )
+        later = self.now + timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(pricing.apply_windows(later), {self.store.id: 1})
+        self.assertEqual(self.discount(self.opens), 10)
+        self.assertEqual(self.discount(self.stuck), 99)
+        self.assertEqual(DiscountWindowRun.objects.get().checked_at, later)
+
+        # окно категории закрылось — но её товар не пересчитан: его процент и так 0
+        self.assertEqual(self.discount(self.in_category), 0)
+
+    def test_category_window_opens(self):
+        pricing.apply_windows(self.now)
+        Category.objects.filter(pk=self.category.pk).update(
+            discount_percent=20, discount_active=True, discount_start=self.now + timedelta(minutes=10),
+        )
+        pricing.apply_windows(self.now + timedelta(minutes=20))
+        self.assertEqual(self.discount(self.in_category), 20)
+
+    def test_first_run_checks_everything(self):
+        Product.objects.filter(pk=self.stuck.pk).update(effective_discount=99)
+        self.assertEqual(pricing.apply_windows(self.now), {self.store.id: 1})
+        self.assertEqual(self.discount(self.stuck), 0)
+
+
+class BulkVariantDeleteTests(TestCase):
+    """
+    variants.bulk_write(delete=...): товар пересчитывается один раз,
+    число запросов не растёт с числом удалённых строк.
+    """
+
+    def setUp(self):
+        self.store = Store.objects.create(name="Варианты")
+        self.user = get_user_model().objects.create_user(username="shopper", password="x")
+
+    def product(self, slug, sizes):
+        product = Product.objects.create(store=self.store, name=slug, slug=slug)
+        for i, size in enumerate(sizes):
+            ProductVariant.objects.create(product=product, size=size, price=Decimal(10 + i))
+        return product
+
+    def delete_queries(self, product, keep):
+        doomed = list(product.variants.exclude(size=keep))
+        with CaptureQueriesContext(connection) as queries:
+            variants.bulk_write(delete=doomed)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_rows(self):
+        few = self.delete_queries(self.product("few", ["S", "M"]), keep="S")
+        many = self.delete_queries(self.product("many", ["S", "M", "L", "XL", "XXL", "3XL"]), keep="S")
+        self.assertEqual(few, many)
+
+    def test_product_recomputed(self):
+        product = self.product("shirt", ["S", "M", "L"])
+        variants.bulk_write(delete=list(product.variants.exclude(size="S")))
+        product.refresh_from_db()
+        self.assertEqual((product.min_price, product.max_price), (Decimal("10"), Decimal("10")))
+        sizes = set(FacetCount.objects.filter(store=self.store, facet=FacetCount.SIZE).values_list("key", flat=True))
+        self.assertEqual(sizes, {"S"})
+
+    def test_cart_rows_removed_and_cart_invalidated(self):
+        product = self.product("cap", ["S", "M"])
+        doomed = product.variants.get(size="M")
+        carts.add(self.user.pk, self.store.id, doomed.pk, 2)
+        cart = Cart.objects.get(user=self.user, store=self.store)
+        variants.bulk_write(delete=[doomed])
+        self.assertFalse(cart.items.exists())
+        self.assertGreater(Cart.objects.get(pk=cart.pk).version, cart.version)
+
+
+class BlobTests(TestCase):
+    """
+    Ссылка на файл берётся при сохранении, до проверки "файл уже есть";
+    файлы откатившейся транзакции удаляются.
+    """
+
+    def content(self):
+        return ContentFile(uuid.uuid4().hex.encode(), name="a.txt")
+
+    def refcount(self, name):
+        return Blob.objects.filter(name=name).values_list("refcount", flat=True).first()
+
+    def test_unreferenced_file_removed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            name = content_storage.save("a.txt", self.content())
+            self.assertTrue(content_storage.exists(name))
+        self.assertFalse(content_storage.exists(name))
+        self.assertIsNone(self.refcount(name))
+
+    def test_found_file_survives_pending_collect(self):
+        content = self.content()
+        with self.captureOnCommitCallbacks(execute=True):
+            name = content_storage.save("a.txt", content)
+            blobs.acquire(name)
+        with self.captureOnCommitCallbacks(execute=False):
+            # последняя ссылка ушла, collect ещё не выполнен
+            blobs.release(name)
+        with self.captureOnCommitCallbacks(execute=True):
+            content.seek(0)
+            self.assertEqual(content_storage.save("b.txt", content), name)
+            blobs.collect(name)
+            self.assertTrue(content_storage.exists(name))
+            blobs.acquire(name)
+        self.assertTrue(content_storage.exists(name))
+        self.assertEqual(self.refcount(name), 1)
+
+    def test_rolled_back_file_removed(self):
+        names = []
+        with self.assertRaises(ValueError):
+            with blobs.cleanup_on_error(), transaction.atomic():
+                names.append(content_storage.save("a.txt", self.content()))
+                raise ValueError
+        self.assertFalse(content_storage.exists(names[0]))
+        self.assertIsNone(self.refcount(names[0]))
+
+
+class CartTests(TestCase):
+    """
+    Строки корзины пишутся upsert'ом, итоги кешируются по версии корзины
+    и версии каталога.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.store = Store.objects.create(name="Корзина")
+        self.user = get_user_model().objects.create_user(username="buyer", password="x")
+        product = Product.objects.create(store=self.store, name="Кеды", slug="kedy")
+        self.s = ProductVariant.objects.create(product=product, size="S", price=Decimal("100"))
+        self.m = ProductVariant.objects.create(product=product, size="M", price=Decimal("19.99"))
+        other = Store.objects.create(name="Чужой")
+        foreign = Product.objects.create(store=other, name="Кеды", slug="kedy")
+        self.foreign = ProductVariant.objects.create(product=foreign, size="S", price=Decimal("1"))
+
+    def quantities(self):
+        cart_id, _version = carts.find_cart(self.user.pk, self.store.id)
+        return dict(Cart.objects.get(pk=cart_id).items.values_list("variant_id", "quantity"))
+
+    def test_add_sums_quantity(self):
+        self.assertEqual(carts.add(self.user.pk, self.store.id, self.s.pk, 2), 1)
+        self.assertEqual(carts.add(self.user.pk, self.store.id, self.s.pk, 3), 1)
+        self.assertEqual(carts.add(self.user.pk, self.store.id, self.m.pk), 2)
+        self.assertEqual(self.quantities(), {self.s.pk: 5, self.m.pk: 1})
+        self.assertEqual(Cart.objects.filter(user=self.user, store=self.store).count(), 1)
+
+    def test_foreign_and_inactive_rejected(self):
+        self.assertIsNone(carts.add(self.user.pk, self.store.id, self.foreign.pk))
+        ProductVariant.objects.filter(pk=self.m.pk).update(is_active=False)
+        total, rejected = carts.apply(self.user.pk, self.store.id, add=[(self.s.pk, 1), (self.m.pk, 1)])
+        self.assertEqual((total, rejected), (1, {self.m.pk}))
+        self.assertEqual(self.quantities(), {self.s.pk: 1})
+
+    def test_apply_set_and_remove(self):
+        carts.apply(self.user.pk, self.store.id, add=[(self.s.pk, 2), (self.m.pk, 2), (self.s.pk, 1)])
+        self.assertEqual(self.quantities(), {self.s.pk: 3, self.m.pk: 2})
+        carts.apply(self.user.pk, self.store.id, set_quantities=[(self.s.pk, 7), (self.m.pk, 0)])
+        self.assertEqual(self.quantities(), {self.s.pk: 7})
+        carts.apply(self.user.pk, self.store.id, remove_ids=[self.s.pk])
+        self.assertEqual(self.quantities(), {})
+        with self.assertRaises(ValueError):
+            carts.apply(self.user.pk, self.store.id, add=[(self.s.pk, 0)])
+
+    def test_summary_totals(self):
+        Product.objects.filter(pk=self.s.product_id).update(discount_percent=10, discount_is_active=True)
+        carts.apply(self.user.pk, self.store.id, add=[(self.s.pk, 2), (self.m.pk, 3)])
+        result = carts.summary_for(self.user.pk, self.store.id)
+        # Floor, как в pricing: 100 -> 90, 19.99 -> 17
+        self.assertEqual(result.lines[self.s.pk].total, Decimal("180.00"))
+        self.assertEqual(result.lines[self.m.pk].price, Decimal("17.00"))
+        self.assertEqual(result.subtotal, Decimal("231.00"))
+        self.assertEqual(result.discount, Decimal("28.97"))
+        self.assertEqual((result.items, result.count), (5, 2))
+        self.assertEqual(str(result.subtotal), "231.00")
+
+    def test_summary_follows_cart_version(self):
+        carts.add(self.user.pk, self.store.id, self.s.pk)
+        first = carts.find_cart(self.user.pk, self.store.id)
+        self.assertEqual(carts.summary(first, self.store.id).items, 1)
+        carts.add(self.user.pk, self.store.id, self.s.pk)
+        second = carts.find_cart(self.user.pk, self.store.id)
+        self.assertGreater(second[1], first[1])
+        self.assertEqual(carts.summary(second, self.store.id).items, 2)
+
+    def test_summary_follows_catalog_version(self):
+        carts.add(self.user.pk, self.store.id, self.s.pk)
+        self.assertEqual(carts.summary_for(self.user.pk, self.store.id).subtotal, Decimal("100.00"))
+        # цена без сигналов — итоги из кеша, пока версия каталога та же
+        ProductVariant.objects.filter(pk=self.s.pk).update(price=Decimal("50"))
+        self.assertEqual(carts.summary_for(self.user.pk, self.store.id).subtotal, Decimal("100.00"))
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog.bump(self.store.id)
+        self.assertEqual(carts.summary_for(self.user.pk, self.store.id).subtotal, Decimal("50.00"))
+
+
+class CheckoutTests(TestCase):
+    """
+    Оформление заказа идемпотентно: повтор с тем же ключом возвращает
+    тот же заказ, а не второй.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name="Оформление", subdomain="checkout")
+        cls.user = get_user_model().objects.create_user(username="payer", password="x")
+        product = Product.objects.create(store=cls.store, name="Шарф", slug="scarf")
+        cls.variant = ProductVariant.objects.create(product=product, size="M", price=Decimal("25"))
+
+    def setUp(self):
+        cache.clear()
+        store_cache.clear()
+        carts.add(self.user.pk, self.store.id, self.variant.pk, 2)
+
+    def place(self, key):
+        return orders.place_order(self.user.pk, self.store.id, "Покупатель", "77000000000", key=key)
+
+    def test_same_key_same_order(self):
+        order, created = self.place("key-00000001")
+        self.assertTrue(created)
+        self.assertEqual(order.total_price, Decimal("50.00"))
+        self.assertEqual(list(order.items.values_list("variant_id", "quantity")), [(self.variant.pk, 2)])
+        self.assertEqual(carts.summary_for(self.user.pk, self.store.id).count, 0)
+        # корзина уже пуста, но ключ тот же — тот же заказ
+        again, created = self.place("key-00000001")
+        self.assertEqual((again.pk, created), (order.pk, False))
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+        with self.assertRaises(orders.EmptyCart):
+            self.place("key-00000002")
+
+    def test_concurrent_insert_with_same_key(self):
+        order, _created = self.place("key-00000003")
+        carts.add(self.user.pk, self.store.id, self.variant.pk)
+        # параллельный запрос не увидел заказ при проверке и упёрся в уникальный ключ
+        with mock.patch.object(orders, "_existing", side_effect=[None, order]):
+            again, created = self.place("key-00000003")
+        self.assertEqual((again.pk, created), (order.pk, False))
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    def test_unavailable_keeps_cart(self):
+        ProductVariant.objects.filter(pk=self.variant.pk).update(is_active=False)
+        with self.assertRaises(orders.Unavailable) as raised:
+            self.place("key-00000004")
+        self.assertEqual(raised.exception.variant_ids, [self.variant.pk])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(carts.summary_for(self.user.pk, self.store.id).items, 2)
+
+    def test_view_replays_by_header(self):
+        client = Client(HTTP_HOST=f"checkout.{settings.BASE_DOMAIN}")
+        client.force_login(self.user)
+        data = {"full_name": "Покупатель", "phone": "77000000000"}
+
+        def post(key):
+            return client.post("/checkout/", data, content_type="application/json", HTTP_IDEMPOTENCY_KEY=key)
+
+        first = post("key-00000005")
+        self.assertEqual((first.status_code, first.json()["status"]), (201, "created"))
+        second = post("key-00000005")
+        self.assertEqual((second.status_code, second.json()["status"]), (200, "replayed"))
+        self.assertEqual(second.json()["order_id"], first.json()["order_id"])
+        self.assertEqual(post("плохой ключ").status_code, 400)
+
+
+class ExportTests(TestCase):
+    """
+    Потоковая выгрузка: gzip распаковывается в тот же текст, выгруженный
+    каталог загружается обратно импортом без потерь.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(name="Выгрузка", subdomain="export")
+        category = Category.objects.create(store=cls.store, name="Обувь", slug="shoes")
+        brand = Brand.objects.create(store=cls.store, name="Север")
+        red = ProductColor.objects.create(name="Красный", hex="#FF0000")
+        boots = Product.objects.create(
+            store=cls.store, name="Ботинки, \"зимние\"", slug="boots", category=category, brand=brand,
+            description="Строка 1\nстрока 2", discount_percent=15, discount_is_active=True,
+        )
+        ProductVariant.objects.create(product=boots, color=red, size="41", price=Decimal("99.90"), sku="B-41")
+        ProductVariant.objects.create(
+            product=boots, color=red, size="42", price=Decimal("120"), old_price=Decimal("150"), sku="B-42",
+        )
+        laces = Product.objects.create(store=cls.store, name="Шнурки", slug="laces", is_active=False)
+        # в CSV флаг is_active один — товара, варианты снятого товара тоже сняты
+        ProductVariant.objects.create(product=laces, price=Decimal("5"), is_active=False)
+        cls.manager = get_user_model().objects.create_user(username="exporter", password="x", is_staff=True)
+        cls.store.managers.add(cls.manager)
+
+    def records(self, store):
+        # без id и итоговых цен — их импорт не переносит
+        out = []
+        for record in exports.catalog(store.id):
+            record.pop("id")
+            for variant in record["variants"]:
+                del variant["id"], variant["final_price"]
+            out.append(record)
+        return out
+
+    def test_gzip_round_trip(self):
+        for fmt in ("csv", "jsonl"):
+            with self.subTest(fmt=fmt):
+                plain = b"".join(exports.export("catalog", self.store.id, fmt))
+                packed = b"".join(exports.export("catalog", self.store.id, fmt, compress=True))
+                self.assertEqual(gzip.decompress(packed), plain)
+
+    def test_header_first(self):
+        first = next(iter(exports.export("catalog", self.store.id)))
+        self.assertEqual(first.decode().lstrip("\ufeff").strip(), ",".join(exports.CATALOG_COLUMNS))
+
+    def test_import_exported(self):
+        expected = self.records(self.store)
+        for fmt in ("csv", "jsonl"):
+            with self.subTest(fmt=fmt):
+                target = Store.objects.create(name=f"Копия {fmt}", subdomain=f"copy-{fmt}")
+                data = b"".join(exports.export("catalog", self.store.id, fmt))
+                report = imports.Importer(target).run(imports.records(io.BytesIO(data), fmt))
+                self.assertEqual((report.error_count, report.products, report.variants), (0, 2, 3))
+                self.assertEqual(self.records(target), expected)
+
+    def test_view_streams_gzip(self):
+        client = Client(HTTP_HOST=f"export.{settings.BASE_DOMAIN}")
+        client.force_login(self.manager)
+        response = client.get("/dashboard/products/export/", {"format": "jsonl", "gzip": "1"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+
+
+class ImporterTests(TestCase):
+    """
+    Пачка импорта откатывается целиком — вместе со справочниками, которые
+    она создала: следующие пачки создают их заново, а не ссылаются на
+    откатившиеся id.
+    """
+
+    def setUp(self):
+        self.store = Store.objects.create(name="Импорт", subdomain="import")
+
+    def record(self, line, slug):
+        return line, {
+            "name": slug, "slug": slug, "category": "Новинки", "brand": "Юг", "gender": "Унисекс",
+            "variants": [{"color": "Лиловый", "color_hex": "#C8A2C8", "size": "M", "price": "10"}],
+        }
+
+    def test_failed_chunk_does_not_leave_lookups(self):
+        real, calls = variants.bulk_write, []
+
+        def flaky(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise DatabaseError("boom")
+            return real(**kwargs)
+
+        importer = imports.Importer(self.store, chunk=1)
+        with mock.patch.object(imports.variant_ops, "bulk_write", flaky):
+            report = importer.run([self.record(1, "first"), self.record(2, "second")])
+        self.assertEqual((report.products, report.error_count), (1, 1))
+        product = Product.objects.get(store=self.store)
+        self.assertEqual(product.slug, "second")
+        self.assertEqual(product.category.name, "Новинки")
+        self.assertEqual(product.brand.name, "Юг")
+        self.assertEqual(product.gender.name, "Унисекс")
+        self.assertEqual(product.variants.get().color.hex, "#C8A2C8")
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command("import_catalog", "/nonexistent/catalog.csv", store=str(self.store.pk))
@@ -0,0 +1,90 @@
+from django.db.models import Count
+
+from .models import Product, ProductVariant, ProductTrigram
+
+
+MIN_LEN = 3
+
+
+def normalize(text):
+    return (text or "").lower().replace("ё", "е")
+
+
+def trigrams(text):
+    text = normalize(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def product_grams(name, skus):
+    grams = trigrams(name)
+    for sku in skus:
+        grams |= trigrams(sku)
+    return grams
+
+
+def index_products(product_ids):
+    """
+    Пересобрать триграммы товаров: название + SKU всех вариантов.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    skus = {}
+    for product_id, sku in ProductVariant.objects.filter(product_id__in=product_ids).values_list("product_id", "sku"):
+        skus.setdefault(product_id, []).append(sku)
+
+    rows = []
+    for product_id, store_id, name in Product.objects.filter(pk__in=product_ids).values_list("id", "store_id", "name"):
+        rows += [
+            ProductTrigram(store_id=store_id, product_id=product_id, gram=g)
+            for g in product_grams(name, skus.get(product_id, ()))
+        ]
+
+    ProductTrigram.objects.filter(product_id__in=product_ids).delete()
+    ProductTrigram.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild(store_id=None, chunk=500):
+    products = Product.objects.all()
+    if store_id:
+        products = products.filter(store_id=store_id)
+
+    ids = list(products.order_by("id").values_list("id", flat=True))
+    for i in range(0, len(ids), chunk):
+        index_products(ids[i:i + chunk])
+
+
+def lookup(store_id, text):
+    """
+    Список id товаров магазина, у которых название или SKU содержит text
+    без учёта регистра и ё/е (как normalize).
+
+    Индекс только сужает выборку: кандидат должен содержать все триграммы
+    запроса, но граммы могут прийти из разных строк (название + SKU) или
+    стоять не по порядку, поэтому кандидаты перепроверяются в Python —
+    LIKE в SQLite складывает регистр только у ASCII. Короче MIN_LEN
+    символов — проверяются все товары магазина.
+    """
+    needle = normalize(text)
+    products = Product.objects.filter(store_id=store_id)
+    if len(needle) >= MIN_LEN:
+        grams = trigrams(text)
+        candidates = (
+            ProductTrigram.objects
+            .filter(store_id=store_id, gram__in=grams)
+            .values("product_id")
+            .annotate(n=Count("gram"))
+            .filter(n=len(grams))
+            .values("product_id")
+        )
+        products = products.filter(pk__in=candidates)
+
+    found = []
+    seen = set()
+    # строка на вариант (LEFT JOIN): товар без вариантов — с sku = NULL
+    for product_id, name, sku in products.order_by("id").values_list("id", "name", "variants__sku"):
+        if product_id not in seen and (needle in normalize(name) or needle in normalize(sku)):
+            seen.add(product_id)
+            found.append(product_id)
+    return found
@@ -17,5 +17,8 @@ urlpatterns = [
     path('favorite/toggle/', views.toggle_favorite, name='toggle_favorite'),
     path('favorite-count/', views.favorite_count, name='favorite_count'),
     path('cart/add/', views.add_to_cart, name='add_to_cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
+    path('cart/summary/', views.cart_summary, name='cart_summary'),
+    path('checkout/', views.checkout, name='checkout'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,205 @@
+from collections import defaultdict
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, ProductColor, ProductVariant, _norm
+from . import bitmap_index
+from . import catalog
+from . import facets
+from . import pricing
+from . import search
+from . import trigram
+
+
+# поля, которые пишет bulk_update
+UPDATE_FIELDS = ["color", "size", "sku", "price", "old_price", "is_active", "updated_at"]
+
+# id в одном IN (...)
+CHUNK = 500
+
+# bulk_write удаляет варианты: post_delete-обработчики (фасеты, каталог,
+# поиск, триграммы, updated_at) пропускают строку — товар пересчитывается
+# один раз в конце bulk_write
+_bulk_delete = ContextVar("variants_bulk_delete", default=False)
+
+
+def in_bulk_delete():
+    return _bulk_delete.get()
+
+
+def make_sku(slug, color_hex, size):
+    # та же схема, что и в ProductVariant.save
+    color_part = color_hex.replace("#", "").lower() if color_hex else "nocolor"
+    size_part = _norm(size) or "nosize"
+    return f"{slug}-{color_part}-{size_part}"[:64]
+
+
+def fill_skus(variants):
+    """
+    Проставить SKU вариантам без него: slug товаров и hex цветов
+    читаются двумя запросами на всю пачку, без ленивых загрузок.
+    """
+    missing = [v for v in variants if not v.sku]
+    if not missing:
+        return
+    slugs = dict(
+        Product.objects.filter(pk__in={v.product_id for v in missing}).values_list("id", "slug")
+    )
+    hexes = dict(
+        ProductColor.objects.filter(pk__in={v.color_id for v in missing if v.color_id}).values_list("id", "hex")
+    )
+    for v in missing:
+        v.sku = make_sku(slugs.get(v.product_id, ""), hexes.get(v.color_id), v.size)
+
+
+def _price_subquery(func):
+    return Coalesce(
+        Subquery(
+            ProductVariant.objects
+            .filter(product=OuterRef("pk"), is_active=True)
+            .order_by()
+            .values("product")
+            .annotate(value=func("price"))
+            .values("value")
+        ),
+        Value(Decimal("0")),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def refresh_prices(product_ids, now=None):
+    """
+    min_price/max_price (и цены со скидкой) для набора товаров —
+    одним UPDATE с коррелированными подзапросами вместо aggregate на товар.
+    """
+    now = now or timezone.now()
+    product_ids = list(product_ids)
+    for i in range(0, len(product_ids), CHUNK):
+        qs = Product.objects.filter(pk__in=product_ids[i:i + CHUNK])
+        qs.update(min_price=_price_subquery(Min), max_price=_price_subquery(Max), updated_at=now)
+        pricing.recompute(qs, now)
+
+
+def _facet_keys(product_ids):
+    """
+    Ключи фасетов по товарам, сгруппированные по магазину (2 запроса).
+    """
+    by_store = defaultdict(facets.empty_keys)
+    stores = {}
+    for pk, store_id, category_id, brand_id, gender_id in (
+        Product.objects.filter(pk__in=product_ids).values_list("id", "store_id", "category_id", "brand_id", "gender_id")
+    ):
+        stores[pk] = store_id
+        keys = by_store[store_id]
+        keys[facets.CATEGORY].add(category_id)
+        keys[facets.BRAND].add(brand_id)
+        keys[facets.GENDER].add(gender_id)
+    for product_id, color_id, size in (
+        ProductVariant.objects.filter(product_id__in=product_ids).values_list("product_id", "color_id", "size")
+    ):
+        keys = by_store[stores[product_id]]
+        keys[facets.COLOR].add(color_id)
+        keys[facets.SIZE].add(size)
+    return stores, by_store
+
+
+def _bump(stores):
+    by_store = defaultdict(list)
+    for product_id, store_id in stores.items():
+        by_store[store_id].append(product_id)
+
+    for store_id, product_ids in by_store.items():
+        if len(product_ids) == 1:
+            product_id = product_ids[0]
+            catalog.bump(
+                store_id,
+                on_commit=lambda version, s=store_id, p=product_id: bitmap_index.product_changed(s, p, version),
+            )
+        else:
+            # много товаров сразу — индекс проще пересобрать при следующем запросе
+            catalog.bump(store_id, on_commit=lambda version, s=store_id: bitmap_index.drop(s))
+
+
+@transaction.atomic
+def bulk_write(create=(), update=(), deactivate=(), delete=()):
+    """
+    Пакетная запись вариантов одного или многих товаров.
+
+    create — новые ProductVariant (bulk_create), update — изменённые
+    (bulk_update по UPDATE_FIELDS, без предварительного SELECT на строку),
+    deactivate — варианты/их id для is_active=False, delete — варианты
+    для удаления (обычный delete: каскады корзины и т.п.; per-row
+    обработчики post_delete вариантов при этом молчат, см. in_bulk_delete).
+
+    bulk-операции не шлют сигналы, поэтому всё, что делают per-row
+    обработчики (цены товара, фасеты, версия каталога, поиск, триграммы,
+    updated_at), выполняется здесь один раз на затронутый товар.
+    Возвращает множество id затронутых товаров.
+    """
+    create, update = list(create), list(update)
+    deactivate_ids = [getattr(v, "pk", v) for v in deactivate]
+    delete = list(delete)
+
+    product_ids = {v.product_id for v in create + update + delete}
+    if deactivate_ids:
+        product_ids |= set(
+            ProductVariant.objects.filter(pk__in=deactivate_ids).values_list("product_id", flat=True)
+        )
+    if not product_ids:
+        return set()
+    product_ids = list(product_ids)
+
+    # ключи фасетов "до" — чтобы пересчитать и исчезнувшие цвета/размеры
+    _, keys_before = _facet_keys(product_ids)
+
+    now = timezone.now()
+    if delete:
+        # обычный delete() — ради каскадов (строки корзин со своими сигналами)
+        token = _bulk_delete.set(True)
+        try:
+            ProductVariant.objects.filter(pk__in=[v.pk for v in delete if v.pk]).delete()
+        finally:
+            _bulk_delete.reset(token)
+
+    fill_skus(create + update)
+    if create:
+        ProductVariant.objects.bulk_create(create)
+    if update:
+        for v in update:
+            v.updated_at = now
+        ProductVariant.objects.bulk_update(update, UPDATE_FIELDS, batch_size=CHUNK)
+    if deactivate_ids:
+        ProductVariant.objects.filter(pk__in=deactivate_ids).update(is_active=False, updated_at=now)
+
+    refresh_prices(product_ids, now)
+
+    stores, keys_after = _facet_keys(product_ids)
+    for store_id in keys_after.keys() | keys_before.keys():
+        facets.refresh(store_id, facets.merge_keys(keys_before.get(store_id), keys_after.get(store_id)))
+    _bump(stores)
+    search.reindex(product_ids)
+    trigram.index_products(product_ids)
+    return set(product_ids)
+
+
+def save_formset(formset, product=None):
+    """
+    Сохранить inline-формсет вариантов через bulk_write вместо
+    save() на каждую форму.
+    """
+    if product is not None:
+        formset.instance = product
+    formset.save(commit=False)
+
+    product = formset.instance
+    create = []
+    for v in formset.new_objects:
+        v.product = product
+        create.append(v)
+    update = [v for v, _changed in formset.changed_objects]
+    return bulk_write(create=create, update=update, delete=formset.deleted_objects)
@@ -0,0 +1,185 @@
+import atexit
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+# краулеры, превью мессенджеров, мониторинг и скрипты
+BOT_RE = re.compile(
+    r"bot|crawl|spider|slurp|archiver|facebookexternalhit|whatsapp|telegram|vkshare|"
+    r"preview|headless|lighthouse|pingdom|uptime|monitor|curl|wget|python-|httpclient|java/|go-http",
+    re.IGNORECASE,
+)
+
+
+def is_bot(request):
+    ua = request.META.get("HTTP_USER_AGENT", "")
+    if not ua or BOT_RE.search(ua):
+        return True
+    # предзагрузка браузером — это ещё не просмотр
+    purpose = request.META.get("HTTP_SEC_PURPOSE") or request.META.get("HTTP_PURPOSE") or ""
+    return "prefetch" in purpose.lower() or request.META.get("HTTP_X_MOZ") == "prefetch"
+
+
+class ViewCounter:
+    """
+    Write-behind счётчик просмотров товаров.
+
+    Хиты копятся в памяти процесса как (store_id, slug) -> n и раз в
+    flush_interval секунд (или по flush_hits хитов) применяются одной
+    транзакцией: товары резолвятся одним запросом на магазин, затем
+    UPDATE views = views + n — по одному на каждое различное n.
+    При завершении процесса буфер сбрасывается (atexit).
+    """
+
+    def __init__(self, flush_interval=10, flush_hits=500, enabled=True):
+        self.flush_interval = flush_interval
+        self.flush_hits = flush_hits
+        self.enabled = enabled
+
+        self._buffer = Counter()
+        self._hits = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._thread = None
+
+    def _add(self, store_id, slug):
+        # True — пора сбрасывать
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._buffer[(store_id, slug)] += 1
+            self._hits += 1
+            self._ensure_thread()
+            return (
+                self._hits >= self.flush_hits
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+    def record(self, store_id, slug):
+        if self._add(store_id, slug):
+            self.flush()
+
+    async def arecord(self, store_id, slug):
+        # запись в БД — синхронная, из event loop уводим в поток
+        if self._add(store_id, slug):
+            await sync_to_async(self.flush)()
+
+    def pending(self):
+        with self._lock:
+            return sum(self._buffer.values())
+
+    def _take(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, Counter()
+            self._hits = 0
+            self._last_flush = time.monotonic()
+        return buffer
+
+    def flush(self):
+        """
+        Применить накопленное. Возвращает кол-во учтённых просмотров.
+        Если БД недоступна — хиты возвращаются в буфер до следующей попытки.
+        """
+        with self._flush_lock:
+            buffer = self._take()
+            if not buffer:
+                return 0
+            try:
+                return self._write(buffer)
+            except Exception:
+                logger.exception("view counter flush failed, %s hits kept", sum(buffer.values()))
+                with self._lock:
+                    self._buffer.update(buffer)
+                return 0
+
+    @staticmethod
+    def _write(buffer):
+        by_store = defaultdict(dict)
+        for (store_id, slug), n in buffer.items():
+            by_store[store_id][slug] = n
+
+        increments = defaultdict(list)   # n -> [product_id, ...]
+        with transaction.atomic():
+            for store_id, slugs in by_store.items():
+                for slug, pk in (
+                    Product.objects
+                    .filter(store_id=store_id, slug__in=list(slugs))
+                    .values_list("slug", "id")
+                ):
+                    increments[slugs[slug]].append(pk)
+            for n, ids in increments.items():
+                Product.objects.filter(pk__in=ids).update(views=F("views") + n)
+        return sum(n * len(ids) for n, ids in increments.items())
+
+    # ---- фоновый сброс, чтобы хиты не висели в буфере при тишине ----
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="view-counter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self.pending():
+                self.flush()
+                # соединение этого потока не держим между сбросами
+                connections.close_all()
+
+
+view_counter = ViewCounter(
+    flush_interval=getattr(settings, "VIEW_COUNTER_FLUSH_INTERVAL", 10),
+    flush_hits=getattr(settings, "VIEW_COUNTER_FLUSH_HITS", 500),
+    enabled=getattr(settings, "VIEW_COUNTER_ENABLED", True),
+)
+
+# graceful shutdown воркера (SIGTERM у gunicorn/uwsgi) — дописать остаток
+atexit.register(view_counter.flush)
+
+
+def count_product_view(view):
+    """
+    Учитывать просмотр товара — снаружи кеша страниц и conditional GET,
+    чтобы считались и HIT из кеша, и 304.
+    """
+
+    def counts(request, response):
+        return (
+            request.method == "GET"
+            and response.status_code in (200, 304)
+            and getattr(request, "store", None) is not None
+            and not is_bot(request)
+        )
+
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def wrapper(request, slug, *args, **kwargs):
+            response = await view(request, slug, *args, **kwargs)
+            if counts(request, response):
+                await view_counter.arecord(request.store.id, slug)
+            return response
+
+    else:
+
+        @wraps(view)
+        def wrapper(request, slug, *args, **kwargs):
+            response = view(request, slug, *args, **kwargs)
+            if counts(request, response):
+                view_counter.record(request.store.id, slug)
+            return response
+
+    return wrapper
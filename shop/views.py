@@ -1,20 +1,57 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, aget_object_or_404
 from django.db.models import Exists, OuterRef
 from .models import *
 from django.db.models import Prefetch
-from django.core.paginator import Paginator
 import json
+import uuid
 from .forms import *
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST
+from . import carts
+from . import orders
+from . import facets
+from . import favorites
+from . import bitmap_index
+from . import keyset
+from . import search
+from . import pricing
+from .aio import load_user
+from .page_cache import cache_anonymous_page
+from .view_counter import count_product_view
+from .conditional import (
+    conditional_page, listing_etag, listing_last_modified, listing_prepare,
+    product_etag, product_last_modified, product_prepare, favorite_count_etag,
+)
+
+# до стольких найденных товаров фильтруем по id из битмап-индекса
+BITMAP_IN_LIMIT = 500
+
+# сортировки витрины: [(поле, desc), ...]
+SORT_KEYS = {
+    "": [("created_at", True), ("id", True)],
+    "old": [("created_at", False), ("id", False)],
+    "reviews": [("rating_count", True), ("id", True)],
+    "price_asc": [("effective_min_price", False), ("id", False)],
+    "price_desc": [("effective_min_price", True), ("id", True)],
+}
 
 def index(request):
     return render(request, "shop/index.html", {"store": request.store})
 
-def shop(request):
+@conditional_page(listing_etag, listing_last_modified, prepare=listing_prepare)
+@cache_anonymous_page
+async def shop(request):
+    # HIT кеша страниц и 304 отдаются в event loop; сама выборка (битмап-индекс,
+    # FTS, keyset) синхронная — страница собирается одним заходом в поток
+    return await sync_to_async(shop_page)(request)
+
+
+def shop_page(request):
     store = request.store
 
     # выбранные фильтры
@@ -23,39 +60,54 @@ def shop(request):
     gender_ids = request.GET.getlist("gender")
     color_ids  = request.GET.getlist("color")
     sizes      = request.GET.getlist("size")
+    q          = (request.GET.get("q") or "").strip()
 
-    # ---- товары (база) ----
-    products = Product.objects.filter(store=store, is_active=True)
-
-    if cat_ids:
-        products = products.filter(category_id__in=cat_ids)
-    if brand_ids:
-        products = products.filter(brand_id__in=brand_ids)
-    if gender_ids:
-        products = products.filter(gender_id__in=gender_ids)
+    # ---- битмап-индекс магазина: кол-во найденных и счетчики фильтров ----
+    filters = bitmap_index.normalize(
+        category=cat_ids, brand=brand_ids, gender=gender_ids, color=color_ids, size=sizes,
+    )
+    index = bitmap_index.get_index(store.id)
 
-    # ---- СТРОГО: color+size в одном варианте ----
-    vq = ProductVariant.objects.filter(product=OuterRef("pk"), is_active=True)
-    if color_ids:
-        vq = vq.filter(color_id__in=color_ids)
-    if sizes:
-        vq = vq.filter(size__in=sizes)
+    # ---- поиск (FTS5): ранжированные id, дальше пересекаем с фильтрами ----
+    ranked = search.search(store.id, q) if q else None
+    within = index.bits_for(ranked) if q else None
 
-    products = products.annotate(has_variant=Exists(vq)).filter(has_variant=True).distinct()
+    matched = index.match(filters, within)
+    total = bitmap_index.popcount(matched)
+    facet_counts = index.facet_counts(filters, within)
 
-    # ---- сортировка ----
-    sort = request.GET.get("sort", "")
+    # ---- товары (база) ----
+    products = Product.objects.filter(store=store, is_active=True)
 
-    if sort == "old":
-        products = products.order_by("created_at")
-    elif sort == "reviews":
-        products = products.order_by("-rating_count")
-    elif sort == "price_asc":
-        products = products.order_by("min_price")
-    elif sort == "price_desc":
-        products = products.order_by("-min_price")
+    found_ids = None
+    if q:
+        matched_ids = set(index.product_ids(matched))
+        found_ids = [pid for pid in ranked if pid in matched_ids]
+        products = products.filter(pk__in=found_ids)
+    elif any(filters.values()) and total <= BITMAP_IN_LIMIT:
+        # выборка маленькая — берём готовые id из индекса вместо Exists
+        products = products.filter(pk__in=index.product_ids(matched))
     else:
-        products = products.order_by("-created_at")
+        if filters[bitmap_index.CATEGORY]:
+            products = products.filter(category_id__in=filters[bitmap_index.CATEGORY])
+        if filters[bitmap_index.BRAND]:
+            products = products.filter(brand_id__in=filters[bitmap_index.BRAND])
+        if filters[bitmap_index.GENDER]:
+            products = products.filter(gender_id__in=filters[bitmap_index.GENDER])
+
+        # ---- СТРОГО: color+size в одном варианте ----
+        vq = ProductVariant.objects.filter(product=OuterRef("pk"), is_active=True)
+        if filters[bitmap_index.COLOR]:
+            vq = vq.filter(color_id__in=filters[bitmap_index.COLOR])
+        if filters[bitmap_index.SIZE]:
+            vq = vq.filter(size__in=filters[bitmap_index.SIZE])
+
+        products = products.annotate(has_variant=Exists(vq)).filter(has_variant=True)
+
+    # ---- сортировка (id — тай-брейкер для keyset-пагинации) ----
+    sort = request.GET.get("sort", "")
+    if sort not in SORT_KEYS:
+        sort = ""
 
     # ---- оптимизация ----
     products = products.select_related(
@@ -70,62 +122,58 @@ def shop(request):
         ),
         Prefetch(
             "images",
-            queryset=ProductImage.objects.order_by("-is_main", "sort"),
+            queryset=ProductImage.objects.order_by("-is_main", "sort").prefetch_related("renditions"),
             to_attr="product_images"
         )
     )
 
-    # ---- пагинация ----
-    paginator = Paginator(products, 12)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # ---- пагинация: keyset по курсору, без OFFSET и COUNT(*) ----
+    if q and not sort:
+        # поиск без явной сортировки — по релевантности
+        def fetch(ids):
+            objs = {p.id: p for p in products.filter(pk__in=ids)}
+            return [objs[i] for i in ids if i in objs]
 
-    # ---- списки фильтров + счетчики ----
-    categories = (
-        Category.objects.filter(store=store, is_active=True)
-        .annotate(cnt=Count("products", filter=Q(products__is_active=True, products__variants__is_active=True), distinct=True))
-    )
+        page_obj = keyset.paginate_ids(
+            found_ids, 12, fetch, cursor=request.GET.get("cursor"), scope="relevance",
+        )
+    else:
+        page_obj = keyset.paginate(
+            products, SORT_KEYS[sort], 12,
+            cursor=request.GET.get("cursor"), scope=sort, total=total,
+        )
 
-    brands = (
-        Brand.objects.filter(store=store, is_active=True)
-        .annotate(cnt=Count("products", filter=Q(products__store=store, products__is_active=True, products__variants__is_active=True), distinct=True))
-    )
+    # цены карточек с учётом скидок — один запрос на страницу
+    pricing.apply_products(page_obj.object_list)
 
-    genders = (
-        Gender.objects.annotate(cnt=Count("products", filter=Q(products__store=store, products__is_active=True, products__variants__is_active=True), distinct=True))
-        .order_by("id")
-    )
+    # "сердечки" карточек — из кешированного множества избранного
+    favorite_ids = frozenset()
+    if request.user.is_authenticated:
+        favorite_ids = favorites.ids(request.user.pk, store.id)
 
-    colors = (
-        ProductColor.objects
-        .filter(variants__product__store=store, variants__is_active=True)
-        .annotate(cnt=Count("variants__product", distinct=True))
-        .order_by("name", "hex")
-        .distinct()
-    )
+    # ---- списки фильтров + счетчики (денормализованы в FacetCount) ----
+    sidebar = facets.sidebar(store)
 
-    sizes_qs = (
-        ProductVariant.objects
-        .filter(product__store=store, is_active=True)
-        .exclude(size__isnull=True)
-        .exclude(size__exact="")
-        .values_list("size", flat=True)
-        .distinct()
-        .order_by("size")
-    )
+    # счетчики с учётом остальных выбранных фильтров (drill-down)
+    for facet in (facets.CATEGORY, facets.BRAND, facets.GENDER, facets.COLOR):
+        for item in sidebar[facet]:
+            item["cnt"] = facet_counts[facet].get(item["id"], 0)
 
     return render(request, "shop/shop.html", {
         "store": store,
         "products": page_obj.object_list,
         "page_obj": page_obj,
+        "total": total,
 
-        "categories": categories,
-        "brands": brands,
-        "genders": genders,
-        "colors": colors,
-        "sizes": sizes_qs,
+        "categories": sidebar[facets.CATEGORY],
+        "brands": sidebar[facets.BRAND],
+        "genders": sidebar[facets.GENDER],
+        "colors": sidebar[facets.COLOR],
+        "sizes": [{"name": size, "cnt": facet_counts[facets.SIZE].get(size, 0)} for size in sidebar[facets.SIZE]],
 
         "sort": sort,
+        "q": q,
+        "favorites": favorite_ids,
 
         "selected": {
             "category": set(map(str, cat_ids)),
@@ -136,24 +184,27 @@ def shop(request):
         }
     })
 
-def product(request, slug):
-    favorites = []
+@count_product_view
+@conditional_page(product_etag, product_last_modified, prepare=product_prepare)
+@cache_anonymous_page
+async def product(request, slug):
+    favorite_ids = frozenset()
 
-    if request.user.is_authenticated:
-        favorites = Favorite.objects.filter(user=request.user).values_list("product_id", flat=True)
+    user = await load_user(request)
+    if user.is_authenticated:
+        favorite_ids = await favorites.aids(user.pk, request.store.id)
 
-    product = get_object_or_404(
+    product = await aget_object_or_404(
         Product.objects
         .select_related("category", "brand", "gender")
-        .prefetch_related("images", "variants__color"),
+        .prefetch_related("images__renditions", "variants__color"),
         slug=slug,
         store=request.store,
         is_active=True
     )
 
-    variants = list(
-        product.variants.filter(is_active=True).select_related("color")
-    )
+    # варианты уже в prefetch; цены — по скидке товара/категории без запроса
+    variants = pricing.apply_loaded(product, [v for v in product.variants.all() if v.is_active])
 
     current_variant = sorted(variants, key=lambda v: v.price)[0] if variants else None
 
@@ -171,9 +222,14 @@ def product(request, slug):
         for v in variants
     ]
 
+    # гистограмма оценок — из счётчиков товара (shop.ratings), без агрегации
+    stars = {f"star_{star}_percent": percent for star, _cnt, percent in product.rating_histogram}
+
     return render(request, "shop/product.html", {
+        **stars,
+        "rating_percent": round(float(product.rating_avg) * 20),
         "product": product,
-        "favorites": favorites,
+        "favorites": favorite_ids,
         "images": product.images.all(),
         "variants": variants,
         "current_variant": current_variant,
@@ -183,29 +239,122 @@ def product(request, slug):
 
 @login_required
 def cart(request):
-    cart = Cart.objects.filter(user=request.user).first()
-
-    if cart:
-        # Используем select_related для оптимизации запросов к БД
-        items = cart.items.select_related(
-            'variant__product',
-            'variant__color'
-        ).prefetch_related('variant__product__images')
-    else:
-        items = []
-    return render(request, "shop/cart.html", {"store": request.store, 'cart_items': items})
+    cart = carts.find_cart(request.user.pk, request.store.id)
+    cart_id = cart[0] if cart else None
+    # цены строк и итоги — одним агрегатом (из кеша корзины)
+    summary = carts.summary(cart, request.store.id)
+
+    items = []
+    if cart_id:
+        items = list(
+            CartItem.objects.filter(cart_id=cart_id)
+            .select_related('variant__product', 'variant__color')
+            .prefetch_related('variant__product__images__renditions')
+            .order_by('id')
+        )
+        for item in items:
+            item.line = summary.lines.get(item.variant_id)
+    return render(request, "shop/cart.html", {
+        "store": request.store,
+        'cart_items': items,
+        "summary": summary,
+        # ключ оформления: двойной клик/повторная отправка формы не создаст второй заказ
+        "checkout_key": uuid.uuid4().hex,
+    })
+
+async def cart_summary(request):
+    """
+    Итоги корзины текущего магазина (JSON) — для бейджа в шапке и пересчёта на странице.
+    """
+    user = await load_user(request)
+    summary = carts.EMPTY
+    if user.is_authenticated and request.store is not None:
+        summary = await sync_to_async(carts.summary_for)(user.pk, request.store.id)
+    return JsonResponse({
+        "count": summary.count,
+        "items": summary.items,
+        "subtotal": str(summary.subtotal),
+        "discount": str(summary.discount),
+        "lines": [
+            {
+                "variant_id": line.variant_id,
+                "quantity": line.quantity,
+                "price": str(line.price),
+                "old_price": str(line.old_price) if line.old_price else "",
+                "percent": line.percent,
+                "total": str(line.total),
+            }
+            for line in summary.lines.values()
+        ],
+    })
+
+def _checkout_contacts(user, data):
+    """
+    Поля доставки из запроса; пустые — из аккаунта и профиля.
+    """
+    contacts = {name: (data.get(name) or "").strip() for name in ("full_name", "phone", "address")}
+    contacts["full_name"] = contacts["full_name"] or user.get_full_name() or user.username
+    contacts["phone"] = contacts["phone"] or user.phone
+    if not (contacts["phone"] and contacts["address"]):
+        profile = UserProfile.objects.filter(user=user).values_list("phone", "address").first()
+        if profile:
+            contacts["phone"] = contacts["phone"] or profile[0]
+            contacts["address"] = contacts["address"] or profile[1]
+    return CheckoutForm(contacts)
+
+@login_required
+def checkout(request):
+    """
+    Оформить заказ из корзины текущего магазина (форма или JSON).
+    Idempotency-Key (заголовок или поле idempotency_key): повтор запроса
+    вернёт уже созданный заказ, а не второй.
+    """
+    if request.method != "POST":
+        return redirect("cart")
+    is_json = request.content_type == "application/json"
+
+    def fail(error, status=400, **extra):
+        if is_json:
+            return JsonResponse({"error": error, **extra}, status=status)
+        messages.error(request, "Не удалось оформить заказ: " + error)
+        return redirect("cart")
+
+    try:
+        data = json.loads(request.body or b"{}") if is_json else request.POST
+        key = orders.clean_key(request.headers.get("Idempotency-Key") or data.get("idempotency_key"))
+        form = _checkout_contacts(request.user, data)
+    except (ValueError, TypeError, AttributeError):
+        return fail("bad request")
+    if not form.is_valid():
+        return fail("contacts", errors=form.errors)
+
+    try:
+        order, created = orders.place_order(request.user.pk, request.store.id, key=key, **form.cleaned_data)
+    except orders.EmptyCart:
+        return fail("empty cart")
+    except orders.Unavailable as e:
+        return fail("unavailable", status=409, variant_ids=e.variant_ids)
+
+    if is_json:
+        return JsonResponse(
+            {"status": "created" if created else "replayed", "order_id": order.pk, "total": str(order.total_price)},
+            status=201 if created else 200,
+        )
+    if created:
+        messages.success(request, f"Заказ №{order.pk} оформлен")
+    return redirect("order")
 
 @login_required
 def whislist(request):
-    favorites = Favorite.objects.filter(
+    favorite_list = Favorite.objects.filter(
         user=request.user,
         store=request.store
     ).select_related('product').prefetch_related(
         'product__variants__color',
-        'product__images'
+        'product__images__renditions'
     )
-    favorites_count = favorites.count()
-    return render(request, "shop/whislist.html", {"store": request.store, 'favorites': favorites, "favorites_count": favorites_count})
+    favorites_count = favorites.count(request.user.pk, request.store.id)
+    return render(request, "shop/whislist.html", {"store": request.store, 'favorites': favorite_list, "favorites_count": favorites_count})
 
 def contact(request):
     return render(request, "shop/contact.html", {"store": request.store})
@@ -329,33 +478,36 @@ def edit_profile(request):
     return render(request, "login/profile.html", {"form": form, "profile": profile})
 
 @login_required
-def toggle_favorite(request):
+@require_POST
+async def toggle_favorite(request):
     store = request.store
-
-    if request.method == "POST":
-        product_id = request.POST.get("product_id")
-        product = Product.objects.get(id=product_id)
-
-        favorite, created = Favorite.objects.get_or_create(
-            user=request.user,
-            product=product,
-            store=store
+    user = await load_user(request)
+
+    try:
+        product_id = int(request.POST.get("product_id"))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "product_id"}, status=400)
+
+    # добавить или убрать — решает БД, а не кеш (он мог отстать): сначала DELETE,
+    # ничего не удалилось — INSERT; post_delete -> favorites.removed правит множество
+    deleted, _ = await Favorite.objects.filter(user=user, store=store, product_id=product_id).adelete()
+    if not deleted:
+        product = await aget_object_or_404(Product.objects.only("id"), pk=product_id, store=store)
+        # товар уже проверен на магазин — без full_clean() из Favorite.save();
+        # bulk_create сигналов не шлёт, кеш правим сами
+        await Favorite.objects.abulk_create(
+            [Favorite(user=user, store=store, product=product)], ignore_conflicts=True,
         )
+        await favorites.aadded(user.pk, store.id, product.pk)
 
-        if not created:
-            favorite.delete()
-            count = Favorite.objects.filter(user=request.user, store=store).count()
-            return JsonResponse({"status": "removed", "count": count})
+    # количество — из множества избранного, без COUNT(*)
+    count = len(await favorites.aids(user.pk, store.id))
+    return JsonResponse({"status": "removed" if deleted else "added", "count": count})
 
-        count = Favorite.objects.filter(user=request.user, store=store).count()
-        return JsonResponse({"status": "added", "count": count})
-
-def favorite_count(request):
+@conditional_page(favorite_count_etag)
+async def favorite_count(request):
     if request.user.is_authenticated:
-        count = Favorite.objects.filter(
-            user=request.user,
-            store=request.store
-        ).count()
+        count = len(await favorites.aids(request.user.pk, request.store.id))
     else:
         count = 0
 
@@ -363,25 +515,44 @@ def favorite_count(request):
 
 
 @login_required
-def add_to_cart(request):
-    if request.method == "POST":
-        variant_id = request.POST.get("variant_id")
+@require_POST
+async def add_to_cart(request):
+    user = await load_user(request)
+    try:
+        variant_id = int(request.POST.get("variant_id"))
         # Получаем количество из запроса, по умолчанию 1
         quantity = int(request.POST.get("quantity", 1))
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "variant_id/quantity"}, status=400)
+    if quantity < 1:
+        return JsonResponse({"error": "quantity"}, status=400)
 
-        variant = get_object_or_404(ProductVariant, id=variant_id)
-        cart, _ = Cart.objects.get_or_create(user=request.user, store=request.store)
+    # корзина + строка (quantity = quantity + ?) + кол-во строк — одна транзакция
+    total_count = await sync_to_async(carts.add)(user.pk, request.store.id, variant_id, quantity)
+    if total_count is None:
+        raise Http404("Вариант не найден")
+    return JsonResponse({"status": "success", "total_items": total_count})
 
-        item, created = CartItem.objects.get_or_create(cart=cart, variant=variant)
 
-        if not created:
-            # Прибавляем именно то количество, которое выбрал юзер
-            item.quantity += quantity
-        else:
-            item.quantity = quantity
-
-        item.save()
-
-        total_count = cart.items.count()
-        return JsonResponse({"status": "success", "total_items": total_count})
+@login_required
+@require_POST
+async def cart_batch(request):
+    """
+    Пачка изменений корзины одним запросом (JSON):
+    {"add": [{"variant_id": 1, "quantity": 2}], "set": [...], "remove": [3, 4], "move_wishlist": true}
+    """
+    user = await load_user(request)
+    try:
+        data = json.loads(request.body or b"{}")
+        add = [(row["variant_id"], row.get("quantity", 1)) for row in data.get("add", ())]
+        set_quantities = [(row["variant_id"], row["quantity"]) for row in data.get("set", ())]
+        remove_ids = [int(v) for v in data.get("remove", ())]
+        total_count, rejected = await sync_to_async(carts.apply)(
+            user.pk, request.store.id,
+            add=add, set_quantities=set_quantities, remove_ids=remove_ids,
+            move_wishlist=bool(data.get("move_wishlist")),
+        )
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({"error": "bad request"}, status=400)
 
+    return JsonResponse({"status": "success", "total_items": total_count, "rejected": sorted(rejected)})